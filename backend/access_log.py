@@ -0,0 +1,140 @@
+"""
+Escritura asíncrona de ``logs_acceso`` (RF-17).
+
+Las solicitudes encolan sus registros sin tocar la base de datos; un hilo en
+segundo plano los inserta en lotes cuando se junta ``tamano_lote`` o pasa
+``intervalo`` segundos. Al detenerse vacía la cola antes de salir.
+"""
+
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from models import AccessLog
+
+logger = logging.getLogger(__name__)
+
+
+class AccessLogWriter:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        tamano_lote: int = 500,
+        intervalo: float = 1.0,
+        max_cola: int = 100_000,
+    ):
+        self._session_factory = session_factory
+        self._tamano_lote = tamano_lote
+        self._intervalo = intervalo
+        self._cola: "queue.Queue[Dict]" = queue.Queue(maxsize=max_cola)
+        # Lotes que fallaron (BD no disponible) y se reintentan en el siguiente ciclo.
+        self._reintentos: List[Dict] = []
+        self._max_cola = max_cola
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.descartados = 0
+
+    @property
+    def pendientes(self) -> int:
+        return self._cola.qsize() + len(self._reintentos)
+
+    def registrar(
+        self,
+        *,
+        usuario_id: Optional[int],
+        endpoint: str,
+        metodo: str,
+        codigo_respuesta: int,
+        ip: Optional[str] = None,
+        cuerpo_agua_id: Optional[int] = None,
+    ):
+        registro = {
+            "usuario_id": usuario_id,
+            "endpoint": endpoint[:255],
+            "metodo": metodo,
+            "codigo_respuesta": codigo_respuesta,
+            "ip": ip,
+            "cuerpo_agua_id": cuerpo_agua_id,
+            "timestamp": datetime.utcnow(),
+        }
+        try:
+            self._cola.put_nowait(registro)
+        except queue.Full:
+            self.descartados += 1
+            logger.warning("Cola de logs de acceso llena; registro descartado (%s)", endpoint)
+
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, name="access-log-writer", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout: float = 10.0):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=timeout)
+            self._hilo = None
+        # Último intento con lo que haya quedado en la cola.
+        self._procesar(sin_limite=True)
+        if self._reintentos:
+            logger.error("No se pudieron guardar %s logs de acceso al detener", len(self._reintentos))
+
+    def vaciar(self, timeout: float = 5.0) -> bool:
+        """Espera a que el hilo escriba todo lo encolado hasta ahora."""
+        limite = time.monotonic() + timeout
+        while self._cola.unfinished_tasks or self._reintentos:
+            if time.monotonic() > limite:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _procesar(self, sin_limite: bool = False):
+        lote = self._reintentos
+        self._reintentos = []
+        tomados = 0
+        while sin_limite or tomados < self._tamano_lote:
+            try:
+                lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+            tomados += 1
+        try:
+            self._escribir(lote)
+        finally:
+            for _ in range(tomados):
+                self._cola.task_done()
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            limite = time.monotonic() + self._intervalo
+            while self._cola.qsize() < self._tamano_lote and not self._detener.is_set():
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._detener.wait(min(restante, 0.05))
+            self._procesar()
+
+    def _escribir(self, lote: List[Dict]):
+        if not lote:
+            return
+        db = self._session_factory()
+        try:
+            db.execute(insert(AccessLog), lote)
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            logger.exception("Error al guardar %s logs de acceso; se reintentará", len(lote))
+            self._reintentos = lote[-self._max_cola :]
+            self.descartados += len(lote) - len(self._reintentos)
+            if not self._detener.is_set():
+                self._detener.wait(self._intervalo)
+        finally:
+            db.close()
@@ -0,0 +1,102 @@
+"""
+Caché de principales verificados.
+
+Asocia cada token ya validado con el id, email y rol de su usuario para que
+las solicitudes autenticadas no repitan la verificación HMAC ni las consultas
+a ``users``/``roles``. Las entradas caducan con el token (o a los ``ttl``
+segundos), se desalojan por LRU y se invalidan cuando cambian usuarios o roles.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+from database import CambiosConfirmados, register_change_listener
+from models import Role, User
+
+
+class Principal(NamedTuple):
+    id: int
+    email: str
+    role: Optional[str]
+
+
+class PrincipalCache:
+    def __init__(self, max_entradas: int = 10_000, ttl: float = 300.0):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._tokens_por_usuario: Dict[int, Set[str]] = {}
+        # Evita guardar un principal leído antes de una invalidación concurrente.
+        self._generacion = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    @property
+    def generacion(self) -> int:
+        return self._generacion
+
+    def obtener(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entrada = self._entradas.get(token)
+            if entrada is None or entrada[1] <= time.time():
+                if entrada is not None:
+                    self._quitar(token)
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(token)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, token: str, principal: Principal, exp: Optional[float], generacion: int):
+        expira = time.time() + self.ttl
+        if exp is not None:
+            expira = min(expira, float(exp))
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            if token in self._entradas:
+                self._quitar(token)
+            self._entradas[token] = (principal, expira)
+            self._tokens_por_usuario.setdefault(principal.id, set()).add(token)
+            while len(self._entradas) > self.max_entradas:
+                self._quitar(next(iter(self._entradas)))
+
+    def _quitar(self, token: str):
+        principal, _ = self._entradas.pop(token)
+        tokens = self._tokens_por_usuario.get(principal.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_por_usuario[principal.id]
+
+    def invalidar_usuarios(self, usuario_ids):
+        with self._lock:
+            self._generacion += 1
+            for usuario_id in usuario_ids:
+                for token in list(self._tokens_por_usuario.get(usuario_id, ())):
+                    self._quitar(token)
+
+    def limpiar(self):
+        with self._lock:
+            self._generacion += 1
+            self._entradas.clear()
+            self._tokens_por_usuario.clear()
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entradas": len(self._entradas), "aciertos": self.aciertos, "fallos": self.fallos}
+
+    def _al_confirmar(self, cambios: CambiosConfirmados):
+        if cambios.actualizados.get(Role.__tablename__) or cambios.eliminados.get(Role.__tablename__):
+            self.limpiar()
+            return
+        usuarios = cambios.actualizados.get(User.__tablename__, set()) | cambios.eliminados.get(User.__tablename__, set())
+        if usuarios:
+            self.invalidar_usuarios(usuarios)
+
+
+principal_cache = PrincipalCache()
+register_change_listener(principal_cache._al_confirmar)
@@ -0,0 +1,232 @@
+"""
+Difusión en vivo de lecturas y alertas (``GET /stream``, Server-Sent Events).
+
+Las ingestas dejan sus eventos en la sesión con :func:`encolar` y se publican
+solo cuando la transacción se confirma; si se revierte, se descartan. Cada
+evento se serializa una vez y se copia a los suscriptores cuyo filtro
+coincide. Cada suscriptor tiene un búfer acotado: si se llena, se le desconecta
+en lugar de frenar la ingesta o crecer sin límite, y puede reconectarse con
+``Last-Event-ID`` para recuperar lo perdido del historial reciente.
+
+La difusión es local al proceso.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+TIPOS_EVENTO = ("lectura", "alerta")
+LATIDO_SEGUNDOS = 15.0
+
+
+class StreamBusy(Exception):
+    pass
+
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+class Evento:
+    __slots__ = ("secuencia", "tipo", "cuerpo_agua_id", "parametro_id", "nivel", "_sse", "_datos")
+
+    def __init__(self, secuencia: int, tipo: str, datos: Dict):
+        self.secuencia = secuencia
+        self.tipo = tipo
+        self.cuerpo_agua_id = datos.get("cuerpo_agua_id")
+        self.parametro_id = datos.get("parametro_id")
+        self.nivel = datos.get("nivel")
+        self._datos = datos
+        self._sse: Optional[bytes] = None
+
+    @property
+    def sse(self) -> bytes:
+        # Se arma la primera vez que un suscriptor lo envía y se reutiliza para el resto.
+        if self._sse is None:
+            datos = json.dumps(self._datos, ensure_ascii=False, separators=(",", ":"), default=_serializar)
+            self._sse = f"id: {self.secuencia}\nevent: {self.tipo}\ndata: {datos}\n\n".encode("utf-8")
+            self._datos = None
+        return self._sse
+
+
+class Suscripcion:
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        tamano_bufer: int,
+        tipos: Sequence[str] = TIPOS_EVENTO,
+        cuerpos: Iterable[int] = (),
+        parametros: Iterable[int] = (),
+        niveles: Iterable[str] = (),
+    ):
+        self._loop = loop
+        self.tamano_bufer = tamano_bufer
+        self.tipos = frozenset(tipos)
+        self.cuerpos = frozenset(cuerpos)
+        self.parametros = frozenset(parametros)
+        self.niveles = frozenset(niveles)
+        self._bufer: Deque[Evento] = deque()
+        self._aviso = asyncio.Event()
+        self._avisado = False
+        self.descartada = False
+        self.cancelada = False
+
+    def coincide(self, evento: Evento) -> bool:
+        if evento.tipo not in self.tipos:
+            return False
+        if self.cuerpos and evento.cuerpo_agua_id not in self.cuerpos:
+            return False
+        if self.parametros and evento.parametro_id not in self.parametros:
+            return False
+        # El filtro de nivel solo aplica a las alertas.
+        if self.niveles and evento.tipo == "alerta" and evento.nivel not in self.niveles:
+            return False
+        return True
+
+    def _entregar(self, eventos: List[Evento]):
+        """Llamado con el lock del difusor tomado, desde cualquier hilo."""
+        if self.descartada or self.cancelada:
+            return
+        if len(self._bufer) + len(eventos) > self.tamano_bufer:
+            self.descartada = True
+            self._bufer.clear()
+        else:
+            self._bufer.extend(eventos)
+        if not self._avisado:
+            self._avisado = True
+            try:
+                self._loop.call_soon_threadsafe(self._aviso.set)
+            except RuntimeError:
+                # El bucle del cliente ya terminó.
+                self.descartada = True
+
+    async def esperar(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._aviso.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class Broadcaster:
+    def __init__(self, tamano_bufer: int = 10_000, historial: int = 10_000, max_suscriptores: int = 500):
+        self.tamano_bufer = tamano_bufer
+        self.max_suscriptores = max_suscriptores
+        # _lock protege suscripciones y búferes y lo toma el event loop en tomar(): solo se
+        # retiene para copiar eventos ya filtrados. _publicando ordena a los publicadores.
+        self._lock = threading.Lock()
+        self._publicando = threading.Lock()
+        self._secuencia = itertools.count(1)
+        self._historial: Deque[Evento] = deque(maxlen=historial)
+        self._suscripciones: List[Suscripcion] = []
+        self.publicados = 0
+        self.descartadas = 0
+
+    def suscribir(self, ultimo_id: Optional[int] = None, **filtros) -> Suscripcion:
+        suscripcion = Suscripcion(asyncio.get_running_loop(), self.tamano_bufer, **filtros)
+        with self._lock:
+            if len(self._suscripciones) >= self.max_suscriptores:
+                raise StreamBusy()
+            if ultimo_id is not None:
+                perdidos = [evento for evento in self._historial if evento.secuencia > ultimo_id and suscripcion.coincide(evento)]
+                if perdidos:
+                    suscripcion._entregar(perdidos[-self.tamano_bufer :])
+            self._suscripciones.append(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion):
+        with self._lock:
+            suscripcion.cancelada = True
+            if suscripcion in self._suscripciones:
+                self._suscripciones.remove(suscripcion)
+
+    def tomar(self, suscripcion: Suscripcion) -> List[Evento]:
+        with self._lock:
+            eventos = list(suscripcion._bufer)
+            suscripcion._bufer.clear()
+            suscripcion._aviso.clear()
+            suscripcion._avisado = False
+            return eventos
+
+    def publicar(self, tipo: str, filas: Iterable[Dict]):
+        with self._publicando:
+            with self._lock:
+                eventos = [Evento(next(self._secuencia), tipo, fila) for fila in filas]
+                if not eventos:
+                    return
+                self._historial.extend(eventos)
+                self.publicados += len(eventos)
+                suscripciones = list(self._suscripciones)
+            # El filtrado corre sin el lock; quien filtra por cuerpo solo mira los eventos de esos cuerpos.
+            por_cuerpo: Dict[Optional[int], List[Evento]] = {}
+            for evento in eventos:
+                por_cuerpo.setdefault(evento.cuerpo_agua_id, []).append(evento)
+            entregas = []
+            for suscripcion in suscripciones:
+                if suscripcion.cuerpos:
+                    candidatos = [evento for cuerpo in suscripcion.cuerpos for evento in por_cuerpo.get(cuerpo, ())]
+                    if len(suscripcion.cuerpos) > 1:
+                        candidatos.sort(key=lambda evento: evento.secuencia)
+                else:
+                    candidatos = eventos
+                seleccion = [evento for evento in candidatos if suscripcion.coincide(evento)]
+                if seleccion:
+                    entregas.append((suscripcion, seleccion))
+            if not entregas:
+                return
+            with self._lock:
+                for suscripcion, seleccion in entregas:
+                    ya_descartada = suscripcion.descartada
+                    suscripcion._entregar(seleccion)
+                    if suscripcion.descartada and not ya_descartada:
+                        self.descartadas += 1
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "suscriptores": len(self._suscripciones),
+                "publicados": self.publicados,
+                "descartadas_por_lentitud": self.descartadas,
+            }
+
+
+def encolar(db: Session, tipo: str, filas: Iterable[Dict]):
+    """Deja eventos en la sesión para publicarlos cuando se confirme la transacción."""
+    filas = list(filas)
+    if filas:
+        db.info.setdefault("eventos_stream", []).append((tipo, filas))
+
+
+@event.listens_for(Session, "after_commit")
+def _publicar_confirmados(session):
+    for tipo, filas in session.info.pop("eventos_stream", ()):
+        try:
+            broadcaster.publicar(tipo, filas)
+        except Exception:
+            # La transacción ya está confirmada; un fallo aquí no debe llegar al llamador.
+            logger.exception("Stream: no se pudieron publicar %d eventos de %s", len(filas), tipo)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_no_confirmados(session):
+    session.info.pop("eventos_stream", None)
+
+
+broadcaster = Broadcaster(
+    tamano_bufer=int(os.getenv("STREAM_BUFER", 10_000)),
+    historial=int(os.getenv("STREAM_HISTORIAL", 10_000)),
+    max_suscriptores=int(os.getenv("STREAM_MAX_CLIENTES", 500)),
+)
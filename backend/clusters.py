@@ -0,0 +1,451 @@
+"""
+Agrupamiento de puntos del mapa por nivel de zoom.
+
+Proyecta cuerpos de agua y sensores a Web Mercator y los acumula en una grilla
+jerárquica: en el zoom ``z`` cada celda mide ``TAMANO_CELDA_PX`` píxeles y es
+la unión de cuatro celdas del zoom ``z + 1``. Cada celda guarda conteo, suma de
+coordenadas (centroide), conteos por nivel de alerta y por tipo, así que
+agregar o quitar un punto cuesta O(``MAX_ZOOM_GRILLA``). Una celda con un solo
+punto guarda el punto, sin agregado. Una consulta solo recorre las celdas del
+bbox, y su tamaño queda acotado por el de la pantalla.
+
+Por encima de ``MAX_ZOOM_GRILLA`` la grilla tendría casi una celda por punto en
+cada zoom; esas consultas piden al R*Tree los puntos del bbox (pocos, a ese
+zoom) y los agrupan al vuelo.
+
+Los cambios confirmados en ``cuerpos_agua`` y ``sensores`` se anotan y se
+aplican en la siguiente consulta releyendo solo esas filas. Los sensores
+heredan el tipo y el nivel de alerta de su cuerpo de agua.
+"""
+
+import math
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import CambiosConfirmados, register_change_listener
+from ingest import MAX_PARAMETROS_IN
+from models import Alert, CuerpoDeAguaDB, Sensor
+from spatial import BBox, consulta_ids_en_bbox
+from thresholds import NIVELES
+
+MAX_ZOOM = 18
+MAX_ZOOM_GRILLA = 13
+TAMANO_CELDA_PX = 64
+MAX_CLUSTERS = 2000
+MAX_RESPUESTAS_CACHE = 256
+_LATITUD_MERCATOR = 85.05112878
+_RANGO = {nivel: posicion for posicion, nivel in enumerate(NIVELES)}
+
+Celda = Tuple[int, int]
+_MODELOS = {"cuerpo": CuerpoDeAguaDB, "sensor": Sensor}
+
+
+class Punto(NamedTuple):
+    clave: int
+    capa: str
+    id: int
+    latitud: float
+    longitud: float
+    x: float
+    y: float
+    tipo: str
+    nivel: Optional[str]
+
+
+def _proyectar(latitud: float, longitud: float) -> Tuple[float, float]:
+    latitud = max(-_LATITUD_MERCATOR, min(_LATITUD_MERCATOR, latitud))
+    x = (longitud + 180.0) / 360.0
+    seno = math.sin(math.radians(latitud))
+    y = 0.5 - math.log((1 + seno) / (1 - seno)) / (4 * math.pi)
+    return x, y
+
+
+def _celdas_por_lado(zoom: int) -> int:
+    return (256 // TAMANO_CELDA_PX) << zoom
+
+
+def _indice(valor: float, lado: int) -> int:
+    return min(max(int(valor * lado), 0), lado - 1)
+
+
+def _clave(capa: str, punto_id: int) -> int:
+    return punto_id * 2 + (1 if capa == "sensor" else 0)
+
+
+def _contar(conteos: Dict[str, int], clave: str, signo: int):
+    total = conteos.get(clave, 0) + signo
+    if total:
+        conteos[clave] = total
+    else:
+        del conteos[clave]
+
+
+class _Agregado:
+    __slots__ = ("conteo", "suma_lat", "suma_lon", "niveles", "tipos", "cuerpos", "xor_claves")
+
+    def __init__(self):
+        self.conteo = 0
+        self.suma_lat = 0.0
+        self.suma_lon = 0.0
+        self.niveles: Dict[str, int] = {}
+        self.tipos: Dict[str, int] = {}
+        self.cuerpos = 0
+        # Con un solo punto en la celda, el XOR de las claves es la clave de ese punto.
+        self.xor_claves = 0
+
+    def aplicar(self, punto: Punto, signo: int):
+        self.conteo += signo
+        self.suma_lat += signo * punto.latitud
+        self.suma_lon += signo * punto.longitud
+        if punto.nivel is not None:
+            _contar(self.niveles, punto.nivel, signo)
+        _contar(self.tipos, punto.tipo, signo)
+        if punto.capa == "cuerpo":
+            self.cuerpos += signo
+        self.xor_claves ^= punto.clave
+
+    @classmethod
+    def de(cls, *valores: Union[Punto, "_Agregado"]) -> "_Agregado":
+        agregado = cls()
+        for valor in valores:
+            if isinstance(valor, Punto):
+                agregado.aplicar(valor, 1)
+            else:
+                agregado.sumar(valor)
+        return agregado
+
+    def sumar(self, otro: "_Agregado"):
+        self.conteo += otro.conteo
+        self.suma_lat += otro.suma_lat
+        self.suma_lon += otro.suma_lon
+        for nivel, conteo in otro.niveles.items():
+            _contar(self.niveles, nivel, conteo)
+        for tipo, conteo in otro.tipos.items():
+            _contar(self.tipos, tipo, conteo)
+        self.cuerpos += otro.cuerpos
+        self.xor_claves ^= otro.xor_claves
+
+    def a_dict(self) -> Dict:
+        nivel = max(self.niveles, key=lambda n: _RANGO.get(n, -1)) if self.niveles else None
+        cluster = {
+            "lat": round(self.suma_lat / self.conteo, 6),
+            "lon": round(self.suma_lon / self.conteo, 6),
+            "conteo": self.conteo,
+            "cuerpos": self.cuerpos,
+            "sensores": self.conteo - self.cuerpos,
+            "nivel_alerta": nivel,
+            "tipo": max(self.tipos, key=self.tipos.get) if self.tipos else None,
+        }
+        if self.conteo == 1:
+            cluster["capa"] = "sensor" if self.xor_claves & 1 else "cuerpo"
+            cluster["id"] = self.xor_claves >> 1
+        return cluster
+
+
+def _acumular(grilla: Dict[Celda, Union[Punto, "_Agregado"]], celda: Celda, valor: Union[Punto, "_Agregado"]):
+    """Suma ``valor`` a la celda sin modificarlo: los agregados de una grilla son propios."""
+    actual = grilla.get(celda)
+    if actual is None:
+        grilla[celda] = valor if isinstance(valor, Punto) else _Agregado.de(valor)
+    elif isinstance(actual, Punto):
+        grilla[celda] = _Agregado.de(actual, valor)
+    elif isinstance(valor, Punto):
+        actual.aplicar(valor, 1)
+    else:
+        actual.sumar(valor)
+
+
+def _cluster(valor: Union[Punto, _Agregado]) -> Dict:
+    return (_Agregado.de(valor) if isinstance(valor, Punto) else valor).a_dict()
+
+
+class IndiceClusters:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cargado = False
+        self._puntos: Dict[int, Punto] = {}
+        # capa -> zoom -> celda -> punto único o agregado
+        self._grillas: Dict[str, List[Dict[Celda, Union[Punto, _Agregado]]]] = {}
+        self._cuerpos: Dict[int, Tuple[str, Optional[str]]] = {}
+        self._sensores_por_cuerpo: Dict[int, Set[int]] = {}
+        self._sensores: Dict[int, Tuple[int, Optional[float], Optional[float]]] = {}
+        self._con_nivel: Set[int] = set()
+        self._niveles: Dict[int, str] = {}
+        # _al_confirmar corre en el hilo que confirma (también el event loop con sesiones async),
+        # así que solo encola los cambios sin tomar el lock; sincronizar los aplica.
+        self._cambios: "deque[Tuple[Set[int], Set[int], bool]]" = deque()
+        self._activo = False
+        self._version = 0
+        self._respuestas: Dict[int, "OrderedDict[Tuple, Dict]"] = {}
+
+    def _reiniciar(self):
+        self._puntos.clear()
+        self._grillas = {capa: [{} for _ in range(MAX_ZOOM_GRILLA + 1)] for capa in ("cuerpo", "sensor")}
+        self._cuerpos.clear()
+        self._sensores_por_cuerpo.clear()
+        self._sensores.clear()
+        self._con_nivel.clear()
+
+    def _aplicar(self, punto: Punto, signo: int):
+        grillas = self._grillas.get(punto.capa)
+        if grillas is None:
+            # Carga inicial: _construir_grillas las arma al final.
+            return
+        lado = _celdas_por_lado(MAX_ZOOM_GRILLA)
+        x, y = _indice(punto.x, lado), _indice(punto.y, lado)
+        for zoom in range(MAX_ZOOM_GRILLA, -1, -1):
+            # La celda padre en el zoom anterior es la mitad de cada índice.
+            celda = (x, y)
+            x, y = x >> 1, y >> 1
+            grilla = grillas[zoom]
+            actual = grilla.get(celda)
+            if signo > 0:
+                _acumular(grilla, celda, punto)
+            elif isinstance(actual, Punto):
+                del grilla[celda]
+            else:
+                actual.aplicar(punto, -1)
+                if actual.conteo == 1:
+                    # El punto que queda sigue en _puntos: quien quita lo sacó antes de llamar.
+                    grilla[celda] = self._puntos[actual.xor_claves]
+
+    def _construir_grillas(self):
+        """Arma las grillas de una vez, cada zoom a partir de las celdas del siguiente."""
+        lado = _celdas_por_lado(MAX_ZOOM_GRILLA)
+        grillas = {capa: [{} for _ in range(MAX_ZOOM_GRILLA + 1)] for capa in ("cuerpo", "sensor")}
+        for punto in self._puntos.values():
+            _acumular(grillas[punto.capa][MAX_ZOOM_GRILLA], (_indice(punto.x, lado), _indice(punto.y, lado)), punto)
+        for por_zoom in grillas.values():
+            for zoom in range(MAX_ZOOM_GRILLA - 1, -1, -1):
+                grilla = por_zoom[zoom]
+                for (x, y), valor in por_zoom[zoom + 1].items():
+                    _acumular(grilla, (x >> 1, y >> 1), valor)
+        self._grillas = grillas
+
+    def _quitar(self, capa: str, punto_id: int):
+        punto = self._puntos.pop(_clave(capa, punto_id), None)
+        if punto is not None:
+            self._aplicar(punto, -1)
+            self._version += 1
+
+    def _agregar(self, capa: str, punto_id: int, latitud, longitud, tipo: str, nivel: Optional[str]):
+        self._quitar(capa, punto_id)
+        if latitud is None or longitud is None:
+            return
+        x, y = _proyectar(latitud, longitud)
+        punto = Punto(_clave(capa, punto_id), capa, punto_id, latitud, longitud, x, y, tipo, nivel)
+        self._puntos[punto.clave] = punto
+        self._aplicar(punto, 1)
+        self._version += 1
+
+    def _poner_sensor(self, sensor_id: int, cuerpo_id: int, latitud, longitud):
+        anterior = self._sensores.get(sensor_id)
+        if anterior is not None and anterior[0] != cuerpo_id:
+            self._sensores_por_cuerpo.get(anterior[0], set()).discard(sensor_id)
+        self._sensores[sensor_id] = (cuerpo_id, latitud, longitud)
+        self._sensores_por_cuerpo.setdefault(cuerpo_id, set()).add(sensor_id)
+        tipo, nivel = self._cuerpos.get(cuerpo_id, (None, None))
+        self._agregar("sensor", sensor_id, latitud, longitud, tipo, nivel)
+
+    def _poner_cuerpo(self, cuerpo_id: int, latitud, longitud, tipo: str, nivel: Optional[str]):
+        self._cuerpos[cuerpo_id] = (tipo, nivel)
+        if nivel is None:
+            self._con_nivel.discard(cuerpo_id)
+        else:
+            self._con_nivel.add(cuerpo_id)
+        self._agregar("cuerpo", cuerpo_id, latitud, longitud, tipo, nivel)
+        # Los sensores heredan tipo y nivel del cuerpo.
+        for sensor_id in self._sensores_por_cuerpo.get(cuerpo_id, ()):
+            _, latitud_sensor, longitud_sensor = self._sensores[sensor_id]
+            self._agregar("sensor", sensor_id, latitud_sensor, longitud_sensor, tipo, nivel)
+
+    def _cargar(self, db: Session):
+        self._activo = True
+        self._cambios.clear()
+        self._reiniciar()
+        self._grillas = {}
+        niveles = self._niveles = self._niveles_abiertos(db)
+        for cuerpo_id, latitud, longitud, tipo in db.execute(
+            select(CuerpoDeAguaDB.id, CuerpoDeAguaDB.latitud, CuerpoDeAguaDB.longitud, CuerpoDeAguaDB.tipo)
+        ):
+            self._poner_cuerpo(cuerpo_id, latitud, longitud, tipo, niveles.get(cuerpo_id))
+        for sensor_id, cuerpo_id, latitud, longitud in db.execute(
+            select(Sensor.id, Sensor.cuerpo_agua_id, Sensor.latitud, Sensor.longitud)
+        ):
+            self._poner_sensor(sensor_id, cuerpo_id, latitud, longitud)
+        self._construir_grillas()
+        self._cargado = True
+
+    def _niveles_abiertos(self, db: Session) -> Dict[int, str]:
+        # Recorre el índice parcial ix_alertas_abiertas, no la tabla.
+        niveles: Dict[int, str] = {}
+        for cuerpo_id, nivel in db.execute(
+            select(Alert.cuerpo_agua_id, Alert.nivel).where(Alert.resuelta.is_(False)).distinct()
+        ):
+            actual = niveles.get(cuerpo_id)
+            if actual is None or _RANGO.get(nivel, -1) > _RANGO.get(actual, -1):
+                niveles[cuerpo_id] = nivel
+        return niveles
+
+    def _releer(self, db: Session, columnas, ids: Iterable[int]) -> List:
+        pendientes = list(ids)
+        filas = []
+        for inicio in range(0, len(pendientes), MAX_PARAMETROS_IN):
+            bloque = pendientes[inicio : inicio + MAX_PARAMETROS_IN]
+            filas.extend(db.execute(select(*columnas).where(columnas[0].in_(bloque))))
+        return filas
+
+    def sincronizar(self, db: Session):
+        """Aplica los cambios anotados desde la última consulta y los niveles de alerta actuales."""
+        with self._lock:
+            if not self._cargado:
+                self._cargar(db)
+                return
+            cuerpos, sensores, alertas = set(), set(), False
+            while self._cambios:
+                cambio_cuerpos, cambio_sensores, cambio_alertas = self._cambios.popleft()
+                cuerpos |= cambio_cuerpos
+                sensores |= cambio_sensores
+                alertas = alertas or cambio_alertas
+            if not (cuerpos or sensores or alertas):
+                return
+            if alertas:
+                self._niveles = self._niveles_abiertos(db)
+            niveles = self._niveles
+
+            vistos = set()
+            for cuerpo_id, latitud, longitud, tipo in self._releer(
+                db, (CuerpoDeAguaDB.id, CuerpoDeAguaDB.latitud, CuerpoDeAguaDB.longitud, CuerpoDeAguaDB.tipo), cuerpos
+            ):
+                vistos.add(cuerpo_id)
+                self._poner_cuerpo(cuerpo_id, latitud, longitud, tipo, niveles.get(cuerpo_id))
+            for cuerpo_id in cuerpos - vistos:
+                self._cuerpos.pop(cuerpo_id, None)
+                self._con_nivel.discard(cuerpo_id)
+                self._quitar("cuerpo", cuerpo_id)
+
+            vistos = set()
+            for sensor_id, cuerpo_id, latitud, longitud in self._releer(
+                db, (Sensor.id, Sensor.cuerpo_agua_id, Sensor.latitud, Sensor.longitud), sensores
+            ):
+                vistos.add(sensor_id)
+                self._poner_sensor(sensor_id, cuerpo_id, latitud, longitud)
+            for sensor_id in sensores - vistos:
+                anterior = self._sensores.pop(sensor_id, None)
+                if anterior is not None:
+                    self._sensores_por_cuerpo.get(anterior[0], set()).discard(sensor_id)
+                self._quitar("sensor", sensor_id)
+
+            if not alertas:
+                return
+            for cuerpo_id in (set(niveles) | self._con_nivel) & self._cuerpos.keys():
+                tipo, nivel = self._cuerpos[cuerpo_id]
+                if niveles.get(cuerpo_id) != nivel:
+                    punto = self._puntos.get(_clave("cuerpo", cuerpo_id))
+                    latitud = punto.latitud if punto else None
+                    longitud = punto.longitud if punto else None
+                    self._poner_cuerpo(cuerpo_id, latitud, longitud, tipo, niveles.get(cuerpo_id))
+
+    def _rangos(self, bbox: BBox, lado: int) -> Tuple[List[Tuple[int, int]], Tuple[int, int]]:
+        x0, y1 = _proyectar(bbox.min_lat, bbox.min_lon)
+        x1, y0 = _proyectar(bbox.max_lat, bbox.max_lon)
+        filas = (_indice(y0, lado), _indice(y1, lado))
+        if bbox.cruza_antimeridiano:
+            return [(_indice(x0, lado), lado - 1), (0, _indice(x1, lado))], filas
+        return [(_indice(x0, lado), _indice(x1, lado))], filas
+
+    def _ids_en_bbox(self, db: Optional[Session], bbox: BBox, capas: Sequence[str]) -> Optional[Dict[str, List[int]]]:
+        if db is None:
+            return None
+        return {capa: db.execute(consulta_ids_en_bbox(db, _MODELOS[capa], bbox)).scalars().all() for capa in capas}
+
+    def consultar(
+        self,
+        zoom: int,
+        bbox: BBox,
+        capas: Sequence[str],
+        limite: int = MAX_CLUSTERS,
+        db: Optional[Session] = None,
+    ) -> Dict:
+        """Clusters del bbox en ``zoom``.
+
+        Por encima de ``MAX_ZOOM_GRILLA`` los puntos salen del R*Tree de ``db``;
+        sin sesión se recorren todos los puntos en memoria.
+        """
+        zoom = max(0, min(zoom, MAX_ZOOM))
+        lado = _celdas_por_lado(zoom)
+        capas_grilla = tuple(sorted("cuerpo" if capa == "cuerpos" else "sensor" for capa in set(capas)))
+        with self._lock:
+            columnas, filas = self._rangos(bbox, lado)
+            clave = (self._version, tuple(columnas), filas, capas_grilla, limite)
+            cache = self._respuestas.setdefault(zoom, OrderedDict())
+            respuesta = cache.get(clave)
+            if respuesta is not None:
+                cache.move_to_end(clave)
+                return respuesta
+
+        # La consulta al R*Tree no retiene el lock; la respuesta se guarda con la versión de antes.
+        ids = self._ids_en_bbox(db, bbox, capas_grilla) if zoom > MAX_ZOOM_GRILLA else None
+
+        with self._lock:
+
+            def en_rango(celda: Celda) -> bool:
+                return filas[0] <= celda[1] <= filas[1] and any(a <= celda[0] <= b for a, b in columnas)
+
+            combinados: Dict[Celda, Union[Punto, _Agregado]] = {}
+            for capa in capas_grilla:
+                if zoom > MAX_ZOOM_GRILLA:
+                    if ids is None:
+                        puntos: Iterable[Optional[Punto]] = (p for p in self._puntos.values() if p.capa == capa)
+                    else:
+                        puntos = (self._puntos.get(_clave(capa, punto_id)) for punto_id in ids[capa])
+                    candidatas = (
+                        ((_indice(punto.x, lado), _indice(punto.y, lado)), punto) for punto in puntos if punto is not None
+                    )
+                else:
+                    grilla = self._grillas[capa][zoom]
+                    total_celdas = sum(b - a + 1 for a, b in columnas) * (filas[1] - filas[0] + 1)
+                    if total_celdas <= len(grilla):
+                        candidatas = (
+                            ((x, y), grilla.get((x, y)))
+                            for a, b in columnas
+                            for x in range(a, b + 1)
+                            for y in range(filas[0], filas[1] + 1)
+                        )
+                    else:
+                        candidatas = ((celda, valor) for celda, valor in grilla.items())
+                for celda, valor in candidatas:
+                    if valor is not None and en_rango(celda):
+                        _acumular(combinados, celda, valor)
+
+            celdas = sorted(combinados)
+            respuesta = {
+                "zoom": zoom,
+                "clusters": [_cluster(combinados[celda]) for celda in celdas[:limite]],
+                "truncado": len(celdas) > limite,
+            }
+            # Las respuestas de versiones anteriores ya no se pueden volver a pedir.
+            for anterior in [c for c in cache if c[0] != self._version]:
+                del cache[anterior]
+            cache[clave] = respuesta
+            while len(cache) > MAX_RESPUESTAS_CACHE:
+                cache.popitem(last=False)
+            return respuesta
+
+    def _al_confirmar(self, cambios: CambiosConfirmados):
+        if not self._activo:
+            return
+        grupos = (cambios.insertados, cambios.actualizados, cambios.eliminados)
+        cuerpos = set().union(*(grupo.get(CuerpoDeAguaDB.__tablename__, ()) for grupo in grupos))
+        sensores = set().union(*(grupo.get(Sensor.__tablename__, ()) for grupo in grupos))
+        alertas = Alert.__tablename__ in cambios.tablas()
+        if cuerpos or sensores or alertas:
+            self._cambios.append((cuerpos, sensores, alertas))
+
+
+indice_clusters = IndiceClusters()
+register_change_listener(indice_clusters._al_confirmar)
@@ -1,13 +1,19 @@
-from sqlalchemy import create_engine, inspect, text
-from sqlalchemy.orm import declarative_base, sessionmaker
+from collections import defaultdict
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 from dotenv import load_dotenv
+from fastapi import Request
 from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import logging
 import os
 
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent
 raw_db_url = os.getenv("DATABASE_URL")
+SQLITE_PATH: Optional[Path] = None
 
 if raw_db_url:
     if raw_db_url.startswith("sqlite:///"):
@@ -15,30 +21,225 @@ if raw_db_url:
         if not db_path.is_absolute():
             db_path = BASE_DIR / db_path
         DATABASE_URL = f"sqlite:///{db_path}"
+        SQLITE_PATH = db_path
     else:
         DATABASE_URL = raw_db_url
 else:
-    DATABASE_URL = f"sqlite:///{BASE_DIR / 'observatorio_aguas.db'}"
+    SQLITE_PATH = BASE_DIR / "observatorio_aguas.db"
+    DATABASE_URL = f"sqlite:///{SQLITE_PATH}"
+
+# "produccion" activa WAL, los pragmas de abajo y separa lecturas de escrituras.
+DB_PROFILE = os.getenv("DB_PROFILE", "desarrollo").lower()
+SQLITE_PRODUCCION = DB_PROFILE == "produccion" and SQLITE_PATH is not None
+
+SQLITE_PRAGMAS = {
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negativo: tamaño en KiB (64 MiB por conexión).
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64_000)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "temp_store": "MEMORY",
+}
+SQLITE_POOL_LECTURA = int(os.getenv("SQLITE_POOL_LECTURA", 8))
+SQLITE_POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", 30))
+
+METODOS_LECTURA = {"GET", "HEAD"}
+
+
+def _async_database_url(url: str) -> str:
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+def _aplicar_pragmas(sync_engine, pragmas: Dict):
+    @event.listens_for(sync_engine, "connect")
+    def _configurar_conexion(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for nombre, valor in pragmas.items():
+                cursor.execute(f"PRAGMA {nombre}={valor}")
+        finally:
+            cursor.close()
+
+
+_checkouts: Dict[str, int] = defaultdict(int)
+
+
+def _contar_checkouts(nombre: str, sync_engine):
+    @event.listens_for(sync_engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        _checkouts[nombre] += 1
+
+
+if SQLITE_PRODUCCION:
+    # Un escritor por motor serializa las escrituras en el pool en lugar de que
+    # varias conexiones compitan por el bloqueo de SQLite ("database is locked").
+    # El motor síncrono y el async tienen cada uno el suyo; entre ellos decide busy_timeout.
+    _opciones_escritura = {
+        "connect_args": {"check_same_thread": False},
+        "pool_size": 1,
+        "max_overflow": 0,
+        "pool_timeout": SQLITE_POOL_TIMEOUT,
+    }
+    # Con WAL los lectores no bloquean al escritor ni entre sí.
+    _url_lectura = f"sqlite:///file:{SQLITE_PATH}?mode=ro&uri=true"
+    _opciones_lectura = {
+        "connect_args": {"check_same_thread": False},
+        "pool_size": SQLITE_POOL_LECTURA,
+        "max_overflow": 0,
+        "pool_timeout": SQLITE_POOL_TIMEOUT,
+    }
+
+    engine = create_engine(DATABASE_URL, **_opciones_escritura)
+    read_engine = create_engine(_url_lectura, **_opciones_lectura)
+    async_engine = create_async_engine(_async_database_url(DATABASE_URL), **_opciones_escritura)
+    async_read_engine = create_async_engine(_async_database_url(_url_lectura), **_opciones_lectura)
+
+    _pragmas_escritura = {"journal_mode": "WAL", **SQLITE_PRAGMAS}
+    _pragmas_lectura = {**SQLITE_PRAGMAS, "query_only": "ON"}
+    del _pragmas_lectura["synchronous"]
+    _aplicar_pragmas(engine, _pragmas_escritura)
+    _aplicar_pragmas(async_engine.sync_engine, _pragmas_escritura)
+    _aplicar_pragmas(read_engine, _pragmas_lectura)
+    _aplicar_pragmas(async_read_engine.sync_engine, _pragmas_lectura)
+    _motores = {
+        "escritura": engine,
+        "lectura": read_engine,
+        "escritura_async": async_engine.sync_engine,
+        "lectura_async": async_read_engine.sync_engine,
+    }
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+    )
+    # Motor asíncrono para los endpoints async: sus consultas no bloquean el event loop.
+    async_engine = create_async_engine(_async_database_url(DATABASE_URL))
+    read_engine, async_read_engine = engine, async_engine
+    _motores = {"principal": engine, "async": async_engine.sync_engine}
+
+for _nombre, _motor in _motores.items():
+    _contar_checkouts(_nombre, _motor)
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
-)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
+logger = logging.getLogger(__name__)
 
-def get_db():
-    db = SessionLocal()
+
+def pool_stats() -> Dict:
+    pools = {}
+    for nombre, motor in _motores.items():
+        pool = motor.pool
+        estado = {"checkouts": _checkouts[nombre]}
+        for atributo in ("size", "checkedin", "checkedout", "overflow"):
+            metodo = getattr(pool, atributo, None)
+            if callable(metodo):
+                estado[atributo] = metodo()
+        pools[nombre] = estado
+    return {"perfil": "produccion" if SQLITE_PRODUCCION else "desarrollo", "pools": pools}
+
+
+class CambiosConfirmados:
+    """Claves primarias insertadas, actualizadas y eliminadas por tabla en una transacción."""
+
+    def __init__(self):
+        self.insertados: Dict[str, Set] = defaultdict(set)
+        self.actualizados: Dict[str, Set] = defaultdict(set)
+        self.eliminados: Dict[str, Set] = defaultdict(set)
+
+    def tablas(self) -> Set[str]:
+        return set(self.insertados) | set(self.actualizados) | set(self.eliminados)
+
+
+_change_listeners: List[Callable[[CambiosConfirmados], None]] = []
+
+
+def register_change_listener(callback: Callable[[CambiosConfirmados], None]):
+    """Registra una función que recibe los cambios de cada transacción confirmada."""
+    _change_listeners.append(callback)
+
+
+def _pending_changes(session: Session) -> CambiosConfirmados:
+    return session.info.setdefault("cambios", CambiosConfirmados())
+
+
+def record_changes(
+    session: Session,
+    tabla: str,
+    *,
+    insertados: Iterable = (),
+    actualizados: Iterable = (),
+    eliminados: Iterable = (),
+):
+    # Las sentencias Core (inserciones masivas) no pasan por el flush del ORM.
+    cambios = _pending_changes(session)
+    cambios.insertados[tabla].update(insertados)
+    cambios.actualizados[tabla].update(actualizados)
+    cambios.eliminados[tabla].update(eliminados)
+
+
+def _primary_key(obj):
+    clave = inspect(obj).mapper.primary_key_from_instance(obj)
+    return clave[0] if len(clave) == 1 else tuple(clave)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_changes(session, flush_context):
+    cambios = _pending_changes(session)
+    for obj in session.new:
+        cambios.insertados[obj.__table__.name].add(_primary_key(obj))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            cambios.actualizados[obj.__table__.name].add(_primary_key(obj))
+    for obj in session.deleted:
+        cambios.eliminados[obj.__table__.name].add(_primary_key(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_committed_changes(session):
+    cambios = session.info.pop("cambios", None)
+    if cambios is None or not cambios.tablas():
+        return
+    for callback in _change_listeners:
+        try:
+            callback(cambios)
+        except Exception:
+            logger.exception("Error al notificar cambios confirmados")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("cambios", None)
+
+
+def get_db(request: Request):
+    # GET/HEAD usan el pool de solo lectura; el resto, el escritor.
+    factory = ReadSessionLocal if request.method in METODOS_LECTURA else SessionLocal
+    db = factory()
     try:
         yield db
     finally:
         db.close()
 
 
+async def get_async_db(request: Request):
+    factory = AsyncReadSessionLocal if request.method in METODOS_LECTURA else AsyncSessionLocal
+    async with factory() as db:
+        yield db
+
+
 def create_tables():
-    import models  # noqa: F401
+    import models
+    import search
+    import spatial
 
     Base.metadata.create_all(bind=engine)
 
@@ -50,6 +251,12 @@ def create_tables():
             connection.execute(text("ALTER TABLE cuerpos_agua ADD COLUMN creado_por_id INTEGER"))
         if "logs_acceso" in existing_columns and "cuerpo_agua_id" not in existing_columns["logs_acceso"]:
             connection.execute(text("ALTER TABLE logs_acceso ADD COLUMN cuerpo_agua_id INTEGER"))
+        # create_all no agrega índices nuevos a tablas que ya existían.
+        for modelo in (models.SensorReading, models.Alert):
+            for index in modelo.__table__.indexes:
+                index.create(bind=connection, checkfirst=True)
+        spatial.crear_indices_espaciales(connection)
+        search.crear_indices_busqueda(connection)
         connection.commit()
 
 
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Exportación columnar de ``lecturas_sensores`` (Arrow IPC stream o Parquet).
+
+Las lecturas se leen en bloques de ``tamano_lote`` filas paginando por
+(``tomado_en``, ``id``) y cada bloque se escribe como un record batch, así que
+la memoria no depende del tamaño de la tabla. Requiere ``pyarrow``, que es
+opcional; sin él ``GET /lecturas/exportar`` responde 501.
+
+    python export.py --formato parquet --salida lecturas.parquet --cuerpo-agua-id 3 --desde 2024-01-01
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from sqlalchemy import String, select, tuple_, type_coerce
+from sqlalchemy.orm import Session
+
+from models import SensorReading
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - depende del entorno
+    pa = None
+
+FORMATOS_EXPORTACION = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+TAMANO_LOTE = 50_000
+
+
+class ExportacionNoDisponible(Exception):
+    pass
+
+
+def disponible() -> bool:
+    return pa is not None
+
+
+def esquema():
+    if pa is None:
+        raise ExportacionNoDisponible("La exportación columnar requiere pyarrow (pip install pyarrow)")
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("tomado_en", pa.timestamp("us", tz="UTC")),
+            ("cuerpo_agua_id", pa.int32()),
+            ("sensor_id", pa.int32()),
+            ("parametro_id", pa.int32()),
+            ("valor", pa.float64()),
+            ("unidad", pa.string()),
+        ]
+    )
+
+
+def _lote(columnas: List[tuple], tipos) -> "pa.RecordBatch":
+    ids, tomados, cuerpos, sensores, parametros, valores, unidades = columnas
+    tomado_en = pa.array(tomados)
+    if pa.types.is_string(tomado_en.type):
+        # En SQLite la fecha llega como texto; pyarrow la convierte sin pasar por datetime.
+        tomado_en = tomado_en.cast(pa.timestamp("us"))
+    tomado_en = tomado_en.cast(tipos.field("tomado_en").type)
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(ids, pa.int64()),
+            tomado_en,
+            pa.array(cuerpos, pa.int32()),
+            pa.array(sensores, pa.int32()),
+            pa.array(parametros, pa.int32()),
+            pa.array(valores, pa.float64()),
+            pa.array(unidades, pa.string()),
+        ],
+        schema=tipos,
+    )
+
+
+def iterar_lotes(
+    db: Session,
+    cuerpo_agua_id: Optional[int] = None,
+    parametro_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    tamano_lote: int = TAMANO_LOTE,
+) -> Iterator["pa.RecordBatch"]:
+    tipos = esquema()
+    sqlite = db.get_bind().dialect.name == "sqlite"
+    # En SQLite se lee el texto crudo: evita crear un datetime por fila.
+    tomado_en = type_coerce(SensorReading.tomado_en, String) if sqlite else SensorReading.tomado_en
+    consulta = select(
+        SensorReading.id,
+        tomado_en,
+        SensorReading.cuerpo_agua_id,
+        SensorReading.sensor_id,
+        SensorReading.parametro_id,
+        SensorReading.valor,
+        SensorReading.unidad,
+    )
+    if cuerpo_agua_id is not None:
+        consulta = consulta.where(SensorReading.cuerpo_agua_id == cuerpo_agua_id)
+    if parametro_id is not None:
+        consulta = consulta.where(SensorReading.parametro_id == parametro_id)
+    if desde is not None:
+        consulta = consulta.where(SensorReading.tomado_en >= desde)
+    if hasta is not None:
+        consulta = consulta.where(SensorReading.tomado_en < hasta)
+    consulta = consulta.order_by(SensorReading.tomado_en, SensorReading.id).limit(tamano_lote)
+
+    ultimo = None
+    while True:
+        pagina = consulta
+        if ultimo is not None:
+            pagina = pagina.where(tuple_(tomado_en, SensorReading.id) > tuple_(*ultimo))
+        filas = db.execute(pagina).all()
+        if not filas:
+            return
+        yield _lote(list(zip(*filas)), tipos)
+        if len(filas) < tamano_lote:
+            return
+        ultimo = (filas[-1][1], filas[-1][0])
+
+
+class _Salida:
+    """Destino de solo escritura que acumula bytes hasta que se recogen."""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+        self._posicion = 0
+        self.closed = False
+
+    def write(self, datos) -> int:
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def recoger(self) -> bytes:
+        datos, self._partes = b"".join(self._partes), []
+        return datos
+
+
+def _escritor(formato: str, destino, tipos):
+    if formato == "arrow":
+        return pa.ipc.new_stream(destino, tipos)
+    if formato == "parquet":
+        return pa.parquet.ParquetWriter(destino, tipos, compression="zstd")
+    raise ValueError(f"Formato no soportado: {formato}")
+
+
+def exportar(db: Session, formato: str, destino, **filtros) -> int:
+    """Escribe las lecturas en ``destino`` (ruta o archivo binario) y devuelve cuántas filas escribió."""
+    tipos = esquema()
+    filas = 0
+    with _escritor(formato, destino, tipos) as escritor:
+        for lote in iterar_lotes(db, **filtros):
+            escritor.write_batch(lote)
+            filas += lote.num_rows
+    return filas
+
+
+def exportar_por_partes(db: Session, formato: str, **filtros) -> Iterator[bytes]:
+    """Igual que :func:`exportar`, pero entrega los bytes de cada record batch al escribirse."""
+    tipos = esquema()
+    salida = _Salida()
+    with _escritor(formato, salida, tipos) as escritor:
+        for lote in iterar_lotes(db, **filtros):
+            escritor.write_batch(lote)
+            datos = salida.recoger()
+            if datos:
+                yield datos
+    datos = salida.recoger()
+    if datos:
+        yield datos
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Exporta lecturas_sensores en formato columnar.")
+    parser.add_argument("--formato", choices=sorted(FORMATOS_EXPORTACION), default="parquet")
+    parser.add_argument("--salida", required=True, help="Archivo de destino")
+    parser.add_argument("--cuerpo-agua-id", type=int)
+    parser.add_argument("--parametro-id", type=int)
+    parser.add_argument("--desde", type=datetime.fromisoformat, help="AAAA-MM-DD[THH:MM:SS], UTC")
+    parser.add_argument("--hasta", type=datetime.fromisoformat, help="AAAA-MM-DD[THH:MM:SS], UTC, excluyente")
+    parser.add_argument("--tamano-lote", type=int, default=TAMANO_LOTE)
+    args = parser.parse_args(argv)
+
+    if not disponible():
+        print("La exportación columnar requiere pyarrow (pip install pyarrow)", file=sys.stderr)
+        return 1
+
+    from database import ReadSessionLocal
+
+    with ReadSessionLocal() as db:
+        filas = exportar(
+            db,
+            args.formato,
+            args.salida,
+            cuerpo_agua_id=args.cuerpo_agua_id,
+            parametro_id=args.parametro_id,
+            desde=args.desde,
+            hasta=args.hasta,
+            tamano_lote=args.tamano_lote,
+        )
+    print(f"{filas} lecturas exportadas a {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+Ingesta masiva de lecturas de sensores.
+
+Valida las referencias de un lote completo con una consulta por tabla e inserta
+las filas aceptadas con una sola sentencia ``INSERT`` dentro de la transacción
+del llamador. También importa archivos CSV/NDJSON en streaming, confirmando
+por bloques.
+"""
+
+import csv
+import io
+import json
+import logging
+from datetime import datetime, timezone
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from broadcaster import encolar
+from database import record_changes
+from models import CuerpoDeAguaDB, EnvironmentalParameter, Sensor, SensorReading
+from rollups import actualizar_agregados
+from thresholds import motor_umbrales
+
+logger = logging.getLogger(__name__)
+
+# SQLite antiguo limita a 999 los parámetros enlazados por sentencia.
+MAX_PARAMETROS_IN = 900
+
+CAMPOS_LECTURA = (
+    "sensor_id",
+    "parametro_id",
+    "cuerpo_agua_id",
+    "valor",
+    "unidad",
+    "tomado_en",
+    "observaciones",
+)
+
+FORMATOS_IMPORTACION = ("csv", "ndjson")
+MAX_RECHAZOS_DETALLE = 100
+
+
+class ReferenciasValidas:
+    def __init__(self, sensores: Set[int], parametros: Set[int], cuerpos: Set[int]):
+        self.sensores = sensores
+        self.parametros = parametros
+        self.cuerpos = cuerpos
+
+    def motivo_rechazo(self, fila: Dict) -> Optional[str]:
+        if fila["sensor_id"] not in self.sensores:
+            return "Sensor no válido"
+        if fila["parametro_id"] not in self.parametros:
+            return "Parámetro no válido"
+        if fila["cuerpo_agua_id"] not in self.cuerpos:
+            return "Cuerpo de agua no válido"
+        return None
+
+
+def _ids_existentes(db: Session, columna, ids: Iterable[int]) -> Set[int]:
+    pendientes = list(set(ids))
+    encontrados: Set[int] = set()
+    for inicio in range(0, len(pendientes), MAX_PARAMETROS_IN):
+        bloque = pendientes[inicio : inicio + MAX_PARAMETROS_IN]
+        encontrados.update(db.execute(select(columna).where(columna.in_(bloque))).scalars())
+    return encontrados
+
+
+def cargar_referencias(db: Session, filas: List[Dict]) -> ReferenciasValidas:
+    return ReferenciasValidas(
+        sensores=_ids_existentes(db, Sensor.id, (f["sensor_id"] for f in filas)),
+        parametros=_ids_existentes(db, EnvironmentalParameter.id, (f["parametro_id"] for f in filas)),
+        cuerpos=_ids_existentes(db, CuerpoDeAguaDB.id, (f["cuerpo_agua_id"] for f in filas)),
+    )
+
+
+def a_utc_naive(valor: datetime) -> datetime:
+    # Las columnas DateTime guardan UTC sin zona horaria.
+    if valor.tzinfo is None:
+        return valor
+    return valor.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def normalizar_lectura(datos: Dict, ahora: Optional[datetime] = None) -> Dict:
+    # executemany exige las mismas claves en todas las filas.
+    fila = {campo: datos.get(campo) for campo in CAMPOS_LECTURA}
+    if fila["tomado_en"] is None:
+        fila["tomado_en"] = ahora or datetime.utcnow()
+    else:
+        fila["tomado_en"] = a_utc_naive(fila["tomado_en"])
+    return fila
+
+
+def insertar_lecturas(db: Session, filas: List[Dict]) -> List[int]:
+    if not filas:
+        return []
+    resultado = db.execute(
+        insert(SensorReading).returning(SensorReading.id, sort_by_parameter_order=True),
+        filas,
+    )
+    ids = list(resultado.scalars())
+    record_changes(db, SensorReading.__tablename__, insertados=ids)
+    return ids
+
+
+def registrar_lecturas(db: Session, filas: List[Dict], en_vivo: bool = True) -> List[int]:
+    """Inserta lecturas ya validadas, actualiza sus agregados y evalúa umbrales.
+
+    Todo ocurre en la transacción del llamador; las lecturas y alertas se
+    difunden a ``/stream`` cuando esta se confirma. Con ``en_vivo=False``
+    (cargas históricas) solo se insertan las lecturas y sus agregados.
+    """
+    ids = insertar_lecturas(db, filas)
+    actualizar_agregados(db, filas)
+    if not en_vivo:
+        return ids
+    alertas = motor_umbrales.evaluar(db, filas, ids)
+    encolar(db, "lectura", (_evento_lectura(lectura_id, fila) for lectura_id, fila in zip(ids, filas)))
+    encolar(db, "alerta", alertas)
+    return ids
+
+
+def _evento_lectura(lectura_id: int, fila: Dict) -> Dict:
+    return {
+        "id": lectura_id,
+        "sensor_id": fila["sensor_id"],
+        "parametro_id": fila["parametro_id"],
+        "cuerpo_agua_id": fila["cuerpo_agua_id"],
+        "valor": fila["valor"],
+        "unidad": fila["unidad"],
+        "tomado_en": fila["tomado_en"],
+    }
+
+
+def cargar_todas_las_referencias(db: Session) -> ReferenciasValidas:
+    # Para importaciones largas basta con los ids de cada tabla, cargados una sola vez.
+    return ReferenciasValidas(
+        sensores=set(db.execute(select(Sensor.id)).scalars()),
+        parametros=set(db.execute(select(EnvironmentalParameter.id)).scalars()),
+        cuerpos=set(db.execute(select(CuerpoDeAguaDB.id)).scalars()),
+    )
+
+
+def _parsear_fila(datos: Dict) -> Dict:
+    fila = {}
+    try:
+        for campo in ("sensor_id", "parametro_id", "cuerpo_agua_id"):
+            fila[campo] = int(datos[campo])
+        fila["valor"] = float(datos["valor"])
+        unidad = datos["unidad"]
+    except KeyError as exc:
+        raise ValueError(f"Falta el campo {exc.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("Campo numérico inválido")
+    # null en NDJSON o una fila CSV corta llegan como None, no como "None".
+    fila["unidad"] = str(unidad).strip() if unidad is not None else ""
+    if not fila["unidad"]:
+        raise ValueError("Falta el campo unidad")
+
+    tomado_en = datos.get("tomado_en")
+    if tomado_en:
+        try:
+            fila["tomado_en"] = datetime.fromisoformat(str(tomado_en).replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError("Fecha tomado_en inválida")
+    fila["observaciones"] = datos.get("observaciones") or None
+    return fila
+
+
+def _leer_filas(archivo: IO[bytes], formato: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    if formato == "csv":
+        lector = csv.DictReader(texto)
+        for datos in lector:
+            yield lector.line_num, datos, None
+        return
+
+    for numero, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        try:
+            datos = json.loads(linea)
+        except json.JSONDecodeError:
+            yield numero, None, "JSON inválido"
+            continue
+        if not isinstance(datos, dict):
+            yield numero, None, "Se esperaba un objeto JSON"
+            continue
+        yield numero, datos, None
+
+
+def importar_lecturas(db: Session, archivo: IO[bytes], formato: str, tamano_lote: int) -> Iterator[Dict]:
+    """Importa lecturas desde un archivo sin cargarlo completo en memoria.
+
+    Emite un evento ``progreso`` por cada bloque confirmado y un ``resumen`` final
+    con las primeras líneas rechazadas. Los datos históricos no generan alertas
+    ni se difunden a ``/stream``.
+    """
+    referencias = cargar_todas_las_referencias(db)
+    ahora = datetime.utcnow()
+    lineas = aceptadas = rechazadas = 0
+    rechazos: List[Dict] = []
+    bloque: List[Dict] = []
+
+    def rechazar(numero: int, motivo: str):
+        nonlocal rechazadas
+        rechazadas += 1
+        if len(rechazos) < MAX_RECHAZOS_DETALLE:
+            rechazos.append({"linea": numero, "error": motivo})
+
+    def confirmar_bloque():
+        nonlocal aceptadas
+        registrar_lecturas(db, bloque, en_vivo=False)
+        db.commit()
+        aceptadas += len(bloque)
+        bloque.clear()
+
+    try:
+        for numero, datos, error in _leer_filas(archivo, formato):
+            lineas += 1
+            if error is None:
+                try:
+                    fila = normalizar_lectura(_parsear_fila(datos), ahora)
+                    error = referencias.motivo_rechazo(fila)
+                except ValueError as exc:
+                    error = str(exc)
+            if error is not None:
+                rechazar(numero, error)
+                continue
+
+            bloque.append(fila)
+            if len(bloque) >= tamano_lote:
+                confirmar_bloque()
+                yield {"evento": "progreso", "lineas": lineas, "aceptadas": aceptadas, "rechazadas": rechazadas}
+
+        if bloque:
+            confirmar_bloque()
+    except UnicodeDecodeError:
+        db.rollback()
+        yield {"evento": "error", "detalle": "El archivo no está codificado en UTF-8"}
+    except csv.Error as exc:
+        db.rollback()
+        yield {"evento": "error", "detalle": f"CSV mal formado después de la línea {lineas}: {exc}"}
+    except SQLAlchemyError:
+        db.rollback()
+        logger.exception("Error al importar lecturas")
+        yield {"evento": "error", "detalle": "No se pudo guardar un bloque de lecturas"}
+
+    logger.info("Importación de lecturas: %s líneas, %s aceptadas, %s rechazadas", lineas, aceptadas, rechazadas)
+    yield {
+        "evento": "resumen",
+        "lineas": lineas,
+        "aceptadas": aceptadas,
+        "rechazadas": rechazadas,
+        "rechazos": rechazos,
+    }
@@ -0,0 +1,379 @@
+"""
+Diario de ingesta de lecturas.
+
+``POST /lecturas/journal`` agrega las lecturas al final de segmentos en disco y
+responde sin tocar la base de datos. Un hilo drenador las inserta en
+``lecturas_sensores`` en transacciones grandes y guarda la última secuencia
+aplicada en ``journal_checkpoints`` dentro de la misma transacción, de modo que
+tras una caída se reanuda desde el checkpoint sin duplicar lecturas.
+
+Un directorio tiene un solo dueño: el proceso que abre el diario toma un
+``flock`` exclusivo sobre ``diario.lock``. Con varios workers, los demás no
+escriben ni drenan y ``agregar`` lanza :class:`DiarioOcupado`.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from database import BASE_DIR, SessionLocal
+from ingest import cargar_referencias, registrar_lecturas
+from models import JournalCheckpoint
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - depende del entorno
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENTO_PREFIJO = "lecturas-"
+SEGMENTO_SUFIJO = ".log"
+ARCHIVO_RECHAZOS = "rechazadas.ndjson"
+ARCHIVO_LOCK = "diario.lock"
+NOMBRE_CHECKPOINT = "lecturas"
+
+
+class DiarioOcupado(RuntimeError):
+    """Otro proceso es dueño del directorio del diario."""
+
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def _deserializar(lectura: Dict) -> Dict:
+    fila = dict(lectura)
+    fila["tomado_en"] = datetime.fromisoformat(fila["tomado_en"])
+    return fila
+
+
+class IngestJournal:
+    def __init__(
+        self,
+        directorio: Path,
+        session_factory: Callable[[], Session],
+        tamano_lote: int = 5000,
+        tamano_segmento: int = 64 * 1024 * 1024,
+        intervalo: float = 0.5,
+        fsync: bool = True,
+        nombre: str = NOMBRE_CHECKPOINT,
+    ):
+        self.directorio = Path(directorio)
+        self.nombre = nombre
+        self._session_factory = session_factory
+        self.tamano_lote = tamano_lote
+        self.tamano_segmento = tamano_segmento
+        self.intervalo = intervalo
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._archivo = None
+        self._archivo_lock = None
+        self._siguiente: Optional[int] = None
+        self._confirmada = 0
+        # (segmento, desplazamiento) hasta donde leyó el drenador.
+        self._posicion: Optional[Tuple[int, int]] = None
+        # (última secuencia, recibido_en) de cada escritura aún no drenada.
+        self._recepciones: Deque[Tuple[int, float]] = deque()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.ocupado = False
+        self.drenadas = 0
+        self.rechazadas = 0
+        self.ultimo_drenado_en: Optional[datetime] = None
+
+    def _segmentos(self) -> List[Tuple[int, Path]]:
+        segmentos = []
+        for ruta in self.directorio.glob(f"{SEGMENTO_PREFIJO}*{SEGMENTO_SUFIJO}"):
+            try:
+                segmentos.append((int(ruta.name[len(SEGMENTO_PREFIJO) : -len(SEGMENTO_SUFIJO)]), ruta))
+            except ValueError:
+                continue
+        return sorted(segmentos)
+
+    def _tomar_directorio(self):
+        if self._archivo_lock is not None:
+            return
+        archivo = open(self.directorio / ARCHIVO_LOCK, "a+b")
+        if fcntl is not None:
+            try:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                archivo.close()
+                raise DiarioOcupado(f"Otro proceso ya usa el diario de lecturas en {self.directorio}")
+        self._archivo_lock = archivo
+
+    def abrir(self):
+        """Recupera el estado tras un reinicio y deja el diario listo para escribir.
+
+        Lanza :class:`DiarioOcupado` si otro proceso ya tiene el directorio.
+        """
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        # Las secuencias y el checkpoint solo son coherentes con un único escritor.
+        self._tomar_directorio()
+        db = self._session_factory()
+        try:
+            checkpoint = db.execute(
+                select(JournalCheckpoint.secuencia).where(JournalCheckpoint.nombre == self.nombre)
+            ).scalar()
+            if checkpoint is None:
+                checkpoint = 0
+                db.execute(insert(JournalCheckpoint).values(nombre=self.nombre, secuencia=0))
+                db.commit()
+        finally:
+            db.close()
+
+        ultima = checkpoint
+        segmentos = self._segmentos()
+        if segmentos:
+            inicio, ruta = segmentos[-1]
+            ultima = max(ultima, self._recuperar_segmento(ruta, inicio - 1))
+        with self._lock:
+            self._confirmada = checkpoint
+            self._siguiente = ultima + 1
+            self._posicion = None
+            if segmentos:
+                self._archivo = open(segmentos[-1][1], "ab")
+        self.ocupado = False
+
+    def _recuperar_segmento(self, ruta: Path, ultima: int) -> int:
+        # Una caída a mitad de escritura deja una última línea incompleta.
+        validos = 0
+        with open(ruta, "rb") as archivo:
+            for linea in archivo:
+                if not linea.endswith(b"\n"):
+                    break
+                try:
+                    ultima = json.loads(linea)["seq"]
+                except (ValueError, KeyError):
+                    break
+                validos += len(linea)
+        if validos < ruta.stat().st_size:
+            logger.warning("Diario de lecturas: se descartan %s bytes incompletos de %s", ruta.stat().st_size - validos, ruta.name)
+            with open(ruta, "r+b") as archivo:
+                archivo.truncate(validos)
+        return ultima
+
+    def _rotar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+        ruta = self.directorio / f"{SEGMENTO_PREFIJO}{self._siguiente:020d}{SEGMENTO_SUFIJO}"
+        self._archivo = open(ruta, "ab")
+
+    def agregar(self, filas: List[Dict]) -> Tuple[int, int]:
+        """Escribe las lecturas en el diario y devuelve su primera y última secuencia."""
+        recibido = time.time()
+        with self._lock:
+            if self._siguiente is None:
+                if self.ocupado:
+                    raise DiarioOcupado("El diario de lecturas lo atiende otro proceso")
+                raise RuntimeError("El diario de lecturas no está abierto")
+            if self._archivo is None or self._archivo.tell() >= self.tamano_segmento:
+                self._rotar()
+            primera = self._siguiente
+            lineas = []
+            for secuencia, fila in enumerate(filas, start=primera):
+                lineas.append(json.dumps({"seq": secuencia, "lectura": fila}, default=_serializar, separators=(",", ":")))
+            posicion = self._archivo.tell()
+            try:
+                self._archivo.write(("\n".join(lineas) + "\n").encode("utf-8"))
+                self._archivo.flush()
+                if self.fsync:
+                    os.fsync(self._archivo.fileno())
+            except OSError:
+                self._archivo.truncate(posicion)
+                raise
+            self._siguiente = primera + len(filas)
+            ultima = self._siguiente - 1
+            self._recepciones.append((ultima, recibido))
+        self._despertar.set()
+        return primera, ultima
+
+    def _leer_pendientes(self, limite: int) -> Tuple[List[Dict], Optional[Tuple[int, int]]]:
+        entradas: List[Dict] = []
+        segmentos = self._segmentos()
+        if not segmentos:
+            return entradas, self._posicion
+        segmento, desplazamiento = self._posicion or (segmentos[0][0], 0)
+        for inicio, ruta in segmentos:
+            if inicio < segmento:
+                continue
+            if inicio > segmento:
+                segmento, desplazamiento = inicio, 0
+            with open(ruta, "rb") as archivo:
+                archivo.seek(desplazamiento)
+                while len(entradas) < limite:
+                    linea = archivo.readline()
+                    # Sin salto de línea: fin del segmento o escritura en curso.
+                    if not linea.endswith(b"\n"):
+                        break
+                    desplazamiento += len(linea)
+                    entrada = json.loads(linea)
+                    if entrada["seq"] > self._confirmada:
+                        entradas.append(entrada)
+            if len(entradas) >= limite:
+                break
+        return entradas, (segmento, desplazamiento)
+
+    def drenar(self) -> int:
+        """Aplica en una transacción hasta ``tamano_lote`` entradas pendientes."""
+        entradas, posicion = self._leer_pendientes(self.tamano_lote)
+        if not entradas:
+            self._posicion = posicion
+            return 0
+
+        filas = [_deserializar(entrada["lectura"]) for entrada in entradas]
+        ultima = entradas[-1]["seq"]
+        aceptadas, rechazos = [], []
+        db = self._session_factory()
+        try:
+            referencias = cargar_referencias(db, filas)
+            for entrada, fila in zip(entradas, filas):
+                motivo = referencias.motivo_rechazo(fila)
+                if motivo is None:
+                    aceptadas.append(fila)
+                else:
+                    rechazos.append({"seq": entrada["seq"], "error": motivo, "lectura": entrada["lectura"]})
+            if aceptadas:
+                registrar_lecturas(db, aceptadas)
+            # El checkpoint avanza en la misma transacción que las lecturas.
+            resultado = db.execute(
+                update(JournalCheckpoint)
+                .where(JournalCheckpoint.nombre == self.nombre, JournalCheckpoint.secuencia == self._confirmada)
+                .values(secuencia=ultima, actualizado_en=datetime.utcnow())
+            )
+            if resultado.rowcount != 1:
+                raise RuntimeError("El checkpoint del diario cambió fuera de este proceso")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self._confirmada = ultima
+        self._posicion = posicion
+        self.drenadas += len(aceptadas)
+        self.ultimo_drenado_en = datetime.utcnow()
+        with self._lock:
+            while self._recepciones and self._recepciones[0][0] <= ultima:
+                self._recepciones.popleft()
+        if rechazos:
+            self._guardar_rechazos(rechazos)
+        self._purgar_segmentos()
+        return len(entradas)
+
+    def _guardar_rechazos(self, rechazos: List[Dict]):
+        self.rechazadas += len(rechazos)
+        logger.warning("Diario de lecturas: %s lecturas rechazadas (ver %s)", len(rechazos), ARCHIVO_RECHAZOS)
+        with open(self.directorio / ARCHIVO_RECHAZOS, "a", encoding="utf-8") as archivo:
+            for rechazo in rechazos:
+                archivo.write(json.dumps(rechazo, separators=(",", ":")) + "\n")
+
+    def _purgar_segmentos(self):
+        segmentos = self._segmentos()
+        # El último segmento sigue activo; los anteriores se borran al quedar aplicados.
+        for (inicio, ruta), (siguiente, _) in zip(segmentos, segmentos[1:]):
+            if siguiente - 1 <= self._confirmada and self._posicion is not None and inicio < self._posicion[0]:
+                ruta.unlink(missing_ok=True)
+
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        try:
+            self.abrir()
+        except DiarioOcupado:
+            logger.warning("Diario de lecturas: %s lo atiende otro proceso; este no escribe ni drena", self.directorio)
+            self.ocupado = True
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, name="ingest-journal-drainer", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout: float = 30.0):
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=timeout)
+            self._hilo = None
+        if self._archivo_lock is None:
+            return
+        try:
+            while self.drenar():
+                pass
+        except Exception:
+            logger.exception("Diario de lecturas: quedan entradas sin aplicar; se reanudarán al iniciar")
+        self.cerrar()
+
+    def cerrar(self):
+        """Cierra el segmento activo y libera el directorio sin drenar."""
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+            self._siguiente = None
+        if self._archivo_lock is not None:
+            self._archivo_lock.close()
+            self._archivo_lock = None
+
+    def vaciar(self, timeout: float = 10.0) -> bool:
+        """Espera a que el drenador aplique todo lo escrito hasta ahora."""
+        objetivo = (self._siguiente or 1) - 1
+        limite = time.monotonic() + timeout
+        while self._confirmada < objetivo:
+            if time.monotonic() > limite:
+                return False
+            self._despertar.set()
+            time.sleep(0.01)
+        return True
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            self._despertar.clear()
+            try:
+                consumidas = self.drenar()
+            except Exception:
+                logger.exception("Error al drenar el diario de lecturas; se reintentará")
+                self._detener.wait(self.intervalo)
+                continue
+            if consumidas < self.tamano_lote:
+                self._despertar.wait(self.intervalo)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            ultima = (self._siguiente or 1) - 1
+            mas_antigua = self._recepciones[0][1] if self._recepciones else None
+        segmentos = self._segmentos()
+        return {
+            "propietario": self._archivo_lock is not None,
+            "ultima_secuencia": ultima,
+            "secuencia_confirmada": self._confirmada,
+            "retraso": max(ultima - self._confirmada, 0),
+            "retraso_segundos": round(time.time() - mas_antigua, 3) if mas_antigua is not None else 0.0,
+            "segmentos": len(segmentos),
+            "bytes": sum(ruta.stat().st_size for _, ruta in segmentos if ruta.exists()),
+            "drenadas": self.drenadas,
+            "rechazadas": self.rechazadas,
+            "ultimo_drenado_en": self.ultimo_drenado_en.isoformat() if self.ultimo_drenado_en else None,
+        }
+
+
+ingest_journal = IngestJournal(
+    Path(os.getenv("JOURNAL_DIR", BASE_DIR / "journal")),
+    SessionLocal,
+    tamano_lote=int(os.getenv("JOURNAL_LOTE", 5000)),
+    tamano_segmento=int(os.getenv("JOURNAL_TAMANO_SEGMENTO", 64 * 1024 * 1024)),
+    fsync=os.getenv("JOURNAL_FSYNC", "1") != "0",
+)
@@ -1,28 +1,56 @@
 from datetime import datetime, timedelta
 import logging
 import os
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Query, Request, Response, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import base64
 import hashlib
 import hmac
 import json
-import secrets
 from pydantic import BaseModel, Field
-from sqlalchemy import text
+from sqlalchemy import func, select, text, tuple_, update
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
-
-from database import create_tables, get_db, init_sample_data
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from access_log import AccessLogWriter
+from auth_cache import Principal, principal_cache
+from broadcaster import LATIDO_SEGUNDOS, TIPOS_EVENTO, StreamBusy, broadcaster
+from clusters import MAX_CLUSTERS, MAX_ZOOM, indice_clusters
+from database import (
+    ReadSessionLocal,
+    SessionLocal,
+    async_engine,
+    async_read_engine,
+    create_tables,
+    engine,
+    get_async_db,
+    get_db,
+    init_sample_data,
+    pool_stats,
+    read_engine,
+)
+from export import FORMATOS_EXPORTACION, disponible as exportacion_disponible, exportar_por_partes
+from ingest import (
+    FORMATOS_IMPORTACION,
+    a_utc_naive,
+    cargar_referencias,
+    importar_lecturas,
+    normalizar_lectura,
+    registrar_lecturas,
+)
+from journal import DiarioOcupado, ingest_journal
+from metrics import MetricsMiddleware, metricas
 from models import (
-    AccessLog,
     Alert,
     CuerpoDeAguaDB,
     EnvironmentalParameter,
     ProtectedZone,
+    ReadingRollup,
     Report,
     Role,
     Sensor,
@@ -31,6 +59,15 @@ from models import (
     UserFavorite,
     WaterBodyParameter,
 )
+from nearest import indice_cuerpos, indice_sensores
+from password_pool import PasswordPoolBusy, password_pool
+from profiling import PERFIL_ACTIVO as PERFIL_SQL_ACTIVO, SQLProfilerMiddleware
+from reports import ReportEngineBusy, report_engine
+from response_cache import contadores_estadisticas, entrada_cache, response_cache
+from search import TIPOS_BUSQUEDA, buscar, candidatos_por_nombre, mismo_nombre
+from spatial import CAPAS, consultar_geojson, geojson_compacto, parsear_bbox
+from streaming import consulta_lista, json_lista, respuesta_filas, respuesta_lista
+from thresholds import NIVELES, normalizar_nivel
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -38,8 +75,7 @@ logger = logging.getLogger(__name__)
 SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
-PBKDF2_ITERATIONS = 600_000
-SALT_BYTES = 16
+MAX_LECTURAS_LOTE = int(os.getenv("MAX_LECTURAS_LOTE", 10_000))
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 app = FastAPI(title="Observatorio de Aguas API", version="2.0.0")
@@ -54,8 +90,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-SQL-Perfil"],
 )
 
+app.add_middleware(MetricsMiddleware, metricas=metricas, excluidas={"/metrics"})
+if PERFIL_SQL_ACTIVO:
+    app.add_middleware(SQLProfilerMiddleware, excluidas={"/metrics"})
+
+access_log_writer = AccessLogWriter(SessionLocal)
+RUTAS_SIN_AUDITORIA = {"/health", "/metrics", "/docs", "/redoc", "/openapi.json"}
+
+
+@app.middleware("http")
+async def auditar_solicitud(request: Request, call_next):
+    # RF-17: toda solicitud se registra en logs_acceso a través de la cola.
+    codigo = status.HTTP_500_INTERNAL_SERVER_ERROR
+    try:
+        response = await call_next(request)
+        codigo = response.status_code
+        return response
+    finally:
+        if request.method != "OPTIONS" and request.url.path not in RUTAS_SIN_AUDITORIA:
+            access_log_writer.registrar(
+                usuario_id=getattr(request.state, "usuario_id", None),
+                endpoint=request.url.path,
+                metodo=request.method,
+                codigo_respuesta=codigo,
+                ip=request.client.host if request.client else None,
+                cuerpo_agua_id=getattr(request.state, "cuerpo_agua_id", None),
+            )
+
 
 # Utilidades de autenticación
 class TokenResponse(BaseModel):
@@ -130,6 +194,10 @@ class CuerpoDeAguaOut(CuerpoDeAguaBase):
         from_attributes = True
 
 
+class CuerpoDeAguaCercanoOut(CuerpoDeAguaOut):
+    distancia_km: float
+
+
 class SensorCreate(BaseModel):
     nombre: str
     tipo: str
@@ -155,6 +223,10 @@ class SensorOut(BaseModel):
         from_attributes = True
 
 
+class SensorCercanoOut(SensorOut):
+    distancia_km: float
+
+
 class ParameterCreate(BaseModel):
     nombre: str
     unidad: str
@@ -181,9 +253,33 @@ class ReadingCreate(BaseModel):
     cuerpo_agua_id: int
     valor: float
     unidad: str
+    tomado_en: Optional[datetime] = None
     observaciones: Optional[str] = None
 
 
+class ReadingBatchCreate(BaseModel):
+    lecturas: List[ReadingCreate] = Field(min_length=1, max_length=MAX_LECTURAS_LOTE)
+
+
+class ReadingBatchItemOut(BaseModel):
+    indice: int
+    aceptada: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class ReadingBatchOut(BaseModel):
+    aceptadas: int
+    rechazadas: int
+    resultados: List[ReadingBatchItemOut]
+
+
+class JournalAckOut(BaseModel):
+    aceptadas: int
+    secuencia_inicial: int
+    secuencia_final: int
+
+
 class ReadingOut(BaseModel):
     id: int
     sensor_id: int
@@ -198,6 +294,16 @@ class ReadingOut(BaseModel):
         from_attributes = True
 
 
+class ReadingAggregateOut(BaseModel):
+    inicio: datetime
+    cuerpo_agua_id: Optional[int] = None
+    parametro_id: Optional[int] = None
+    conteo: int
+    minimo: float
+    maximo: float
+    promedio: float
+
+
 class AlertCreate(BaseModel):
     cuerpo_agua_id: int
     nivel: str
@@ -262,6 +368,42 @@ class ReportOut(BaseModel):
         from_attributes = True
 
 
+class SearchResultOut(BaseModel):
+    tipo: str
+    id: int
+    titulo: str
+    fragmento: Optional[str]
+    puntuacion: float
+
+
+class ReportJobCreate(BaseModel):
+    cuerpo_agua_id: int
+    desde: Optional[datetime] = None
+    hasta: Optional[datetime] = None
+    parametros: List[int] = Field(default_factory=list, max_length=50)
+    formato: Literal["csv", "json"] = "csv"
+    intervalo: Literal["hora", "dia"] = "dia"
+
+
+class ReportJobOut(BaseModel):
+    id: str
+    estado: str
+    cuerpo_agua_id: int
+    desde: Optional[datetime]
+    hasta: Optional[datetime]
+    parametros: List[int]
+    formato: str
+    intervalo: str
+    procesadas: int
+    alertas: int
+    creado_en: datetime
+    iniciado_en: Optional[datetime]
+    terminado_en: Optional[datetime]
+    error: Optional[str]
+    reporte_id: Optional[int]
+    descarga: Optional[str] = None
+
+
 class FavoriteCreate(BaseModel):
     cuerpo_agua_id: int
 
@@ -294,40 +436,15 @@ class WaterBodyParameterOut(BaseModel):
         from_attributes = True
 
 
-# Helpers
-
-
-def _encode_bytes(raw: bytes) -> str:
-    return base64.b64encode(raw).decode("utf-8")
-
-
-def _decode_bytes(raw: str) -> bytes:
-    return base64.b64decode(raw.encode("utf-8"))
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    try:
-        algorithm, iterations, salt_b64, hash_b64 = hashed_password.split("$")
-    except ValueError:
-        return False
-
-    if algorithm != "pbkdf2_sha256":
-        return False
-
-    salt = _decode_bytes(salt_b64)
-    stored_hash = _decode_bytes(hash_b64)
-    new_hash = hashlib.pbkdf2_hmac(
-        "sha256", plain_password.encode("utf-8"), salt, int(iterations)
-    )
-    return hmac.compare_digest(stored_hash, new_hash)
+class CuerpoDeAguaResumenOut(CuerpoDeAguaOut):
+    sensores: List[SensorOut]
+    alertas_abiertas: List[AlertOut]
+    zonas: List[ProtectedZoneOut]
+    parametros_configurados: List[WaterBodyParameterOut]
+    ultimas_lecturas: List[ReadingOut]
 
 
-def get_password_hash(password: str) -> str:
-    salt = secrets.token_bytes(SALT_BYTES)
-    derived = hashlib.pbkdf2_hmac(
-        "sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS
-    )
-    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_encode_bytes(salt)}${_encode_bytes(derived)}"
+# Helpers
 
 
 def _b64url_encode(raw: bytes) -> str:
@@ -383,47 +500,44 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return _encode_jwt(to_encode)
 
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
-    return db.query(User).filter(User.email == email).first()
+def _encode_cursor(tomado_en: datetime, registro_id: int) -> str:
+    return _b64url_encode(f"{tomado_en.isoformat()}|{registro_id}".encode())
 
 
-def log_access(
-    db: Session,
-    user: Optional[User],
-    endpoint: str,
-    method: str,
-    status_code: int,
-    *,
-    cuerpo_agua_id: Optional[int] = None,
-    ip: Optional[str] = None,
-):
-    registro = AccessLog(
-        usuario_id=user.id if user else None,
-        endpoint=endpoint,
-        metodo=method,
-        codigo_respuesta=status_code,
-        ip=ip,
-        cuerpo_agua_id=cuerpo_agua_id,
-    )
-    db.add(registro)
-    db.commit()
+def _decode_cursor(cursor: str):
+    try:
+        tomado_en, registro_id = _b64url_decode(cursor).decode().split("|")
+        return datetime.fromisoformat(tomado_en), int(registro_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
 
 
-def require_role(user: User, allowed_roles: List[str]):
-    role = user.role.nombre if user.role else None
-    if role not in allowed_roles:
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    return await db.scalar(select(User).where(User.email == email))
+
+
+def require_role(user: Principal, allowed_roles: List[str]):
+    if user.role not in allowed_roles:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="No tienes permisos para realizar esta acción",
         )
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def get_current_user(
+    request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+) -> Principal:
+    principal = principal_cache.obtener(token)
+    if principal is not None:
+        request.state.usuario_id = principal.id
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar el token",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    generacion = principal_cache.generacion
     try:
         payload = decode_access_token(token)
         email: str = payload.get("sub")
@@ -432,16 +546,49 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except TokenValidationError:
         raise credentials_exception
 
-    user = get_user_by_email(db, email=email)
-    if user is None:
+    user = db.query(User).options(joinedload(User.role)).filter(User.email == email).first()
+    principal = Principal(id=user.id, email=user.email, role=user.role.nombre if user.role else None) if user else None
+    # Devuelve la conexión al pool: en producción el escritor es una sola conexión y los
+    # streams que abren su propia sesión (p. ej. /lecturas/importar) quedarían esperándola.
+    db.rollback()
+    if principal is None:
         raise credentials_exception
-    return user
+    principal_cache.guardar(token, principal, payload.get("exp"), generacion)
+    request.state.usuario_id = principal.id
+    return principal
+
+
+async def _hash_en_pool(operacion):
+    # PBKDF2 corre en su propio pool de procesos; si está saturado se rechaza rápido.
+    try:
+        return await operacion
+    except PasswordPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio de autenticación saturado, intenta de nuevo en unos segundos",
+            headers={"Retry-After": "1"},
+        )
 
 
 @app.on_event("startup")
 async def startup_event():
     create_tables()
     init_sample_data()
+    access_log_writer.iniciar()
+    ingest_journal.iniciar()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    report_engine.cerrar()
+    ingest_journal.detener()
+    access_log_writer.detener()
+    password_pool.cerrar()
+    # Cerrar las conexiones permite a SQLite hacer checkpoint del WAL.
+    await async_engine.dispose()
+    await async_read_engine.dispose()
+    engine.dispose()
+    read_engine.dispose()
 
 
 @app.get("/")
@@ -451,17 +598,17 @@ async def root():
 
 # Autenticación
 @app.post("/auth/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-def register_user(payload: UserCreate, db: Session = Depends(get_db)):
-    if get_user_by_email(db, payload.email):
+async def register_user(payload: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if await get_user_by_email(db, payload.email):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El correo ya está registrado")
 
     role = None
     if payload.role:
-        role = db.query(Role).filter(Role.nombre == payload.role).first()
+        role = await db.scalar(select(Role).where(Role.nombre == payload.role))
         if role is None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El rol especificado no existe")
 
-    hashed_password = get_password_hash(payload.password)
+    hashed_password = await _hash_en_pool(password_pool.hashear(payload.password))
     usuario = User(
         email=payload.email,
         full_name=payload.full_name,
@@ -469,8 +616,8 @@ def register_user(payload: UserCreate, db: Session = Depends(get_db)):
         role_id=role.id if role else None,
     )
     db.add(usuario)
-    db.commit()
-    db.refresh(usuario)
+    await db.commit()
+    await db.refresh(usuario)
     return UserOut(
         id=usuario.id,
         email=usuario.email,
@@ -481,26 +628,30 @@ def register_user(payload: UserCreate, db: Session = Depends(get_db)):
 
 
 @app.post("/auth/login", response_model=TokenResponse)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.password_hash):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await get_user_by_email(db, form_data.username)
+    if not user or not await _hash_en_pool(password_pool.verificar(form_data.password, user.password_hash)):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales inválidas")
 
     access_token = create_access_token({"sub": user.email})
-    user.last_login = datetime.utcnow()
-    db.add(user)
-    db.commit()
+    # Sentencia Core: no pasa por el registro de cambios, así que un login no invalida
+    # los principales en caché de ese usuario (last_login no forma parte de ellos).
+    await db.execute(update(User).where(User.id == user.id).values(last_login=datetime.utcnow()))
+    await db.commit()
     return TokenResponse(access_token=access_token)
 
 
 @app.get("/auth/me", response_model=UserOut)
-def get_me(current_user: User = Depends(get_current_user)):
+def get_me(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    usuario = db.get(User, current_user.id)
+    if usuario is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No se pudo validar el token")
     return UserOut(
-        id=current_user.id,
-        email=current_user.email,
-        full_name=current_user.full_name,
-        role=current_user.role.nombre if current_user.role else None,
-        created_at=current_user.created_at,
+        id=usuario.id,
+        email=usuario.email,
+        full_name=usuario.full_name,
+        role=current_user.role,
+        created_at=usuario.created_at,
     )
 
 
@@ -511,19 +662,118 @@ def list_roles(db: Session = Depends(get_db)):
 
 # Cuerpos de agua
 @app.get("/cuerpos-agua", response_model=List[CuerpoDeAguaOut])
-async def obtener_cuerpos_agua(db: Session = Depends(get_db)):
-    cuerpos = db.query(CuerpoDeAguaDB).all()
-    return cuerpos
+async def obtener_cuerpos_agua(request: Request, db: AsyncSession = Depends(get_async_db)):
+    tablas = (CuerpoDeAguaDB.__tablename__,)
+    entrada = response_cache.obtener("cuerpos-agua")
+    if entrada is None:
+        generacion = response_cache.generacion(tablas)
+        cuerpo = await db.run_sync(json_lista, consulta_lista(CuerpoDeAguaOut, CuerpoDeAguaDB))
+        entrada = response_cache.guardar("cuerpos-agua", tablas, cuerpo, generacion)
+    return response_cache.responder(request, entrada)
+
+
+# Debe declararse antes de /cuerpos-agua/{cuerpo_id}.
+@app.get("/cuerpos-agua/cercanos", response_model=List[CuerpoDeAguaCercanoOut])
+async def cuerpos_agua_cercanos(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, ge=1, le=100),
+    radio_km: Optional[float] = Query(None, gt=0),
+    db: AsyncSession = Depends(get_async_db),
+):
+    await db.run_sync(indice_cuerpos.sincronizar)
+    cercanos = indice_cuerpos.cercanos(lat, lon, k, radio_km)
+    if not cercanos:
+        return []
+    cuerpos = {
+        cuerpo.id: cuerpo
+        for cuerpo in await db.scalars(
+            select(CuerpoDeAguaDB).where(CuerpoDeAguaDB.id.in_([cuerpo_id for cuerpo_id, _ in cercanos]))
+        )
+    }
+    return [
+        CuerpoDeAguaCercanoOut(**CuerpoDeAguaOut.model_validate(cuerpos[cuerpo_id]).dict(), distancia_km=round(distancia, 3))
+        for cuerpo_id, distancia in cercanos
+        if cuerpo_id in cuerpos
+    ]
 
 
 @app.get("/cuerpos-agua/{cuerpo_id}", response_model=CuerpoDeAguaOut)
-async def obtener_cuerpo_agua(cuerpo_id: int, db: Session = Depends(get_db)):
-    cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == cuerpo_id).first()
+async def obtener_cuerpo_agua(cuerpo_id: int, db: AsyncSession = Depends(get_async_db)):
+    cuerpo = await db.get(CuerpoDeAguaDB, cuerpo_id)
     if not cuerpo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
     return cuerpo
 
 
+# Sin lecturas_sensores: las últimas lecturas se consultan en cada solicitud, así que
+# la ingesta de cualquier cuerpo de agua no invalida los resúmenes en caché.
+_TABLAS_RESUMEN = (
+    CuerpoDeAguaDB.__tablename__,
+    Sensor.__tablename__,
+    Alert.__tablename__,
+    ProtectedZone.__tablename__,
+    WaterBodyParameter.__tablename__,
+)
+
+
+def _resumen_cuerpo(db: Session, cuerpo_id: int) -> Optional[bytes]:
+    # Cinco consultas sin importar el tamaño: el cuerpo y una por relación.
+    cuerpo = db.execute(
+        select(CuerpoDeAguaDB)
+        .where(CuerpoDeAguaDB.id == cuerpo_id)
+        .options(
+            selectinload(CuerpoDeAguaDB.sensores),
+            selectinload(CuerpoDeAguaDB.alertas.and_(Alert.resuelta.is_(False))),
+            selectinload(CuerpoDeAguaDB.zonas),
+            selectinload(CuerpoDeAguaDB.parametros_configurados),
+        )
+    ).scalar_one_or_none()
+    if cuerpo is None:
+        return None
+    resumen = CuerpoDeAguaResumenOut.model_validate(
+        {
+            **CuerpoDeAguaOut.model_validate(cuerpo).model_dump(),
+            "sensores": sorted(cuerpo.sensores, key=lambda sensor: sensor.id),
+            "alertas_abiertas": sorted(cuerpo.alertas, key=lambda alerta: alerta.id),
+            "zonas": sorted(cuerpo.zonas, key=lambda zona: zona.id),
+            "parametros_configurados": sorted(cuerpo.parametros_configurados, key=lambda config: config.id),
+            "ultimas_lecturas": [],
+        },
+        from_attributes=True,
+    )
+    return resumen.model_dump_json(exclude={"ultimas_lecturas"}).encode()
+
+
+def _ultimas_lecturas(db: Session, cuerpo_id: int) -> bytes:
+    # La última lectura de cada parámetro es una búsqueda sobre ix_lecturas_cuerpo_parametro_tomado_id.
+    ultima_por_parametro = (
+        select(SensorReading.id)
+        .where(SensorReading.cuerpo_agua_id == cuerpo_id, SensorReading.parametro_id == EnvironmentalParameter.id)
+        .order_by(SensorReading.tomado_en.desc(), SensorReading.id.desc())
+        .limit(1)
+        .correlate(EnvironmentalParameter)
+        .scalar_subquery()
+    )
+    consulta = consulta_lista(ReadingOut, SensorReading).where(SensorReading.id.in_(select(ultima_por_parametro)))
+    return json_lista(db, consulta.order_by(SensorReading.parametro_id))
+
+
+@app.get("/cuerpos-agua/{cuerpo_id}/resumen", response_model=CuerpoDeAguaResumenOut)
+async def resumen_cuerpo_agua(cuerpo_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    clave = f"cuerpos-agua/{cuerpo_id}/resumen"
+    entrada = response_cache.obtener(clave)
+    if entrada is None:
+        generacion = response_cache.generacion(_TABLAS_RESUMEN)
+        cuerpo = await db.run_sync(_resumen_cuerpo, cuerpo_id)
+        if cuerpo is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
+        entrada = response_cache.guardar(clave, _TABLAS_RESUMEN, cuerpo, generacion)
+    ultimas = await db.run_sync(_ultimas_lecturas, cuerpo_id)
+    completo = entrada.cuerpo[:-1] + b',"ultimas_lecturas":' + ultimas + b"}"
+    return response_cache.responder(request, entrada_cache(completo))
+
+
 @app.post(
     "/cuerpos-agua",
     response_model=CuerpoDeAguaOut,
@@ -532,17 +782,17 @@ async def obtener_cuerpo_agua(cuerpo_id: int, db: Session = Depends(get_db)):
 async def crear_cuerpo_agua(
     cuerpo: CuerpoDeAguaCreate,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    existente = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.nombre.ilike(cuerpo.nombre)).first()
-    if existente:
+    candidatos = await db.run_sync(candidatos_por_nombre, cuerpo.nombre)
+    if any(mismo_nombre(nombre, cuerpo.nombre) for _, nombre in candidatos):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El cuerpo de agua ya existe")
 
     db_cuerpo = CuerpoDeAguaDB(**cuerpo.dict(), creado_por_id=current_user.id)
     db.add(db_cuerpo)
-    db.commit()
-    db.refresh(db_cuerpo)
+    await db.commit()
+    await db.refresh(db_cuerpo)
 
     reporte_inicial = Report(
         cuerpo_agua_id=db_cuerpo.id,
@@ -551,17 +801,9 @@ async def crear_cuerpo_agua(
         contenido=db_cuerpo.descripcion or "Alta creada desde la interfaz",
     )
     db.add(reporte_inicial)
-    db.commit()
+    await db.commit()
 
-    log_access(
-        db,
-        current_user,
-        endpoint="/cuerpos-agua",
-        method="POST",
-        status_code=status.HTTP_201_CREATED,
-        cuerpo_agua_id=db_cuerpo.id,
-        ip=request.client.host if request.client else None,
-    )
+    request.state.cuerpo_agua_id = db_cuerpo.id
     return db_cuerpo
 
 
@@ -570,30 +812,21 @@ async def actualizar_cuerpo_agua(
     cuerpo_id: int,
     payload: CuerpoDeAguaUpdate,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, ["admin", "analista"])
-    cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == cuerpo_id).first()
+    cuerpo = await db.get(CuerpoDeAguaDB, cuerpo_id)
     if not cuerpo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
 
     for campo, valor in payload.dict(exclude_unset=True).items():
         setattr(cuerpo, campo, valor)
     cuerpo.fecha_actualizacion = datetime.utcnow()
-    db.add(cuerpo)
-    db.commit()
-    db.refresh(cuerpo)
-
-    log_access(
-        db,
-        current_user,
-        endpoint=f"/cuerpos-agua/{cuerpo_id}",
-        method="PUT",
-        status_code=status.HTTP_200_OK,
-        cuerpo_agua_id=cuerpo.id,
-        ip=request.client.host if request.client else None,
-    )
+    await db.commit()
+    await db.refresh(cuerpo)
+
+    request.state.cuerpo_agua_id = cuerpo.id
     return cuerpo
 
 
@@ -601,35 +834,33 @@ async def actualizar_cuerpo_agua(
 async def eliminar_cuerpo_agua(
     cuerpo_id: int,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, ["admin", "analista"])
-    cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == cuerpo_id).first()
+    cuerpo = await db.get(CuerpoDeAguaDB, cuerpo_id)
     if not cuerpo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
 
-    db.delete(cuerpo)
-    db.commit()
-    log_access(
-        db,
-        current_user,
-        endpoint=f"/cuerpos-agua/{cuerpo_id}",
-        method="DELETE",
-        status_code=status.HTTP_204_NO_CONTENT,
-        cuerpo_agua_id=cuerpo_id,
-        ip=request.client.host if request.client else None,
-    )
+    await db.delete(cuerpo)
+    await db.commit()
+    request.state.cuerpo_agua_id = cuerpo_id
 
 
 # Sensores
 @app.get("/sensores", response_model=List[SensorOut])
-def listar_sensores(db: Session = Depends(get_db)):
-    return db.query(Sensor).all()
+def listar_sensores(request: Request, db: Session = Depends(get_db)):
+    tablas = (Sensor.__tablename__,)
+    entrada = response_cache.obtener("sensores")
+    if entrada is None:
+        generacion = response_cache.generacion(tablas)
+        cuerpo = json_lista(db, consulta_lista(SensorOut, Sensor).order_by(Sensor.id))
+        entrada = response_cache.guardar("sensores", tablas, cuerpo, generacion)
+    return response_cache.responder(request, entrada)
 
 
 @app.post("/sensores", response_model=SensorOut, status_code=status.HTTP_201_CREATED)
-def crear_sensor(payload: SensorCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def crear_sensor(payload: SensorCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == payload.cuerpo_agua_id).first()
     if not cuerpo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
@@ -640,6 +871,30 @@ def crear_sensor(payload: SensorCreate, db: Session = Depends(get_db), current_u
     return sensor
 
 
+# Debe declararse antes de /sensores/{sensor_id}.
+@app.get("/sensores/cercanos", response_model=List[SensorCercanoOut])
+def sensores_cercanos(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, ge=1, le=100),
+    radio_km: Optional[float] = Query(None, gt=0),
+    db: Session = Depends(get_db),
+):
+    indice_sensores.sincronizar(db)
+    cercanos = indice_sensores.cercanos(lat, lon, k, radio_km)
+    if not cercanos:
+        return []
+    sensores = {
+        sensor.id: sensor
+        for sensor in db.query(Sensor).filter(Sensor.id.in_([sensor_id for sensor_id, _ in cercanos]))
+    }
+    return [
+        SensorCercanoOut(**SensorOut.model_validate(sensores[sensor_id]).dict(), distancia_km=round(distancia, 3))
+        for sensor_id, distancia in cercanos
+        if sensor_id in sensores
+    ]
+
+
 @app.get("/sensores/{sensor_id}", response_model=SensorOut)
 def obtener_sensor(sensor_id: int, db: Session = Depends(get_db)):
     sensor = db.query(Sensor).filter(Sensor.id == sensor_id).first()
@@ -650,12 +905,18 @@ def obtener_sensor(sensor_id: int, db: Session = Depends(get_db)):
 
 # Parámetros ambientales
 @app.get("/parametros", response_model=List[ParameterOut])
-def listar_parametros(db: Session = Depends(get_db)):
-    return db.query(EnvironmentalParameter).all()
+def listar_parametros(request: Request, db: Session = Depends(get_db)):
+    tablas = (EnvironmentalParameter.__tablename__,)
+    entrada = response_cache.obtener("parametros")
+    if entrada is None:
+        generacion = response_cache.generacion(tablas)
+        cuerpo = json_lista(db, consulta_lista(ParameterOut, EnvironmentalParameter).order_by(EnvironmentalParameter.id))
+        entrada = response_cache.guardar("parametros", tablas, cuerpo, generacion)
+    return response_cache.responder(request, entrada)
 
 
 @app.post("/parametros", response_model=ParameterOut, status_code=status.HTTP_201_CREATED)
-def crear_parametro(payload: ParameterCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def crear_parametro(payload: ParameterCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     existente = db.query(EnvironmentalParameter).filter(EnvironmentalParameter.nombre == payload.nombre).first()
     if existente:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El parámetro ya existe")
@@ -668,50 +929,293 @@ def crear_parametro(payload: ParameterCreate, db: Session = Depends(get_db), cur
 
 # Lecturas de sensores
 @app.get("/lecturas", response_model=List[ReadingOut])
-def listar_lecturas(db: Session = Depends(get_db)):
-    return db.query(SensorReading).all()
+def listar_lecturas(
+    request: Request,
+    cuerpo_agua_id: Optional[int] = None,
+    sensor_id: Optional[int] = None,
+    parametro_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    cursor: Optional[str] = Query(default=None, description="Valor de X-Next-Cursor de la página anterior"),
+    limite: int = Query(default=100, ge=1, le=1000),
+    formato: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(get_db),
+):
+    # Orden descendente por (tomado_en, id): cada página es un rango sobre el índice.
+    query = db.query(*consulta_lista(ReadingOut, SensorReading).selected_columns)
+    if cuerpo_agua_id is not None:
+        query = query.filter(SensorReading.cuerpo_agua_id == cuerpo_agua_id)
+    if sensor_id is not None:
+        query = query.filter(SensorReading.sensor_id == sensor_id)
+    if parametro_id is not None:
+        query = query.filter(SensorReading.parametro_id == parametro_id)
+    if desde is not None:
+        query = query.filter(SensorReading.tomado_en >= a_utc_naive(desde))
+    if hasta is not None:
+        query = query.filter(SensorReading.tomado_en < a_utc_naive(hasta))
+    if cursor:
+        tomado_en, registro_id = _decode_cursor(cursor)
+        query = query.filter(tuple_(SensorReading.tomado_en, SensorReading.id) < tuple_(tomado_en, registro_id))
+
+    lecturas = query.order_by(SensorReading.tomado_en.desc(), SensorReading.id.desc()).limit(limite).all()
+    cabeceras = {}
+    if len(lecturas) == limite:
+        ultima = lecturas[-1]
+        cabeceras["X-Next-Cursor"] = _encode_cursor(ultima.tomado_en, ultima.id)
+    return respuesta_filas(request, ReadingOut.model_fields, lecturas, formato, cabeceras)
 
 
 @app.post("/lecturas", response_model=ReadingOut, status_code=status.HTTP_201_CREATED)
-def crear_lectura(payload: ReadingCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def crear_lectura(payload: ReadingCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     sensor = db.query(Sensor).filter(Sensor.id == payload.sensor_id).first()
     parametro = db.query(EnvironmentalParameter).filter(EnvironmentalParameter.id == payload.parametro_id).first()
     cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == payload.cuerpo_agua_id).first()
     if not (sensor and parametro and cuerpo):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Sensor, parámetro o cuerpo de agua no válido")
-    lectura = SensorReading(**payload.dict())
-    db.add(lectura)
+    fila = normalizar_lectura(payload.dict())
+    (lectura_id,) = registrar_lecturas(db, [fila])
     db.commit()
-    db.refresh(lectura)
-    return lectura
+    return ReadingOut(id=lectura_id, **fila)
+
+
+@app.post("/lecturas/batch", response_model=ReadingBatchOut)
+def crear_lecturas_lote(
+    payload: ReadingBatchCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)
+):
+    ahora = datetime.utcnow()
+    filas = [normalizar_lectura(lectura.dict(), ahora) for lectura in payload.lecturas]
+    referencias = cargar_referencias(db, filas)
+
+    resultados = []
+    aceptadas = []
+    for indice, fila in enumerate(filas):
+        error = referencias.motivo_rechazo(fila)
+        resultados.append(ReadingBatchItemOut(indice=indice, aceptada=error is None, error=error))
+        if error is None:
+            aceptadas.append(indice)
+
+    try:
+        ids = registrar_lecturas(db, [filas[indice] for indice in aceptadas])
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        logger.exception("Error al insertar lote de lecturas")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="No se pudo guardar el lote")
+
+    for indice, lectura_id in zip(aceptadas, ids):
+        resultados[indice].id = lectura_id
+    return ReadingBatchOut(
+        aceptadas=len(aceptadas),
+        rechazadas=len(filas) - len(aceptadas),
+        resultados=resultados,
+    )
+
+
+@app.post("/lecturas/journal", response_model=JournalAckOut, status_code=status.HTTP_202_ACCEPTED)
+def encolar_lecturas(payload: ReadingBatchCreate, current_user: Principal = Depends(get_current_user)):
+    # Las referencias se validan al drenar; las rechazadas quedan en journal/rechazadas.ndjson.
+    ahora = datetime.utcnow()
+    filas = [normalizar_lectura(lectura.dict(), ahora) for lectura in payload.lecturas]
+    try:
+        inicial, final = ingest_journal.agregar(filas)
+    except DiarioOcupado:
+        # Con varios workers solo uno es dueño del diario; el resto no puede acusar recibo.
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El diario de lecturas lo atiende otro worker; usa /lecturas/batch",
+            headers={"Retry-After": "1"},
+        )
+    except OSError:
+        logger.exception("Error al escribir el diario de lecturas")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="No se pudo registrar el lote")
+    return JournalAckOut(aceptadas=len(filas), secuencia_inicial=inicial, secuencia_final=final)
+
+
+@app.post("/lecturas/importar")
+def importar_archivo_lecturas(
+    archivo: UploadFile = File(...),
+    formato: Optional[str] = Query(default=None, description="csv o ndjson; por defecto se deduce del nombre"),
+    tamano_lote: int = Query(default=5000, ge=100, le=50_000),
+    current_user: Principal = Depends(get_current_user),
+):
+    if formato is None:
+        extension = (archivo.filename or "").rsplit(".", 1)[-1].lower()
+        formato = "ndjson" if extension in ("ndjson", "jsonl") else extension
+    if formato not in FORMATOS_IMPORTACION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Formato no soportado. Opciones: {', '.join(FORMATOS_IMPORTACION)}",
+        )
+
+    def eventos():
+        # La sesión vive mientras se transmite la respuesta, no la del request.
+        db = SessionLocal()
+        try:
+            for evento in importar_lecturas(db, archivo.file, formato, tamano_lote):
+                yield json.dumps(evento) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(eventos(), media_type="application/x-ndjson")
+
+
+@app.get("/lecturas/exportar")
+def exportar_lecturas(
+    formato: Literal["arrow", "parquet"] = "parquet",
+    cuerpo_agua_id: Optional[int] = None,
+    parametro_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    current_user: Principal = Depends(get_current_user),
+):
+    if not exportacion_disponible():
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="La exportación columnar requiere pyarrow en el servidor",
+        )
+    filtros = {
+        "cuerpo_agua_id": cuerpo_agua_id,
+        "parametro_id": parametro_id,
+        "desde": a_utc_naive(desde) if desde is not None else None,
+        "hasta": a_utc_naive(hasta) if hasta is not None else None,
+    }
+
+    def partes():
+        # La sesión vive mientras se transmite la respuesta, no la del request.
+        db = ReadSessionLocal()
+        try:
+            yield from exportar_por_partes(db, formato, **filtros)
+        finally:
+            db.close()
+
+    media_type, extension = FORMATOS_EXPORTACION[formato]
+    return StreamingResponse(
+        partes(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="lecturas.{extension}"'},
+    )
+
+
+@app.get("/lecturas/agregados", response_model=List[ReadingAggregateOut])
+def listar_agregados_lecturas(
+    intervalo: Literal["hora", "dia"] = "hora",
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    cuerpo_agua_id: Optional[int] = None,
+    parametro_id: Optional[int] = None,
+    agrupar: List[Literal["cuerpo_agua_id", "parametro_id"]] = Query(default=["cuerpo_agua_id", "parametro_id"]),
+    db: Session = Depends(get_db),
+):
+    # Se lee de lecturas_agregadas: un año por hora son ~8760 filas por serie.
+    claves = [getattr(ReadingRollup, campo) for campo in dict.fromkeys(agrupar)]
+    query = db.query(
+        ReadingRollup.inicio,
+        *claves,
+        func.sum(ReadingRollup.conteo).label("conteo"),
+        func.sum(ReadingRollup.suma).label("suma"),
+        func.min(ReadingRollup.minimo).label("minimo"),
+        func.max(ReadingRollup.maximo).label("maximo"),
+    ).filter(ReadingRollup.intervalo == intervalo)
+    if cuerpo_agua_id is not None:
+        query = query.filter(ReadingRollup.cuerpo_agua_id == cuerpo_agua_id)
+    if parametro_id is not None:
+        query = query.filter(ReadingRollup.parametro_id == parametro_id)
+    if desde is not None:
+        query = query.filter(ReadingRollup.inicio >= a_utc_naive(desde))
+    if hasta is not None:
+        query = query.filter(ReadingRollup.inicio < a_utc_naive(hasta))
+
+    filas = query.group_by(ReadingRollup.inicio, *claves).order_by(ReadingRollup.inicio, *claves).all()
+    return [
+        ReadingAggregateOut(
+            inicio=fila.inicio,
+            cuerpo_agua_id=getattr(fila, "cuerpo_agua_id", None),
+            parametro_id=getattr(fila, "parametro_id", None),
+            conteo=fila.conteo,
+            minimo=fila.minimo,
+            maximo=fila.maximo,
+            promedio=fila.suma / fila.conteo,
+        )
+        for fila in filas
+    ]
 
 
 # Alertas
 @app.get("/alertas", response_model=List[AlertOut])
-def listar_alertas(db: Session = Depends(get_db)):
-    return db.query(Alert).all()
+def listar_alertas(request: Request, formato: Literal["json", "ndjson"] = "json"):
+    return respuesta_lista(request, consulta_lista(AlertOut, Alert).order_by(Alert.id), formato)
 
 
 @app.post("/alertas", response_model=AlertOut, status_code=status.HTTP_201_CREATED)
-def crear_alerta(payload: AlertCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def crear_alerta(payload: AlertCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == payload.cuerpo_agua_id).first()
     if not cuerpo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
-    alerta = Alert(**payload.dict())
+    nivel = normalizar_nivel(payload.nivel)
+    if nivel is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Nivel no válido. Opciones: {', '.join(NIVELES)}",
+        )
+    alerta = Alert(**{**payload.dict(), "nivel": nivel})
     db.add(alerta)
     db.commit()
     db.refresh(alerta)
+    broadcaster.publicar("alerta", [AlertOut.model_validate(alerta).model_dump()])
     return alerta
 
 
+@app.get("/stream")
+async def stream_eventos(
+    tipos: List[Literal["lectura", "alerta"]] = Query(list(TIPOS_EVENTO)),
+    cuerpo_agua_id: List[int] = Query([]),
+    parametro_id: List[int] = Query([]),
+    nivel: List[str] = Query([]),
+    last_event_id: Optional[int] = Header(None),
+):
+    try:
+        suscripcion = broadcaster.suscribir(
+            ultimo_id=last_event_id, tipos=tipos, cuerpos=cuerpo_agua_id, parametros=parametro_id, niveles=nivel
+        )
+    except StreamBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiados clientes conectados al stream",
+            headers={"Retry-After": "5"},
+        )
+
+    async def eventos():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                if not await suscripcion.esperar(LATIDO_SEGUNDOS):
+                    yield b": latido\n\n"
+                    continue
+                pendientes = broadcaster.tomar(suscripcion)
+                if pendientes:
+                    yield b"".join(evento.sse for evento in pendientes)
+                if suscripcion.descartada:
+                    # El cliente reconecta con Last-Event-ID y recupera lo que siga en el historial.
+                    yield b'event: desconectado\ndata: {"motivo":"cliente lento"}\n\n'
+                    return
+        finally:
+            broadcaster.cancelar(suscripcion)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Zonas protegidas
 @app.get("/zonas-protegidas", response_model=List[ProtectedZoneOut])
-def listar_zonas(db: Session = Depends(get_db)):
-    return db.query(ProtectedZone).all()
+def listar_zonas(request: Request, formato: Literal["json", "ndjson"] = "json"):
+    return respuesta_lista(request, consulta_lista(ProtectedZoneOut, ProtectedZone).order_by(ProtectedZone.id), formato)
 
 
 @app.post("/zonas-protegidas", response_model=ProtectedZoneOut, status_code=status.HTTP_201_CREATED)
-def crear_zona(payload: ProtectedZoneCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def crear_zona(payload: ProtectedZoneCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == payload.cuerpo_agua_id).first()
     if not cuerpo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
@@ -724,12 +1228,12 @@ def crear_zona(payload: ProtectedZoneCreate, db: Session = Depends(get_db), curr
 
 # Reportes
 @app.get("/reportes", response_model=List[ReportOut])
-def listar_reportes(db: Session = Depends(get_db)):
-    return db.query(Report).all()
+def listar_reportes(request: Request, formato: Literal["json", "ndjson"] = "json"):
+    return respuesta_lista(request, consulta_lista(ReportOut, Report).order_by(Report.id), formato)
 
 
 @app.post("/reportes", response_model=ReportOut, status_code=status.HTTP_201_CREATED)
-def crear_reporte(payload: ReportCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def crear_reporte(payload: ReportCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == payload.cuerpo_agua_id).first()
     if not cuerpo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
@@ -740,14 +1244,74 @@ def crear_reporte(payload: ReportCreate, db: Session = Depends(get_db), current_
     return reporte
 
 
+def _trabajo_out(trabajo) -> ReportJobOut:
+    descarga = f"/reportes/trabajos/{trabajo.id}/descarga" if trabajo.estado == "completado" else None
+    return ReportJobOut(**trabajo.como_dict(), descarga=descarga)
+
+
+def _obtener_trabajo(trabajo_id: str, current_user: Principal):
+    trabajo = report_engine.obtener(trabajo_id)
+    # Solo quien lo pidió (o un admin) puede verlo; para el resto no existe.
+    if trabajo is None or (trabajo.usuario_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trabajo de reporte no encontrado")
+    return trabajo
+
+
+@app.post("/reportes/trabajos", response_model=ReportJobOut, status_code=status.HTTP_202_ACCEPTED)
+def crear_trabajo_reporte(
+    payload: ReportJobCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)
+):
+    if db.get(CuerpoDeAguaDB, payload.cuerpo_agua_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
+    desde = a_utc_naive(payload.desde) if payload.desde else None
+    hasta = a_utc_naive(payload.hasta) if payload.hasta else None
+    if desde is not None and hasta is not None and desde >= hasta:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="desde debe ser anterior a hasta")
+    try:
+        trabajo = report_engine.enviar(
+            payload.cuerpo_agua_id,
+            desde,
+            hasta,
+            payload.parametros,
+            payload.formato,
+            payload.intervalo,
+            usuario_id=current_user.id,
+        )
+    except ReportEngineBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Hay demasiados reportes en cola, intenta de nuevo más tarde",
+            headers={"Retry-After": "5"},
+        )
+    return _trabajo_out(trabajo)
+
+
+@app.get("/reportes/trabajos/{trabajo_id}", response_model=ReportJobOut)
+def obtener_trabajo_reporte(trabajo_id: str, current_user: Principal = Depends(get_current_user)):
+    return _trabajo_out(_obtener_trabajo(trabajo_id, current_user))
+
+
+@app.get("/reportes/trabajos/{trabajo_id}/descarga")
+def descargar_trabajo_reporte(trabajo_id: str, current_user: Principal = Depends(get_current_user)):
+    trabajo = _obtener_trabajo(trabajo_id, current_user)
+    if trabajo.estado != "completado" or trabajo.ruta is None or not trabajo.ruta.exists():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El reporte no está disponible ({trabajo.estado})")
+    return FileResponse(
+        trabajo.ruta,
+        media_type=trabajo.tipo_contenido,
+        filename=f"reporte-{trabajo.cuerpo_agua_id}-{trabajo.id[:8]}.{trabajo.formato}",
+    )
+
+
 # Favoritos
 @app.get("/favoritos", response_model=List[FavoriteOut])
-def listar_favoritos(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return db.query(UserFavorite).filter(UserFavorite.usuario_id == current_user.id).all()
+def listar_favoritos(request: Request, formato: Literal["json", "ndjson"] = "json", current_user: Principal = Depends(get_current_user)):
+    consulta = consulta_lista(FavoriteOut, UserFavorite).where(UserFavorite.usuario_id == current_user.id)
+    return respuesta_lista(request, consulta.order_by(UserFavorite.id), formato)
 
 
 @app.post("/favoritos", response_model=FavoriteOut, status_code=status.HTTP_201_CREATED)
-def crear_favorito(payload: FavoriteCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def crear_favorito(payload: FavoriteCreate, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == payload.cuerpo_agua_id).first()
     if not cuerpo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cuerpo de agua no encontrado")
@@ -767,12 +1331,12 @@ def crear_favorito(payload: FavoriteCreate, current_user: User = Depends(get_cur
 
 # Configuración de parámetros por cuerpo de agua
 @app.get("/cuerpo-parametros", response_model=List[WaterBodyParameterOut])
-def listar_parametros_cuerpo(db: Session = Depends(get_db)):
-    return db.query(WaterBodyParameter).all()
+def listar_parametros_cuerpo(request: Request, formato: Literal["json", "ndjson"] = "json"):
+    return respuesta_lista(request, consulta_lista(WaterBodyParameterOut, WaterBodyParameter).order_by(WaterBodyParameter.id), formato)
 
 
 @app.post("/cuerpo-parametros", response_model=WaterBodyParameterOut, status_code=status.HTTP_201_CREATED)
-def crear_parametro_cuerpo(payload: WaterBodyParameterCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def crear_parametro_cuerpo(payload: WaterBodyParameterCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     cuerpo = db.query(CuerpoDeAguaDB).filter(CuerpoDeAguaDB.id == payload.cuerpo_agua_id).first()
     parametro = db.query(EnvironmentalParameter).filter(EnvironmentalParameter.id == payload.parametro_id).first()
     if not (cuerpo and parametro):
@@ -784,26 +1348,99 @@ def crear_parametro_cuerpo(payload: WaterBodyParameterCreate, db: Session = Depe
     return config
 
 
+# Mapa
+@app.get("/mapa/geojson")
+def mapa_geojson(
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+    capas: List[Literal["cuerpos", "sensores"]] = Query(list(CAPAS)),
+    tipo: List[str] = Query([]),
+    contaminacion: List[str] = Query([]),
+    nivel_alerta: List[str] = Query([]),
+    limite: int = Query(5000, ge=1, le=20000),
+    db: Session = Depends(get_db),
+):
+    try:
+        area = parsear_bbox(bbox)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    coleccion = consultar_geojson(db, area, capas, tipo, contaminacion, nivel_alerta, limite)
+    return Response(content=geojson_compacto(coleccion), media_type="application/geo+json")
+
+
+@app.get("/mapa/clusters")
+def mapa_clusters(
+    zoom: int = Query(..., ge=0, le=MAX_ZOOM + 4),
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+    capas: List[Literal["cuerpos", "sensores"]] = Query(list(CAPAS)),
+    limite: int = Query(MAX_CLUSTERS, ge=1, le=MAX_CLUSTERS),
+    db: Session = Depends(get_db),
+):
+    try:
+        area = parsear_bbox(bbox)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    indice_clusters.sincronizar(db)
+    return indice_clusters.consultar(zoom, area, capas, limite, db=db)
+
+
+@app.get("/buscar", response_model=List[SearchResultOut])
+def buscar_texto(
+    q: str = Query(..., min_length=1, max_length=200),
+    tipos: List[Literal["cuerpo_agua", "sensor", "zona", "reporte"]] = Query(list(TIPOS_BUSQUEDA)),
+    limite: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    return buscar(db, q, tipos, limite)
+
+
 # Estadísticas y salud
 @app.get("/estadisticas")
-async def obtener_estadisticas(db: Session = Depends(get_db)):
-    total_cuerpos = db.query(CuerpoDeAguaDB).count()
-    total_sensores = db.query(Sensor).count()
-    total_alertas = db.query(Alert).count()
-    total_parametros = db.query(EnvironmentalParameter).count()
-    return {
-        "total_cuerpos_agua": total_cuerpos,
-        "total_sensores": total_sensores,
-        "total_alertas": total_alertas,
-        "total_parametros": total_parametros,
-        "ultima_actualizacion": datetime.utcnow().isoformat(),
-    }
+async def obtener_estadisticas(request: Request, db: AsyncSession = Depends(get_async_db)):
+    tablas = (
+        CuerpoDeAguaDB.__tablename__,
+        Sensor.__tablename__,
+        Alert.__tablename__,
+        EnvironmentalParameter.__tablename__,
+    )
+    entrada = response_cache.obtener("estadisticas")
+    if entrada is None:
+        generacion = response_cache.generacion(tablas)
+        # Los totales se mantienen con los cambios confirmados; solo se cuentan al arrancar.
+        totales = await db.run_sync(contadores_estadisticas.totales)
+        estadisticas = {
+            "total_cuerpos_agua": totales[CuerpoDeAguaDB.__tablename__],
+            "total_sensores": totales[Sensor.__tablename__],
+            "total_alertas": totales[Alert.__tablename__],
+            "total_parametros": totales[EnvironmentalParameter.__tablename__],
+            "ultima_actualizacion": contadores_estadisticas.actualizado_en.isoformat(),
+        }
+        entrada = response_cache.guardar("estadisticas", tablas, json.dumps(estadisticas).encode(), generacion)
+    return response_cache.responder(request, entrada)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def exponer_metricas():
+    return Response(content=metricas.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     try:
-        db.execute(text("SELECT 1"))
-        return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+        await db.execute(text("SELECT 1"))
+        return {
+            "status": "healthy",
+            "timestamp": datetime.utcnow().isoformat(),
+            "logs_acceso": {
+                "pendientes": access_log_writer.pendientes,
+                "descartados": access_log_writer.descartados,
+            },
+            "hash_contrasenas": password_pool.estadisticas(),
+            "cache_principales": principal_cache.estadisticas(),
+            "pool_db": pool_stats(),
+            "journal": ingest_journal.estadisticas(),
+            "cache_respuestas": response_cache.estadisticas(),
+            "reportes": report_engine.estadisticas(),
+            "stream": broadcaster.estadisticas(),
+        }
     except SQLAlchemyError:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Base de datos inaccesible")
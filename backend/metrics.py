@@ -0,0 +1,224 @@
+"""
+Métricas de rendimiento en formato de texto de Prometheus (RNF-08).
+
+Un middleware ASGI cuenta cada solicitud por método, ruta (la plantilla, no la
+URL concreta) y código, y guarda su latencia en un histograma con cubetas
+fijas. Todo vive en memoria del proceso. ``GET /metrics`` agrega en el momento
+de la consulta el estado del threadpool, de los pools de la BD, del diario, de
+la caché de respuestas y del stream, además de los contadores de negocio.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from anyio import to_thread
+
+from broadcaster import broadcaster
+from database import CambiosConfirmados, pool_stats, register_change_listener
+from journal import ingest_journal
+from models import Alert, SensorReading
+from response_cache import response_cache
+
+PREFIJO = "observatorio"
+# Incluye 0.5 s, el objetivo de RNF-03.
+CUBETAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RUTA_DESCONOCIDA = "sin_ruta"
+
+Muestra = Tuple[Dict[str, str], float]
+Familia = Tuple[str, str, str, List[Muestra]]
+
+
+def _etiquetas(etiquetas: Dict[str, str]) -> str:
+    if not etiquetas:
+        return ""
+    partes = []
+    for nombre, valor in etiquetas.items():
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        partes.append(f'{nombre}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class _Serie:
+    __slots__ = ("codigos", "cubetas", "suma", "conteo")
+
+    def __init__(self):
+        self.codigos: Dict[int, int] = {}
+        self.cubetas = [0] * (len(CUBETAS) + 1)
+        self.suma = 0.0
+        self.conteo = 0
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], _Serie] = {}
+        self._contadores: Dict[str, int] = {}
+        self._colecciones: List[Callable[[], Iterable[Familia]]] = []
+        self.en_curso = 0
+
+    def observar(self, metodo: str, ruta: str, codigo: int, segundos: float):
+        with self._lock:
+            serie = self._series.get((metodo, ruta))
+            if serie is None:
+                serie = self._series[(metodo, ruta)] = _Serie()
+            serie.codigos[codigo] = serie.codigos.get(codigo, 0) + 1
+            serie.cubetas[bisect_left(CUBETAS, segundos)] += 1
+            serie.suma += segundos
+            serie.conteo += 1
+
+    def incrementar(self, nombre: str, cantidad: int = 1):
+        with self._lock:
+            self._contadores[nombre] = self._contadores.get(nombre, 0) + cantidad
+
+    def registrar_coleccion(self, coleccion: Callable[[], Iterable[Familia]]):
+        """Agrega una función que devuelve familias (nombre, tipo, ayuda, muestras) al exponer."""
+        self._colecciones.append(coleccion)
+
+    def _familias_http(self) -> List[Familia]:
+        with self._lock:
+            series = [
+                (metodo, ruta, dict(serie.codigos), list(serie.cubetas), serie.suma, serie.conteo)
+                for (metodo, ruta), serie in sorted(self._series.items())
+            ]
+            contadores = sorted(self._contadores.items())
+            en_curso = self.en_curso
+
+        solicitudes: List[Muestra] = []
+        histograma: List[Muestra] = []
+        for metodo, ruta, codigos, cubetas, suma, conteo in series:
+            base = {"method": metodo, "route": ruta}
+            for codigo, total in sorted(codigos.items()):
+                solicitudes.append(({**base, "status": str(codigo)}, total))
+            acumulado = 0
+            for limite, cantidad in zip(CUBETAS + (float("inf"),), cubetas):
+                acumulado += cantidad
+                histograma.append(({**base, "le": _numero(limite)}, acumulado))
+            histograma.append(({**base, "__sufijo": "_sum"}, suma))
+            histograma.append(({**base, "__sufijo": "_count"}, conteo))
+
+        familias = [
+            (f"{PREFIJO}_http_requests_total", "counter", "Solicitudes HTTP por método, ruta y código.", solicitudes),
+            (f"{PREFIJO}_http_request_duration_seconds", "histogram", "Latencia de las solicitudes HTTP.", histograma),
+            (f"{PREFIJO}_http_requests_in_flight", "gauge", "Solicitudes HTTP en curso.", [({}, en_curso)]),
+        ]
+        for nombre, total in contadores:
+            familias.append((f"{PREFIJO}_{nombre}_total", "counter", f"Total de {nombre.replace('_', ' ')}.", [({}, total)]))
+        return familias
+
+    def exponer(self) -> str:
+        familias = self._familias_http()
+        for coleccion in self._colecciones:
+            familias.extend(coleccion())
+        lineas = []
+        for nombre, tipo, ayuda, muestras in familias:
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for etiquetas, valor in muestras:
+                sufijo = ""
+                if tipo == "histogram":
+                    sufijo = etiquetas.pop("__sufijo", "_bucket")
+                lineas.append(f"{nombre}{sufijo}{_etiquetas(etiquetas)} {_numero(valor)}")
+        return "\n".join(lineas) + "\n"
+
+    def _al_confirmar(self, cambios: CambiosConfirmados):
+        lecturas = len(cambios.insertados.get(SensorReading.__tablename__, ()))
+        alertas = len(cambios.insertados.get(Alert.__tablename__, ()))
+        if lecturas:
+            self.incrementar("lecturas_ingeridas", lecturas)
+        if alertas:
+            self.incrementar("alertas_creadas", alertas)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro: no envuelve el cuerpo de la respuesta ni crea tareas."""
+
+    def __init__(self, app, metricas: "Metricas", excluidas: Iterable[str] = ()):
+        self.app = app
+        self.metricas = metricas
+        self.excluidas = frozenset(excluidas)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluidas:
+            await self.app(scope, receive, send)
+            return
+
+        codigo = 500
+        metricas = self.metricas
+
+        async def enviar(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+            await send(mensaje)
+
+        inicio = time.perf_counter()
+        with metricas._lock:
+            metricas.en_curso += 1
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracion = time.perf_counter() - inicio
+            with metricas._lock:
+                metricas.en_curso -= 1
+            # El router deja la ruta encontrada en el scope; así la etiqueta no depende de los ids.
+            ruta = getattr(scope.get("route"), "path", None) or RUTA_DESCONOCIDA
+            metricas.observar(scope["method"], ruta, codigo, duracion)
+
+
+def _coleccion_threadpool() -> List[Familia]:
+    try:
+        limitador = to_thread.current_default_thread_limiter()
+    except RuntimeError:
+        # Fuera del bucle de eventos no hay limitador que leer.
+        return []
+    return [
+        (f"{PREFIJO}_threadpool_busy", "gauge", "Hilos del threadpool de la API ocupados.", [({}, limitador.borrowed_tokens)]),
+        (f"{PREFIJO}_threadpool_size", "gauge", "Tamaño del threadpool de la API.", [({}, limitador.total_tokens)]),
+    ]
+
+
+def _coleccion_pools() -> List[Familia]:
+    checkouts: List[Muestra] = []
+    ocupadas: List[Muestra] = []
+    for nombre, estado in pool_stats()["pools"].items():
+        checkouts.append(({"pool": nombre}, estado["checkouts"]))
+        if "checkedout" in estado:
+            ocupadas.append(({"pool": nombre}, estado["checkedout"]))
+    return [
+        (f"{PREFIJO}_db_pool_checkouts_total", "counter", "Conexiones entregadas por cada pool de la BD.", checkouts),
+        (f"{PREFIJO}_db_pool_checked_out", "gauge", "Conexiones en uso por pool de la BD.", ocupadas),
+    ]
+
+
+def _coleccion_componentes() -> List[Familia]:
+    journal = ingest_journal.estadisticas()
+    cache = response_cache.estadisticas()
+    stream = broadcaster.estadisticas()
+    return [
+        (f"{PREFIJO}_journal_lag", "gauge", "Lecturas del diario pendientes de aplicar.", [({}, journal["retraso"])]),
+        (f"{PREFIJO}_journal_lag_seconds", "gauge", "Antigüedad de la lectura pendiente más vieja.", [({}, journal["retraso_segundos"])]),
+        (
+            f"{PREFIJO}_response_cache_requests_total",
+            "counter",
+            "Consultas a la caché de respuestas.",
+            [({"resultado": "acierto"}, cache["aciertos"]), ({"resultado": "fallo"}, cache["fallos"])],
+        ),
+        (f"{PREFIJO}_stream_subscribers", "gauge", "Clientes conectados a /stream.", [({}, stream["suscriptores"])]),
+    ]
+
+
+metricas = Metricas()
+register_change_listener(metricas._al_confirmar)
+metricas.registrar_coleccion(_coleccion_threadpool)
+metricas.registrar_coleccion(_coleccion_pools)
+metricas.registrar_coleccion(_coleccion_componentes)
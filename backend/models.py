@@ -6,9 +6,11 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
+    text,
     UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
@@ -117,12 +119,40 @@ class SensorReading(Base):
     tomado_en = Column(DateTime, default=datetime.utcnow)
     observaciones = Column(Text, nullable=True)
 
+    # Índices para filtros + paginación por cursor (tomado_en, id).
+    __table_args__ = (
+        Index("ix_lecturas_tomado_id", "tomado_en", "id"),
+        Index("ix_lecturas_cuerpo_tomado_id", "cuerpo_agua_id", "tomado_en", "id"),
+        Index("ix_lecturas_cuerpo_parametro_tomado_id", "cuerpo_agua_id", "parametro_id", "tomado_en", "id"),
+        Index("ix_lecturas_sensor_tomado_id", "sensor_id", "tomado_en", "id"),
+        Index("ix_lecturas_parametro_tomado_id", "parametro_id", "tomado_en", "id"),
+    )
+
     sensor = relationship("Sensor", back_populates="lecturas")
     parametro = relationship("EnvironmentalParameter", back_populates="lecturas")
     cuerpo_agua = relationship("CuerpoDeAguaDB", back_populates="lecturas")
     alertas = relationship("Alert", back_populates="lectura")
 
 
+class ReadingRollup(Base):
+    __tablename__ = "lecturas_agregadas"
+
+    id = Column(Integer, primary_key=True)
+    intervalo = Column(String(10), nullable=False)
+    inicio = Column(DateTime, nullable=False)
+    cuerpo_agua_id = Column(Integer, ForeignKey("cuerpos_agua.id"), nullable=False)
+    parametro_id = Column(Integer, ForeignKey("parametros_ambientales.id"), nullable=False)
+    conteo = Column(Integer, nullable=False, default=0)
+    suma = Column(Float, nullable=False, default=0.0)
+    minimo = Column(Float, nullable=False)
+    maximo = Column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("intervalo", "cuerpo_agua_id", "parametro_id", "inicio", name="uq_agregado_intervalo"),
+        Index("ix_agregados_intervalo_inicio", "intervalo", "inicio"),
+    )
+
+
 class ProtectedZone(Base):
     __tablename__ = "zonas_protegidas"
 
@@ -149,6 +179,18 @@ class Alert(Base):
     creada_en = Column(DateTime, default=datetime.utcnow)
     resuelta = Column(Boolean, default=False)
 
+    __table_args__ = (
+        # Solo las alertas abiertas: las consultan el motor de umbrales y el mapa.
+        Index(
+            "ix_alertas_abiertas",
+            "cuerpo_agua_id",
+            "parametro_id",
+            "nivel",
+            sqlite_where=text("resuelta IS 0"),
+            postgresql_where=text("resuelta IS false"),
+        ),
+    )
+
     cuerpo_agua = relationship("CuerpoDeAguaDB", back_populates="alertas")
     lectura = relationship("SensorReading", back_populates="alertas")
     parametro = relationship("EnvironmentalParameter", back_populates="alertas")
@@ -209,3 +251,11 @@ class WaterBodyParameter(Base):
 
     cuerpo_agua = relationship("CuerpoDeAguaDB", back_populates="parametros_configurados")
     parametro = relationship("EnvironmentalParameter", back_populates="configuraciones")
+
+
+class JournalCheckpoint(Base):
+    __tablename__ = "journal_checkpoints"
+
+    nombre = Column(String(50), primary_key=True)
+    secuencia = Column(Integer, nullable=False, default=0)
+    actualizado_en = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,223 @@
+"""
+Búsqueda de los cuerpos de agua y sensores activos más cercanos a un punto.
+
+Las coordenadas se guardan en memoria en celdas de ``CELDA_GRADOS`` grados.
+Una búsqueda recorre anillos de celdas alrededor del punto y se detiene cuando
+ninguna celda sin visitar puede contener algo más cerca que el k-ésimo
+resultado (o que el radio pedido). Las distancias son haversine, en km.
+
+Los cambios confirmados en la tabla se anotan y se aplican en la siguiente
+búsqueda, releyendo solo esas filas.
+"""
+
+import heapq
+import math
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import CambiosConfirmados, register_change_listener
+from ingest import MAX_PARAMETROS_IN
+from models import CuerpoDeAguaDB, Sensor
+
+RADIO_TIERRA_KM = 6371.0088
+CELDA_GRADOS = 0.5
+_FILAS = int(180 / CELDA_GRADOS)
+_COLUMNAS = int(360 / CELDA_GRADOS)
+
+Celda = Tuple[int, int]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _celda(latitud: float, longitud: float) -> Celda:
+    fila = min(int((latitud + 90) / CELDA_GRADOS), _FILAS - 1)
+    columna = int((longitud + 180) / CELDA_GRADOS) % _COLUMNAS
+    return fila, columna
+
+
+def _cota_km(latitud: float, longitud: float, celda: Celda, anillo: int) -> float:
+    """Distancia mínima a cualquier punto fuera del bloque de celdas ya visitado."""
+    fila, columna = celda
+    cotas = []
+    limite_sur = (fila - anillo) * CELDA_GRADOS - 90
+    limite_norte = (fila + anillo + 1) * CELDA_GRADOS - 90
+    if limite_sur > -90:
+        cotas.append(latitud - limite_sur)
+    if limite_norte < 90:
+        cotas.append(limite_norte - latitud)
+    cota_latitud = math.radians(min(cotas)) if cotas else math.inf
+
+    if (2 * anillo + 1) * CELDA_GRADOS >= 360:
+        cota_longitud = math.inf
+    else:
+        oeste = (columna - anillo) * CELDA_GRADOS - 180
+        este = (columna + anillo + 1) * CELDA_GRADOS - 180
+        delta = math.radians(min(longitud - oeste, este - longitud))
+        if delta <= math.pi / 2:
+            # Distancia al meridiano del borde.
+            cota_longitud = math.asin(min(1.0, math.cos(math.radians(latitud)) * math.sin(delta)))
+        else:
+            # Más allá de 90° de longitud, lo más cercano fuera del bloque es el polo.
+            cota_longitud = math.radians(90 - abs(latitud))
+    return RADIO_TIERRA_KM * min(cota_latitud, cota_longitud)
+
+
+def _anillo(celda: Celda, radio: int):
+    fila, columna = celda
+    for df in range(-radio, radio + 1):
+        f = fila + df
+        if not 0 <= f < _FILAS:
+            continue
+        if abs(df) == radio:
+            columnas = range(-radio, radio + 1)
+        else:
+            columnas = (-radio, radio)
+        for dc in columnas:
+            yield f, (columna + dc) % _COLUMNAS
+
+
+class IndiceVecinos:
+    def __init__(self, modelo, *condiciones):
+        self._modelo = modelo
+        self._condiciones = condiciones
+        self._lock = threading.Lock()
+        self._cargado = False
+        self._cargando = False
+        # Última sincronización que tomó cada fila pendiente; solo esa puede aplicarla.
+        self._turno = 0
+        self._reservas: Dict[int, int] = {}
+        self._puntos: Dict[int, Tuple[float, float]] = {}
+        self._celdas: Dict[Celda, Set[int]] = {}
+        self._pendientes: Set[int] = set()
+
+    def _consulta(self):
+        modelo = self._modelo
+        return select(modelo.id, modelo.latitud, modelo.longitud).where(
+            modelo.latitud.is_not(None), modelo.longitud.is_not(None), *self._condiciones
+        )
+
+    def _poner(self, punto_id: int, latitud: float, longitud: float):
+        self._quitar(punto_id)
+        self._puntos[punto_id] = (latitud, longitud)
+        self._celdas.setdefault(_celda(latitud, longitud), set()).add(punto_id)
+
+    def _quitar(self, punto_id: int):
+        anterior = self._puntos.pop(punto_id, None)
+        if anterior is None:
+            return
+        celda = _celda(*anterior)
+        miembros = self._celdas.get(celda)
+        if miembros is not None:
+            miembros.discard(punto_id)
+            if not miembros:
+                del self._celdas[celda]
+
+    def sincronizar(self, db: Session):
+        # Las consultas corren fuera del lock: en run_sync se ejecutan en el event loop y
+        # esperar el lock ahí mientras otro hilo espera su consulta bloquearía el servidor.
+        with self._lock:
+            if self._cargado and not self._pendientes:
+                return
+            completa = not self._cargado
+            if completa:
+                # Los cambios confirmados desde aquí se anotan en _pendientes y se releen
+                # después, así que basta con la primera carga completa que termine.
+                self._cargando = True
+            else:
+                self._turno += 1
+                turno = self._turno
+                pendientes = list(self._pendientes)
+                self._pendientes.clear()
+                self._reservas.update(dict.fromkeys(pendientes, turno))
+
+        if completa:
+            filas = db.execute(self._consulta()).all()
+        else:
+            filas = []
+            for inicio in range(0, len(pendientes), MAX_PARAMETROS_IN):
+                bloque = pendientes[inicio : inicio + MAX_PARAMETROS_IN]
+                filas.extend(db.execute(self._consulta().where(self._modelo.id.in_(bloque))))
+
+        with self._lock:
+            if completa:
+                # Si otra carga terminó antes, el índice ya está listo y esta lectura sobra.
+                if self._cargado:
+                    return
+                for punto_id, latitud, longitud in filas:
+                    self._poner(punto_id, latitud, longitud)
+                self._cargado = True
+                self._cargando = False
+                return
+            vistos = set()
+            for punto_id, latitud, longitud in filas:
+                vistos.add(punto_id)
+                if self._reservas.get(punto_id) == turno:
+                    self._poner(punto_id, latitud, longitud)
+            # Borrados, desactivados o sin coordenadas.
+            for punto_id in pendientes:
+                if self._reservas.get(punto_id) == turno:
+                    del self._reservas[punto_id]
+                    if punto_id not in vistos:
+                        self._quitar(punto_id)
+
+    def cercanos(
+        self, latitud: float, longitud: float, k: int, radio_km: Optional[float] = None
+    ) -> List[Tuple[int, float]]:
+        """Devuelve hasta ``k`` pares (id, distancia_km) ordenados por distancia."""
+        with self._lock:
+            mejores: List[Tuple[float, int]] = []  # montículo de (-distancia, id)
+            vistas: Set[Celda] = set()
+
+            def evaluar(celda: Celda):
+                for punto_id in self._celdas.get(celda, ()):
+                    distancia = haversine_km(latitud, longitud, *self._puntos[punto_id])
+                    if radio_km is not None and distancia > radio_km:
+                        continue
+                    if len(mejores) < k:
+                        heapq.heappush(mejores, (-distancia, punto_id))
+                    elif distancia < -mejores[0][0]:
+                        heapq.heapreplace(mejores, (-distancia, punto_id))
+
+            origen = _celda(latitud, longitud)
+            radio = 0
+            while True:
+                for celda in _anillo(origen, radio):
+                    if celda not in vistas:
+                        vistas.add(celda)
+                        evaluar(celda)
+                cota = _cota_km(latitud, longitud, origen, radio)
+                if len(mejores) == k and cota >= -mejores[0][0]:
+                    break
+                if radio_km is not None and cota > radio_km:
+                    break
+                if math.isinf(cota) or len(vistas) >= len(self._celdas):
+                    # Recorrer las celdas no vacías restantes cuesta menos que seguir con anillos.
+                    for celda in list(self._celdas):
+                        if celda not in vistas:
+                            evaluar(celda)
+                    break
+                radio += 1
+            return [(punto_id, -distancia) for distancia, punto_id in sorted(mejores, reverse=True)]
+
+    def _al_confirmar(self, cambios: CambiosConfirmados):
+        tabla = self._modelo.__tablename__
+        with self._lock:
+            if not (self._cargado or self._cargando):
+                return
+            for grupo in (cambios.insertados, cambios.actualizados, cambios.eliminados):
+                self._pendientes.update(grupo.get(tabla, ()))
+
+
+indice_cuerpos = IndiceVecinos(CuerpoDeAguaDB)
+indice_sensores = IndiceVecinos(Sensor, Sensor.activo.is_(True))
+register_change_listener(indice_cuerpos._al_confirmar)
+register_change_listener(indice_sensores._al_confirmar)
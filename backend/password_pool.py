@@ -0,0 +1,116 @@
+"""
+Pool de procesos acotado para el hashing de contraseñas.
+
+PBKDF2 con 600 000 iteraciones ocupa un núcleo durante cientos de
+milisegundos. Ejecutarlo en un pool de procesos propio evita que una ráfaga de
+logins agote el threadpool compartido; si ya hay ``max_pendientes`` trabajos
+en curso, la solicitud se rechaza de inmediato con :class:`PasswordPoolBusy`.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+import security
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+def _ejecutar_medido(funcion, encolado: float, *args):
+    # time.monotonic usa un reloj común a todos los procesos del sistema.
+    inicio = time.monotonic()
+    resultado = funcion(*args)
+    return resultado, inicio - encolado, time.monotonic() - inicio
+
+
+class _Medicion:
+    def __init__(self):
+        self.total = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def observar(self, segundos: float):
+        self.total += 1
+        self.suma += segundos
+        self.maximo = max(self.maximo, segundos)
+
+    def resumen(self) -> Dict[str, float]:
+        promedio = self.suma / self.total if self.total else 0.0
+        return {"promedio_ms": round(promedio * 1000, 2), "max_ms": round(self.maximo * 1000, 2)}
+
+
+class PasswordHashPool:
+    def __init__(self, trabajadores: int, max_pendientes: int):
+        self.trabajadores = trabajadores
+        self.max_pendientes = max_pendientes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        self.completados = 0
+        self.rechazados = 0
+        self.latencia = _Medicion()
+        self.espera = _Medicion()
+
+    def _obtener_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: no se hereda el estado (hilos, conexiones) del servidor.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.trabajadores, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def _enviar(self, funcion, *args):
+        with self._lock:
+            if self._en_curso >= self.max_pendientes:
+                self.rechazados += 1
+                raise PasswordPoolBusy()
+            self._en_curso += 1
+            executor = self._obtener_executor()
+        try:
+            futuro = executor.submit(_ejecutar_medido, funcion, time.monotonic(), *args)
+            resultado, espera, duracion = await asyncio.wrap_future(futuro)
+        finally:
+            with self._lock:
+                self._en_curso -= 1
+        with self._lock:
+            self.completados += 1
+            self.espera.observar(espera)
+            self.latencia.observar(duracion)
+        return resultado
+
+    async def verificar(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._enviar(security.verify_password, plain_password, hashed_password)
+
+    async def hashear(self, password: str) -> str:
+        return await self._enviar(security.get_password_hash, password)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "trabajadores": self.trabajadores,
+                "en_curso": self._en_curso,
+                "max_pendientes": self.max_pendientes,
+                "completados": self.completados,
+                "rechazados": self.rechazados,
+                "latencia": self.latencia.resumen(),
+                "espera": self.espera.resumen(),
+            }
+
+    def cerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_TRABAJADORES = int(os.getenv("HASH_WORKERS", min(2, os.cpu_count() or 1)))
+password_pool = PasswordHashPool(
+    trabajadores=_TRABAJADORES,
+    max_pendientes=int(os.getenv("HASH_MAX_PENDIENTES", _TRABAJADORES * 8)),
+)
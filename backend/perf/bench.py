@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks de las rutas calientes de la API.
+
+Mide con ``timeit`` la firma y verificación de JWT, ``verify_password``, la
+serialización de listas de ``CuerpoDeAguaOut`` y ``ReadingOut`` (con pydantic y
+con ``streaming`` sobre tuplas) y las consultas de los listados contra la base indicada (conviene generarla antes con
+``perf/dataset.py``). Cada corrida se guarda como JSON en ``perf/resultados/``
+junto con el commit, la versión de Python y el tamaño de la base, y
+``--comparar`` la contrasta con una corrida anterior.
+
+    python perf/bench.py --database-url sqlite:///volumen.db
+    python perf/bench.py --database-url sqlite:///volumen.db --comparar perf/resultados/base.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+RESULTADOS_DIR = Path(__file__).resolve().parent / "resultados"
+ELEMENTOS_LISTA = 1000
+TOLERANCIA = 0.20
+
+
+def medir(funcion: Callable[[], object], repeticiones: int = 5, minimo_s: float = 0.2) -> Dict:
+    """Calibra las iteraciones para que cada repetición dure al menos ``minimo_s``."""
+    temporizador = timeit.Timer(funcion)
+    numero = 1
+    while temporizador.timeit(numero) < minimo_s:
+        numero *= 2
+    tiempos = [total / numero * 1e6 for total in temporizador.repeat(repeat=repeticiones, number=numero)]
+    mejor = min(tiempos)
+    return {
+        "iteraciones": numero,
+        "repeticiones": repeticiones,
+        "mejor_us": round(mejor, 3),
+        "mediana_us": round(statistics.median(tiempos), 3),
+        "por_segundo": round(1e6 / mejor, 1) if mejor else None,
+    }
+
+
+def _objetos_sinteticos(cantidad: int) -> Tuple[List, List]:
+    """Cuerpos de agua y lecturas en memoria, iguales en cada corrida."""
+    from models import CuerpoDeAguaDB, SensorReading
+    from perf.dataset import COLUMNAS_LECTURA, PARAMETROS, Generador
+
+    generador = Generador(semilla=7)
+    fecha = datetime(2024, 1, 1)
+    cuerpos = [CuerpoDeAguaDB(**fila) for fila in generador.cuerpos(cantidad, 1, fecha)]
+    sensores = [(indice + 1, cuerpos[indice % len(cuerpos)].id) for indice in range(cantidad)]
+    parametros = [(indice + 1, *parametro[1:]) for indice, parametro in enumerate(PARAMETROS)]
+    (lote,) = generador.lecturas(cantidad, 1, sensores, parametros, fecha, datetime(2024, 2, 1), 0.0, cantidad)
+    lecturas = [SensorReading(**dict(zip(COLUMNAS_LECTURA, fila)), observaciones=None) for fila in lote]
+    return cuerpos, lecturas
+
+
+def _pydantic_lista(modelo, objetos) -> Callable[[], bytes]:
+    from pydantic import TypeAdapter
+
+    adaptador = TypeAdapter(List[modelo])
+    return lambda: adaptador.dump_json(adaptador.validate_python(objetos, from_attributes=True))
+
+
+def _filas_lista(modelo, objetos) -> Callable[[], bytes]:
+    from streaming import partes_lista
+
+    claves = list(modelo.model_fields)
+    filas = [tuple(getattr(objeto, clave) for clave in claves) for objeto in objetos]
+    return lambda: b"".join(partes_lista(claves, [filas]))
+
+
+def _consulta(construir: Callable) -> Callable[[], object]:
+    from database import ReadSessionLocal
+
+    def ejecutar():
+        # Sesión nueva en cada iteración, como en un request: sin mapa de identidad caliente.
+        with ReadSessionLocal() as db:
+            return db.execute(construir()).all()
+
+    return ejecutar
+
+
+def benchmarks(elementos: int) -> Dict[str, Callable[[], object]]:
+    from sqlalchemy import func, select
+
+    import main
+    import security
+    from database import ReadSessionLocal
+    from models import Alert, CuerpoDeAguaDB, Sensor, SensorReading
+
+    token = main.create_access_token({"sub": "bench@example.com", "uid": 1, "role": "analista"})
+    payload = main.decode_access_token(token)
+    hash_password = security.get_password_hash("clave-de-bench-123")
+    cuerpos, lecturas = _objetos_sinteticos(elementos)
+
+    with ReadSessionLocal() as db:
+        cuerpo_id = db.execute(
+            select(SensorReading.cuerpo_agua_id).order_by(SensorReading.id.desc()).limit(1)
+        ).scalar() or 0
+
+    def pagina_lecturas():
+        return (
+            select(SensorReading)
+            .where(SensorReading.cuerpo_agua_id == cuerpo_id)
+            .order_by(SensorReading.tomado_en.desc(), SensorReading.id.desc())
+            .limit(100)
+        )
+
+    return {
+        "jwt.encode": lambda: main._encode_jwt(payload),
+        "jwt.decode": lambda: main.decode_access_token(token),
+        "verify_password": lambda: security.verify_password("clave-de-bench-123", hash_password),
+        f"serializar.cuerpos_agua[{elementos}]": _pydantic_lista(main.CuerpoDeAguaOut, cuerpos),
+        f"serializar.lecturas[{elementos}]": _pydantic_lista(main.ReadingOut, lecturas),
+        f"serializar_filas.cuerpos_agua[{elementos}]": _filas_lista(main.CuerpoDeAguaOut, cuerpos),
+        f"serializar_filas.lecturas[{elementos}]": _filas_lista(main.ReadingOut, lecturas),
+        "consulta.cuerpos_agua": _consulta(lambda: select(CuerpoDeAguaDB)),
+        "consulta.sensores": _consulta(lambda: select(Sensor)),
+        "consulta.alertas_abiertas": _consulta(lambda: select(Alert).where(Alert.resuelta.is_(False))),
+        "consulta.lecturas_pagina": _consulta(pagina_lecturas),
+        "consulta.conteo_lecturas": _consulta(lambda: select(func.count()).select_from(SensorReading)),
+    }
+
+
+def tamano_base() -> Dict[str, int]:
+    from sqlalchemy import func, select
+
+    from database import ReadSessionLocal
+    from models import Alert, CuerpoDeAguaDB, Sensor, SensorReading
+
+    with ReadSessionLocal() as db:
+        return {
+            modelo.__tablename__: db.execute(select(func.count()).select_from(modelo)).scalar()
+            for modelo in (CuerpoDeAguaDB, Sensor, SensorReading, Alert)
+        }
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=RESULTADOS_DIR.parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual: Dict, anterior: Dict, tolerancia: float) -> List[str]:
+    """Imprime la razón actual/anterior por benchmark y devuelve los que empeoraron más de ``tolerancia``."""
+    regresiones = []
+    print(f"\nComparación con {anterior.get('commit') or '?'} ({anterior.get('fecha')}):")
+    for nombre, medida in actual["benchmarks"].items():
+        previa = anterior.get("benchmarks", {}).get(nombre)
+        if previa is None or not previa.get("mejor_us"):
+            print(f"  {nombre:<36} (nuevo)")
+            continue
+        razon = medida["mejor_us"] / previa["mejor_us"]
+        marca = ""
+        if razon > 1 + tolerancia:
+            marca = "  << más lento"
+            regresiones.append(f"{nombre}: {previa['mejor_us']} µs -> {medida['mejor_us']} µs (x{razon:.2f})")
+        print(f"  {nombre:<36} {previa['mejor_us']:>12.1f} -> {medida['mejor_us']:>12.1f} µs  x{razon:.2f}{marca}")
+    return regresiones
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de las rutas calientes de la API.")
+    parser.add_argument("--database-url", help="Base a consultar; por defecto DATABASE_URL")
+    parser.add_argument("--solo", action="append", default=[], help="Corre solo los benchmarks que contienen este texto")
+    parser.add_argument("--elementos", type=int, default=ELEMENTOS_LISTA, help="Tamaño de las listas a serializar")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--minimo-s", type=float, default=0.2, help="Duración mínima de cada repetición")
+    parser.add_argument("--salida", help=f"Archivo JSON de resultados; por defecto en {RESULTADOS_DIR.name}/")
+    parser.add_argument("--comparar", help="Resultado anterior con el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Empeoramiento admitido al comparar (0.2 = 20 %%)")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        # database.py lee DATABASE_URL al importarse.
+        os.environ["DATABASE_URL"] = args.database_url
+
+    from database import DB_PROFILE, create_tables
+
+    create_tables()
+    seleccion = {
+        nombre: funcion
+        for nombre, funcion in benchmarks(args.elementos).items()
+        if not args.solo or any(texto in nombre for texto in args.solo)
+    }
+    resultado = {
+        "fecha": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "perfil_bd": DB_PROFILE,
+        "base": tamano_base(),
+        "benchmarks": {},
+    }
+    print(f"Base: {resultado['base']}")
+    for nombre, funcion in seleccion.items():
+        medida = resultado["benchmarks"][nombre] = medir(funcion, args.repeticiones, args.minimo_s)
+        print(f"  {nombre:<36} {medida['mejor_us']:>12.1f} µs  (mediana {medida['mediana_us']:.1f}, {medida['por_segundo']:,.0f}/s)")
+
+    salida = Path(args.salida) if args.salida else RESULTADOS_DIR / f"{resultado['fecha'][:19].replace(':', '')}-{resultado['commit'] or 'local'}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultados en {salida}")
+
+    if args.comparar:
+        anterior = json.loads(Path(args.comparar).read_text(encoding="utf-8"))
+        regresiones = comparar(resultado, anterior, args.tolerancia)
+        if regresiones:
+            print("\nRegresiones:", file=sys.stderr)
+            for regresion in regresiones:
+                print(f"  - {regresion}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
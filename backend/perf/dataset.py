@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Generador de datos sintéticos para pruebas de volumen.
+
+Con la misma semilla y los mismos argumentos produce exactamente los mismos
+cuerpos de agua, sensores, lecturas y alertas. Escribe por lotes con
+``executemany`` y asigna los ids desde Python (a partir del mayor existente),
+de modo que las alertas pueden apuntar a sus lecturas sin ``RETURNING``. Al
+final reconstruye ``lecturas_agregadas`` para el periodo generado.
+
+    python perf/dataset.py --database-url sqlite:///volumen.db --cuerpos 5000 --sensores-por-cuerpo 10 --lecturas 20000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Nombre, unidad, mínimo, máximo, media, desviación.
+PARAMETROS = (
+    ("pH", "pH", 6.5, 8.5, 7.4, 0.4),
+    ("Temperatura", "°C", 0.0, 30.0, 18.0, 4.0),
+    ("Oxígeno disuelto", "mg/L", 5.0, 14.0, 8.5, 1.5),
+    ("Turbidez", "NTU", 0.0, 50.0, 12.0, 8.0),
+    ("Conductividad", "µS/cm", 50.0, 1500.0, 500.0, 200.0),
+)
+TIPOS = ("río", "lago", "laguna", "presa", "humedal", "estero")
+NIVELES = ("Baja", "Media", "Alta")
+NOMBRES = ("Azul", "Grande", "Seco", "Verde", "Hondo", "Claro", "Viejo", "Escondido", "del Norte", "del Sur")
+TIPOS_SENSOR = ("multiparamétrica", "pH", "temperatura", "oxígeno", "turbidímetro")
+# Territorio mexicano aproximado.
+LATITUD = (14.5, 32.7)
+LONGITUD = (-118.4, -86.7)
+HASTA = datetime(2025, 1, 1)
+
+
+COLUMNAS_LECTURA = ("id", "sensor_id", "parametro_id", "cuerpo_agua_id", "valor", "unidad", "tomado_en")
+COLUMNAS_ALERTA = ("id", "cuerpo_agua_id", "lectura_id", "parametro_id", "nivel", "mensaje", "creada_en", "resuelta")
+
+
+class Generador:
+    def __init__(self, semilla: int, fecha: Callable[[datetime], object] = lambda valor: valor):
+        self.aleatorio = random.Random(semilla)
+        # Convierte cada fecha de lectura al valor que recibe el driver.
+        self.fecha = fecha
+
+    def cuerpos(self, cantidad: int, primer_id: int, creado_en: datetime) -> List[Dict]:
+        aleatorio = self.aleatorio
+        filas = []
+        for indice in range(cantidad):
+            tipo = aleatorio.choice(TIPOS)
+            filas.append(
+                {
+                    "id": primer_id + indice,
+                    "nombre": f"{tipo.capitalize()} {aleatorio.choice(NOMBRES)} {primer_id + indice}",
+                    "tipo": tipo,
+                    "latitud": round(aleatorio.uniform(*LATITUD), 6),
+                    "longitud": round(aleatorio.uniform(*LONGITUD), 6),
+                    "contaminacion": aleatorio.choice(NIVELES),
+                    "biodiversidad": aleatorio.choice(NIVELES),
+                    "descripcion": None,
+                    "temperatura": round(aleatorio.gauss(18.0, 4.0), 2),
+                    "ph": round(aleatorio.gauss(7.4, 0.4), 2),
+                    "oxigeno_disuelto": round(aleatorio.gauss(8.5, 1.5), 2),
+                    "fecha_creacion": creado_en,
+                    "fecha_actualizacion": creado_en,
+                    "creado_por_id": None,
+                }
+            )
+        return filas
+
+    def sensores(self, cuerpos: List[Dict], por_cuerpo: int, primer_id: int, instalado_en: datetime) -> List[Dict]:
+        aleatorio = self.aleatorio
+        filas = []
+        for cuerpo in cuerpos:
+            for numero in range(por_cuerpo):
+                filas.append(
+                    {
+                        "id": primer_id + len(filas),
+                        "nombre": f"Sonda {cuerpo['id']}-{numero + 1}",
+                        "tipo": aleatorio.choice(TIPOS_SENSOR),
+                        "cuerpo_agua_id": cuerpo["id"],
+                        "latitud": round(cuerpo["latitud"] + aleatorio.uniform(-0.05, 0.05), 6),
+                        "longitud": round(cuerpo["longitud"] + aleatorio.uniform(-0.05, 0.05), 6),
+                        "descripcion": None,
+                        "instalado_en": instalado_en.date(),
+                        "activo": aleatorio.random() > 0.05,
+                    }
+                )
+        return filas
+
+    def lecturas(
+        self,
+        cantidad: int,
+        primer_id: int,
+        sensores: List[Tuple[int, int]],
+        parametros: List[Tuple[int, str, float, float, float, float]],
+        desde: datetime,
+        hasta: datetime,
+        fraccion_fuera: float,
+        tamano_lote: int,
+    ) -> Iterator[List[Tuple]]:
+        """Lecturas en orden cronológico (tuplas en el orden de ``COLUMNAS_LECTURA``), en lotes de ``tamano_lote``."""
+        aleatorio, fecha = self.aleatorio, self.fecha
+        paso = (hasta - desde) / max(cantidad, 1)
+        for inicio in range(0, cantidad, tamano_lote):
+            lote = []
+            tomado_en = desde + paso * inicio
+            for indice in range(inicio, min(inicio + tamano_lote, cantidad)):
+                sensor_id, cuerpo_id = sensores[aleatorio.randrange(len(sensores))]
+                parametro_id, unidad, minimo, maximo, media, desviacion = parametros[aleatorio.randrange(len(parametros))]
+                if aleatorio.random() < fraccion_fuera:
+                    exceso = abs(aleatorio.gauss(0.0, desviacion)) + desviacion * 0.1
+                    valor = maximo + exceso if aleatorio.random() < 0.7 else minimo - exceso
+                else:
+                    valor = min(max(aleatorio.gauss(media, desviacion), minimo), maximo)
+                lote.append((primer_id + indice, sensor_id, parametro_id, cuerpo_id, round(valor, 3), unidad, fecha(tomado_en)))
+                tomado_en += paso
+            yield lote
+
+
+def _siguiente_id(conexion, modelo) -> int:
+    from sqlalchemy import func, select
+
+    return (conexion.execute(select(func.max(modelo.id))).scalar() or 0) + 1
+
+
+def _insertar(conexion, modelo, columnas: Sequence[str], filas: List[Tuple]):
+    """executemany de tuplas; en SQLite va directo al driver, sin procesar cada parámetro en Python."""
+    from sqlalchemy import insert
+
+    if conexion.dialect.name == "sqlite":
+        marcas = ", ".join("?" for _ in columnas)
+        conexion.exec_driver_sql(f"INSERT INTO {modelo.__tablename__} ({', '.join(columnas)}) VALUES ({marcas})", filas)
+    else:
+        conexion.execute(insert(modelo), [dict(zip(columnas, fila)) for fila in filas])
+
+
+def _parametros(conexion) -> List[Tuple[int, str, float, float, float, float]]:
+    """Reutiliza los parámetros con el mismo nombre o los crea."""
+    from sqlalchemy import insert, select
+
+    from models import EnvironmentalParameter
+
+    existentes = dict(conexion.execute(select(EnvironmentalParameter.nombre, EnvironmentalParameter.id)).all())
+    resultado = []
+    for nombre, unidad, minimo, maximo, media, desviacion in PARAMETROS:
+        parametro_id = existentes.get(nombre)
+        if parametro_id is None:
+            parametro_id = _siguiente_id(conexion, EnvironmentalParameter)
+            conexion.execute(
+                insert(EnvironmentalParameter).values(
+                    id=parametro_id, nombre=nombre, unidad=unidad, valor_minimo=minimo, valor_maximo=maximo
+                )
+            )
+        resultado.append((parametro_id, unidad, minimo, maximo, media, desviacion))
+    return resultado
+
+
+def generar(
+    cuerpos: int,
+    sensores_por_cuerpo: int,
+    lecturas: int,
+    dias: int,
+    hasta: datetime = HASTA,
+    semilla: int = 42,
+    fraccion_fuera: float = 0.002,
+    fraccion_abiertas: float = 0.2,
+    tamano_lote: int = 50_000,
+    progreso: bool = False,
+) -> Dict[str, int]:
+    from sqlalchemy import insert, update
+
+    from database import SessionLocal, create_tables, engine
+    from models import Alert, CuerpoDeAguaDB, SensorReading, Sensor
+    from rollups import reconstruir_agregados
+
+    create_tables()
+    desde = hasta - timedelta(days=dias)
+    totales = {"cuerpos_agua": 0, "sensores": 0, "lecturas_sensores": 0, "alertas": 0, "lecturas_agregadas": 0}
+
+    with engine.connect() as conexion:
+        sqlite = conexion.dialect.name == "sqlite"
+        # Mismo texto que guarda SQLAlchemy para DateTime en SQLite.
+        generador = Generador(semilla, (lambda valor: valor.isoformat(" ", "microseconds")) if sqlite else (lambda valor: valor))
+        previo = None
+        if sqlite:
+            # Solo para esta carga: si se interrumpe, la base se vuelve a generar.
+            previo = conexion.exec_driver_sql("PRAGMA synchronous").scalar()
+            conexion.exec_driver_sql("PRAGMA synchronous=OFF")
+            conexion.commit()
+        try:
+            parametros = _parametros(conexion)
+            filas_cuerpos = generador.cuerpos(cuerpos, _siguiente_id(conexion, CuerpoDeAguaDB), desde)
+            filas_sensores = generador.sensores(filas_cuerpos, sensores_por_cuerpo, _siguiente_id(conexion, Sensor), desde)
+            if filas_cuerpos:
+                conexion.execute(insert(CuerpoDeAguaDB), filas_cuerpos)
+            if filas_sensores:
+                conexion.execute(insert(Sensor), filas_sensores)
+            conexion.commit()
+            totales["cuerpos_agua"], totales["sensores"] = len(filas_cuerpos), len(filas_sensores)
+            sensores = [(fila["id"], fila["cuerpo_agua_id"]) for fila in filas_sensores]
+            del filas_cuerpos, filas_sensores
+
+            if sensores and lecturas:
+                # Mantener cinco índices fila a fila cuesta más que reconstruirlos al final.
+                # Si la carga se interrumpe, create_tables() los vuelve a crear.
+                indices = list(SensorReading.__table__.indexes)
+                for indice in indices:
+                    indice.drop(conexion, checkfirst=True)
+                conexion.commit()
+
+                rangos = {parametro[0]: (parametro[2], parametro[3]) for parametro in parametros}
+                siguiente_alerta = _siguiente_id(conexion, Alert)
+                # (cuerpo_agua_id, parametro_id) -> id de su última alerta.
+                ultimas: Dict[Tuple[int, int], int] = {}
+                inicio = time.perf_counter()
+                for lote in generador.lecturas(
+                    lecturas, _siguiente_id(conexion, SensorReading), sensores, parametros, desde, hasta, fraccion_fuera, tamano_lote
+                ):
+                    alertas = []
+                    for lectura_id, _, parametro_id, cuerpo_id, valor, _, tomado_en in lote:
+                        minimo, maximo = rangos[parametro_id]
+                        if minimo <= valor <= maximo:
+                            continue
+                        mensaje = f"Lectura {valor} fuera del rango permitido [{minimo}, {maximo}]"
+                        alertas.append((siguiente_alerta, cuerpo_id, lectura_id, parametro_id, "media", mensaje, tomado_en, True))
+                        ultimas[(cuerpo_id, parametro_id)] = siguiente_alerta
+                        siguiente_alerta += 1
+                    _insertar(conexion, SensorReading, COLUMNAS_LECTURA, lote)
+                    if alertas:
+                        _insertar(conexion, Alert, COLUMNAS_ALERTA, alertas)
+                    conexion.commit()
+                    totales["lecturas_sensores"] += len(lote)
+                    totales["alertas"] += len(alertas)
+                    if progreso:
+                        ritmo = totales["lecturas_sensores"] / (time.perf_counter() - inicio)
+                        print(f"  {totales['lecturas_sensores']:,}/{lecturas:,} lecturas ({ritmo:,.0f}/s)", end="\r", flush=True)
+                if progreso:
+                    print()
+
+                # Como en el motor de umbrales, a lo sumo una alerta abierta por cuerpo y parámetro: la última.
+                abiertas = [alerta_id for _, alerta_id in sorted(ultimas.items()) if generador.aleatorio.random() < fraccion_abiertas]
+                for inicio_bloque in range(0, len(abiertas), 500):
+                    conexion.execute(
+                        update(Alert).where(Alert.id.in_(abiertas[inicio_bloque : inicio_bloque + 500])).values(resuelta=False)
+                    )
+                for indice in indices:
+                    indice.create(conexion)
+                conexion.commit()
+        finally:
+            if previo is not None:
+                # La conexión vuelve al pool del proceso, que la sigue usando (tests, API).
+                conexion.rollback()
+                conexion.exec_driver_sql(f"PRAGMA synchronous={previo}")
+                conexion.commit()
+
+    with SessionLocal() as db:
+        totales["lecturas_agregadas"] = reconstruir_agregados(db, desde, hasta)
+        db.commit()
+    return totales
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Genera un conjunto de datos sintético y reproducible.")
+    parser.add_argument("--database-url", help="Base de destino; por defecto DATABASE_URL")
+    parser.add_argument("--cuerpos", type=int, default=1000)
+    parser.add_argument("--sensores-por-cuerpo", type=int, default=10)
+    parser.add_argument("--lecturas", type=int, default=1_000_000)
+    parser.add_argument("--dias", type=int, default=365, help="Días que cubren las lecturas, hasta --hasta")
+    parser.add_argument("--hasta", type=datetime.fromisoformat, default=HASTA, help="AAAA-MM-DD, UTC, excluyente")
+    parser.add_argument("--fraccion-fuera", type=float, default=0.002, help="Lecturas fuera de rango (generan alertas)")
+    parser.add_argument("--fraccion-abiertas", type=float, default=0.2, help="Pares cuerpo/parámetro con su última alerta abierta")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--tamano-lote", type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        # database.py lee DATABASE_URL al importarse.
+        os.environ["DATABASE_URL"] = args.database_url
+
+    inicio = time.perf_counter()
+    totales = generar(
+        args.cuerpos,
+        args.sensores_por_cuerpo,
+        args.lecturas,
+        args.dias,
+        hasta=args.hasta,
+        semilla=args.semilla,
+        fraccion_fuera=args.fraccion_fuera,
+        fraccion_abiertas=args.fraccion_abiertas,
+        tamano_lote=args.tamano_lote,
+        progreso=True,
+    )
+    segundos = time.perf_counter() - inicio
+    for tabla, filas in totales.items():
+        print(f"{tabla}: {filas:,}")
+    print(f"Generado en {segundos:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
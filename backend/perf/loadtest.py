@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga HTTP contra los presupuestos de RNF-03.
+
+Levanta la API con uvicorn en otro proceso sobre una base SQLite temporal (o
+usa ``--url`` para apuntar a un servidor ya en marcha), crea un usuario,
+cuerpos de agua, sensores y un parámetro, y mide dos cosas:
+
+* la generación de un reporte de ``--lecturas-reporte`` lecturas (10 000 por
+  omisión), que debe completarse en menos de ``--presupuesto-reporte-s``;
+* una mezcla de tráfico (login, lecturas del mapa, ingesta por lotes, listado
+  de alertas y creación de reportes) con concurrencia creciente. Por etapa y
+  endpoint se informa p50/p95/p99, promedio y solicitudes por segundo; el
+  promedio de cada endpoint debe quedar bajo ``--presupuesto-ms``.
+
+Solo usa la biblioteca estándar del lado del cliente. Termina con código 1 si
+algún presupuesto o la tasa de errores se excede.
+
+    python perf/loadtest.py --etapas 1,4,16 --duracion 20 --json carga.json
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+PRESUPUESTO_MS = 500.0
+PRESUPUESTO_REPORTE_S = 5.0
+LECTURAS_REPORTE = 10_000
+LECTURAS_POR_LOTE = 25
+CUERPOS = 20
+# Centro y radio aproximados del área de estudio, en grados.
+CENTRO = (19.4, -99.1)
+RADIO = 1.5
+
+
+class Cliente:
+    """Conexión HTTP persistente; se reabre si el servidor la cierra."""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        partes = urlsplit(url)
+        self.host = partes.hostname
+        self.port = partes.port or 80
+        self.timeout = timeout
+        self._conexion: Optional[http.client.HTTPConnection] = None
+
+    def solicitar(
+        self,
+        metodo: str,
+        ruta: str,
+        json_cuerpo=None,
+        formulario: Optional[Dict] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, bytes]:
+        headers = dict(headers or {})
+        cuerpo = None
+        if json_cuerpo is not None:
+            cuerpo = json.dumps(json_cuerpo).encode()
+            headers["Content-Type"] = "application/json"
+        elif formulario is not None:
+            cuerpo = urlencode(formulario).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        try:
+            return self._enviar(metodo, ruta, cuerpo, headers)
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            # El servidor cerró la conexión persistente entre solicitudes: se reintenta con una nueva.
+            return self._enviar(metodo, ruta, cuerpo, headers)
+
+    def _enviar(self, metodo: str, ruta: str, cuerpo: Optional[bytes], headers: Dict[str, str]) -> Tuple[int, bytes]:
+        if self._conexion is None:
+            self._conexion = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self._conexion.request(metodo, ruta, body=cuerpo, headers=headers)
+            respuesta = self._conexion.getresponse()
+            return respuesta.status, respuesta.read()
+        except (http.client.HTTPException, OSError):
+            self.cerrar()
+            raise
+
+    def json(self, metodo: str, ruta: str, esperado: int = 200, **kwargs):
+        estado, datos = self.solicitar(metodo, ruta, **kwargs)
+        if estado != esperado:
+            raise RuntimeError(f"{metodo} {ruta} respondió {estado}: {datos[:200]!r}")
+        return json.loads(datos) if datos else None
+
+    def cerrar(self):
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+
+
+class Servidor:
+    """Levanta ``main:app`` con uvicorn en un proceso aparte sobre una base temporal."""
+
+    def __init__(self, workers: int = 1, perfil_bd: str = "produccion"):
+        self.workers = workers
+        self.perfil_bd = perfil_bd
+        self._directorio = tempfile.TemporaryDirectory(prefix="observatorio-carga-")
+        self._proceso: Optional[subprocess.Popen] = None
+        self.url = ""
+
+    def __enter__(self) -> "Servidor":
+        directorio = Path(self._directorio.name)
+        with socket.socket() as libre:
+            libre.bind(("127.0.0.1", 0))
+            puerto = libre.getsockname()[1]
+        entorno = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{directorio / 'carga.db'}",
+            "DB_PROFILE": self.perfil_bd,
+            "JOURNAL_DIR": str(directorio / "journal"),
+            "REPORTES_DIR": str(directorio / "reportes"),
+            "SQL_PERFIL": "0",
+        }
+        self._proceso = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--host", "127.0.0.1", "--port", str(puerto),
+                "--workers", str(self.workers), "--log-level", "warning", "--no-access-log",
+            ],
+            cwd=BACKEND_DIR,
+            env=entorno,
+        )
+        self.url = f"http://127.0.0.1:{puerto}"
+        cliente = Cliente(self.url, timeout=1)
+        limite = time.monotonic() + 60
+        while time.monotonic() < limite:
+            if self._proceso.poll() is not None:
+                raise RuntimeError(f"El servidor terminó al arrancar (código {self._proceso.returncode})")
+            try:
+                if cliente.solicitar("GET", "/health")[0] == 200:
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError("El servidor no respondió a /health en 60 s")
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._proceso is not None:
+            self._proceso.terminate()
+            try:
+                self._proceso.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self._proceso.kill()
+                self._proceso.wait()
+        self._directorio.cleanup()
+
+
+class Escenario:
+    """Datos creados antes de la carga y compartidos por todos los hilos."""
+
+    def __init__(self, email: str, password: str, token: str, cuerpos: List[int], sensores: List[int], parametro_id: int):
+        self.email = email
+        self.password = password
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.cuerpos = cuerpos
+        self.sensores = sensores
+        self.parametro_id = parametro_id
+
+
+def preparar(cliente: Cliente, cuerpos: int, semilla: int) -> Escenario:
+    aleatorio = random.Random(semilla)
+    marca = uuid.uuid4().hex[:8]
+    email = f"carga-{marca}@example.com"
+    password = "clave-de-carga-123"
+    cliente.json(
+        "POST",
+        "/auth/register",
+        esperado=201,
+        json_cuerpo={"email": email, "password": password, "full_name": "Prueba de carga", "role": "analista"},
+    )
+    token = cliente.json("POST", "/auth/login", formulario={"username": email, "password": password})["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    ids_cuerpos, ids_sensores = [], []
+    for indice in range(cuerpos):
+        cuerpo = cliente.json(
+            "POST",
+            "/cuerpos-agua",
+            esperado=201,
+            headers=headers,
+            json_cuerpo={
+                "nombre": f"Carga {marca} {indice}",
+                "tipo": aleatorio.choice(["rio", "lago", "laguna", "presa"]),
+                "latitud": CENTRO[0] + aleatorio.uniform(-RADIO, RADIO),
+                "longitud": CENTRO[1] + aleatorio.uniform(-RADIO, RADIO),
+                "contaminacion": aleatorio.choice(["Baja", "Media", "Alta"]),
+                "biodiversidad": aleatorio.choice(["Baja", "Media", "Alta"]),
+            },
+        )
+        sensor = cliente.json(
+            "POST",
+            "/sensores",
+            esperado=201,
+            headers=headers,
+            json_cuerpo={"nombre": f"Sonda {indice}", "tipo": "multiparamétrica", "cuerpo_agua_id": cuerpo["id"]},
+        )
+        ids_cuerpos.append(cuerpo["id"])
+        ids_sensores.append(sensor["id"])
+    parametro = cliente.json(
+        "POST",
+        "/parametros",
+        esperado=201,
+        headers=headers,
+        json_cuerpo={"nombre": f"pH carga {marca}", "unidad": "pH", "valor_minimo": 6.0, "valor_maximo": 9.0},
+    )
+    return Escenario(email, password, token, ids_cuerpos, ids_sensores, parametro["id"])
+
+
+def _lectura(escenario: Escenario, aleatorio: random.Random, indice: int, tomado_en: Optional[datetime] = None) -> Dict:
+    # Alrededor del 3 % queda fuera del rango 6-9 y genera alertas.
+    valor = aleatorio.uniform(9.5, 11.0) if aleatorio.random() < 0.03 else aleatorio.uniform(6.5, 8.5)
+    lectura = {
+        "sensor_id": escenario.sensores[indice],
+        "parametro_id": escenario.parametro_id,
+        "cuerpo_agua_id": escenario.cuerpos[indice],
+        "valor": round(valor, 3),
+        "unidad": "pH",
+    }
+    if tomado_en is not None:
+        lectura["tomado_en"] = tomado_en.isoformat()
+    return lectura
+
+
+def medir_reporte(cliente: Cliente, escenario: Escenario, lecturas: int, semilla: int) -> Dict:
+    """Carga ``lecturas`` en el primer cuerpo y mide cuánto tarda su reporte en completarse."""
+    aleatorio = random.Random(semilla)
+    fin = datetime.utcnow().replace(microsecond=0)
+    inicio = fin - timedelta(days=30)
+    paso = (fin - inicio) / max(lecturas, 1)
+    for desde in range(0, lecturas, 5000):
+        lote = [_lectura(escenario, aleatorio, 0, inicio + paso * i) for i in range(desde, min(desde + 5000, lecturas))]
+        cliente.json("POST", "/lecturas/batch", headers=escenario.headers, json_cuerpo={"lecturas": lote})
+
+    comienzo = time.perf_counter()
+    trabajo = cliente.json(
+        "POST",
+        "/reportes/trabajos",
+        esperado=202,
+        headers=escenario.headers,
+        json_cuerpo={"cuerpo_agua_id": escenario.cuerpos[0], "desde": inicio.isoformat(), "intervalo": "hora"},
+    )
+    while trabajo["estado"] in ("pendiente", "en_proceso"):
+        time.sleep(0.05)
+        trabajo = cliente.json("GET", f"/reportes/trabajos/{trabajo['id']}", headers=escenario.headers)
+    return {"estado": trabajo["estado"], "lecturas": trabajo.get("procesadas"), "segundos": time.perf_counter() - comienzo}
+
+
+Operacion = Callable[[Cliente, Escenario, random.Random], Tuple[int, bytes]]
+
+
+def _login(cliente, escenario, aleatorio):
+    return cliente.solicitar("POST", "/auth/login", formulario={"username": escenario.email, "password": escenario.password})
+
+
+def _mapa(cliente, escenario, aleatorio):
+    lat, lon = CENTRO[0] + aleatorio.uniform(-RADIO, RADIO), CENTRO[1] + aleatorio.uniform(-RADIO, RADIO)
+    bbox = f"{lon - 0.75:.4f},{lat - 0.75:.4f},{lon + 0.75:.4f},{lat + 0.75:.4f}"
+    return cliente.solicitar("GET", f"/mapa/geojson?bbox={bbox}")
+
+
+def _cuerpos(cliente, escenario, aleatorio):
+    return cliente.solicitar("GET", "/cuerpos-agua")
+
+
+def _ingesta(cliente, escenario, aleatorio):
+    lecturas = [
+        _lectura(escenario, aleatorio, aleatorio.randrange(len(escenario.cuerpos))) for _ in range(LECTURAS_POR_LOTE)
+    ]
+    return cliente.solicitar("POST", "/lecturas/batch", headers=escenario.headers, json_cuerpo={"lecturas": lecturas})
+
+
+def _alertas(cliente, escenario, aleatorio):
+    return cliente.solicitar("GET", "/alertas")
+
+
+def _reporte(cliente, escenario, aleatorio):
+    desde = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    cuerpo = {"cuerpo_agua_id": aleatorio.choice(escenario.cuerpos), "desde": desde}
+    return cliente.solicitar("POST", "/reportes/trabajos", headers=escenario.headers, json_cuerpo=cuerpo)
+
+
+# Nombre: (peso en la mezcla, operación).
+MEZCLA: Dict[str, Tuple[int, Operacion]] = {
+    "login": (1, _login),
+    "mapa": (4, _mapa),
+    "cuerpos": (2, _cuerpos),
+    "ingesta": (3, _ingesta),
+    "alertas": (2, _alertas),
+    "reporte": (1, _reporte),
+}
+
+
+def ejecutar_etapa(url: str, escenario: Escenario, concurrencia: int, duracion: float, semilla: int) -> Dict[str, List]:
+    """Corre la mezcla con ``concurrencia`` hilos durante ``duracion`` segundos."""
+    muestras: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+    lock = threading.Lock()
+    nombres = list(MEZCLA)
+    pesos = [MEZCLA[nombre][0] for nombre in nombres]
+    fin = time.monotonic() + duracion
+
+    def trabajador(numero: int):
+        aleatorio = random.Random(semilla * 1000 + numero)
+        cliente = Cliente(url)
+        propias: List[Tuple[str, float, int]] = []
+        try:
+            while time.monotonic() < fin:
+                nombre = aleatorio.choices(nombres, pesos)[0]
+                inicio = time.perf_counter()
+                try:
+                    estado, _ = MEZCLA[nombre][1](cliente, escenario, aleatorio)
+                except (http.client.HTTPException, OSError):
+                    estado = 0
+                propias.append((nombre, time.perf_counter() - inicio, estado))
+        finally:
+            cliente.cerrar()
+            with lock:
+                for nombre, segundos, estado in propias:
+                    muestras[nombre].append((segundos, estado))
+
+    hilos = [threading.Thread(target=trabajador, args=(numero,)) for numero in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return muestras
+
+
+def percentil(ordenados: List[float], fraccion: float) -> float:
+    # Rango más cercano: el valor por debajo del cual queda ``fraccion`` de las muestras.
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados), max(1, math.ceil(fraccion * len(ordenados)))) - 1]
+
+
+def resumir(muestras: Dict[str, List], duracion: float) -> Dict[str, Dict]:
+    resumen = {}
+    for nombre in MEZCLA:
+        filas = muestras.get(nombre, [])
+        tiempos = sorted(segundos * 1000 for segundos, _ in filas)
+        errores = sum(1 for _, estado in filas if not 200 <= estado < 300)
+        resumen[nombre] = {
+            "solicitudes": len(filas),
+            "errores": errores,
+            "por_segundo": round(len(filas) / duracion, 2),
+            "promedio_ms": round(sum(tiempos) / len(tiempos), 2) if tiempos else 0.0,
+            "p50_ms": round(percentil(tiempos, 0.50), 2),
+            "p95_ms": round(percentil(tiempos, 0.95), 2),
+            "p99_ms": round(percentil(tiempos, 0.99), 2),
+        }
+    return resumen
+
+
+def _imprimir_etapa(concurrencia: int, resumen: Dict[str, Dict]):
+    total = sum(fila["por_segundo"] for fila in resumen.values())
+    print(f"\nConcurrencia {concurrencia}: {total:.1f} solicitudes/s")
+    print(f"  {'endpoint':<10} {'n':>7} {'err':>5} {'req/s':>8} {'prom':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for nombre, fila in resumen.items():
+        print(
+            f"  {nombre:<10} {fila['solicitudes']:>7} {fila['errores']:>5} {fila['por_segundo']:>8.1f}"
+            f" {fila['promedio_ms']:>8.1f} {fila['p50_ms']:>8.1f} {fila['p95_ms']:>8.1f} {fila['p99_ms']:>8.1f}"
+        )
+
+
+def incumplimientos(resultado: Dict, presupuesto_ms: float, presupuesto_p95_ms: float, presupuesto_reporte_s: float, max_errores: float) -> List[str]:
+    fallos = []
+    reporte = resultado.get("reporte")
+    if reporte is not None:
+        if reporte["estado"] != "completado":
+            fallos.append(f"reporte de {reporte['lecturas']} lecturas terminó en estado {reporte['estado']}")
+        elif reporte["segundos"] > presupuesto_reporte_s:
+            fallos.append(f"reporte de {reporte['lecturas']} lecturas tardó {reporte['segundos']:.2f} s (> {presupuesto_reporte_s} s)")
+    for etapa in resultado["etapas"]:
+        for nombre, fila in etapa["endpoints"].items():
+            if not fila["solicitudes"]:
+                continue
+            contexto = f"{nombre} con concurrencia {etapa['concurrencia']}"
+            if fila["promedio_ms"] > presupuesto_ms:
+                fallos.append(f"{contexto}: promedio {fila['promedio_ms']} ms (> {presupuesto_ms} ms)")
+            if presupuesto_p95_ms and fila["p95_ms"] > presupuesto_p95_ms:
+                fallos.append(f"{contexto}: p95 {fila['p95_ms']} ms (> {presupuesto_p95_ms} ms)")
+            if fila["errores"] / fila["solicitudes"] > max_errores:
+                fallos.append(f"{contexto}: {fila['errores']} errores de {fila['solicitudes']}")
+    return fallos
+
+
+def _enteros(texto: str) -> List[int]:
+    return [int(parte) for parte in texto.split(",") if parte.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API contra los presupuestos de RNF-03.")
+    parser.add_argument("--url", help="Servidor ya en marcha; si se omite se levanta uno con una base temporal")
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn del servidor levantado")
+    parser.add_argument("--perfil-bd", choices=["desarrollo", "produccion"], default="produccion")
+    parser.add_argument("--etapas", type=_enteros, default=[1, 4, 16], help="Concurrencias a recorrer, p. ej. 1,4,16")
+    parser.add_argument("--duracion", type=float, default=15.0, help="Segundos por etapa")
+    parser.add_argument("--cuerpos", type=int, default=CUERPOS)
+    parser.add_argument("--lecturas-reporte", type=int, default=LECTURAS_REPORTE, help="0 para omitir la medición del reporte")
+    parser.add_argument("--presupuesto-ms", type=float, default=PRESUPUESTO_MS, help="Promedio máximo por endpoint")
+    parser.add_argument("--presupuesto-p95-ms", type=float, default=0.0, help="p95 máximo por endpoint (0 = sin límite)")
+    parser.add_argument("--presupuesto-reporte-s", type=float, default=PRESUPUESTO_REPORTE_S)
+    parser.add_argument("--max-errores", type=float, default=0.01, help="Fracción máxima de respuestas no 2xx")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", dest="salida_json", help="Guarda el resultado completo en este archivo")
+    args = parser.parse_args(argv)
+
+    servidor = None if args.url else Servidor(args.workers, args.perfil_bd)
+    url = args.url or servidor.__enter__().url
+    try:
+        cliente = Cliente(url)
+        escenario = preparar(cliente, args.cuerpos, args.semilla)
+        resultado = {
+            "fecha": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "url": args.url or "local",
+            "perfil_bd": None if args.url else args.perfil_bd,
+            "workers": None if args.url else args.workers,
+            "reporte": None,
+            "etapas": [],
+        }
+        if args.lecturas_reporte:
+            resultado["reporte"] = reporte = medir_reporte(cliente, escenario, args.lecturas_reporte, args.semilla)
+            print(f"Reporte de {reporte['lecturas']} lecturas: {reporte['estado']} en {reporte['segundos']:.2f} s")
+        cliente.cerrar()
+
+        for concurrencia in args.etapas:
+            muestras = ejecutar_etapa(url, escenario, concurrencia, args.duracion, args.semilla)
+            resumen = resumir(muestras, args.duracion)
+            _imprimir_etapa(concurrencia, resumen)
+            resultado["etapas"].append({"concurrencia": concurrencia, "endpoints": resumen})
+    finally:
+        if servidor is not None:
+            servidor.__exit__(None, None, None)
+
+    fallos = incumplimientos(
+        resultado, args.presupuesto_ms, args.presupuesto_p95_ms, args.presupuesto_reporte_s, args.max_errores
+    )
+    resultado["incumplimientos"] = fallos
+    if args.salida_json:
+        Path(args.salida_json).write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+    if fallos:
+        print("\nPresupuestos excedidos:", file=sys.stderr)
+        for fallo in fallos:
+            print(f"  - {fallo}", file=sys.stderr)
+        return 1
+    print("\nTodos los presupuestos se cumplen.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Perfil de SQL por solicitud.
+
+Los eventos de los motores de ``database`` cuentan las consultas, el tiempo en
+la BD y las filas leídas de cada solicitud HTTP. Una sentencia idéntica que se
+repite muchas veces en la misma solicitud suele ser una carga perezosa dentro
+de un bucle (N+1) y se avisa en el log. Las consultas lentas se registran
+siempre, con la forma de sus parámetros (tipos, no valores).
+
+Con ``SQL_PERFIL`` activo (por omisión fuera de producción) cada respuesta lleva
+la cabecera ``X-SQL-Perfil`` y se escribe una línea JSON por solicitud en el
+logger ``perfil_sql``.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from database import DB_PROFILE, async_engine, async_read_engine, engine, read_engine
+
+logger = logging.getLogger("perfil_sql")
+
+PERFIL_ACTIVO = os.getenv("SQL_PERFIL", "0" if DB_PROFILE == "produccion" else "1").lower() in ("1", "true", "si", "sí")
+UMBRAL_LENTA_MS = float(os.getenv("SQL_LENTA_MS", 100))
+UMBRAL_REPETIDAS = int(os.getenv("SQL_REPETICIONES_N1", 5))
+CABECERA = "X-SQL-Perfil"
+MAX_SENTENCIA = 500
+
+_perfil_actual: ContextVar[Optional["PerfilSQL"]] = ContextVar("perfil_sql", default=None)
+
+
+class PerfilSQL:
+    __slots__ = ("consultas", "segundos", "filas", "lentas", "_sentencias")
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+        self.filas = 0
+        self.lentas = 0
+        self._sentencias: Counter = Counter()
+
+    def registrar(self, sentencia: str, segundos: float):
+        self.consultas += 1
+        self.segundos += segundos
+        self._sentencias[sentencia] += 1
+
+    def repetidas(self, umbral: int = UMBRAL_REPETIDAS) -> List[Tuple[str, int]]:
+        return [(sentencia, veces) for sentencia, veces in self._sentencias.most_common() if veces >= umbral]
+
+    def resumen(self) -> Dict:
+        return {
+            "consultas": self.consultas,
+            "tiempo_db_ms": round(self.segundos * 1000, 2),
+            "filas": self.filas,
+            "lentas": self.lentas,
+            "n_mas_1": len(self.repetidas()),
+        }
+
+    def cabecera(self) -> str:
+        return "; ".join(f"{clave}={valor}" for clave, valor in self.resumen().items())
+
+
+def perfil_actual() -> Optional[PerfilSQL]:
+    return _perfil_actual.get()
+
+
+def _abreviar(sentencia: str) -> str:
+    sentencia = " ".join(sentencia.split())
+    if len(sentencia) > MAX_SENTENCIA:
+        return sentencia[:MAX_SENTENCIA] + "…"
+    return sentencia
+
+
+def _forma_parametros(parametros, executemany: bool = False) -> str:
+    """Describe los parámetros por su tipo para no volcar datos al log."""
+    if executemany:
+        parametros = list(parametros or ())
+        if not parametros:
+            return "[]"
+        return f"{len(parametros)} × {_forma_parametros(parametros[0])}"
+    if not parametros:
+        return "()"
+    if isinstance(parametros, dict):
+        return "{" + ", ".join(f"{clave}: {type(valor).__name__}" for clave, valor in parametros.items()) + "}"
+    tipos = [type(valor).__name__ for valor in parametros]
+    if len(tipos) > 10:
+        # Un IN con cientos de valores: basta con cuántos hay de cada tipo.
+        return "(" + ", ".join(f"{nombre} × {veces}" for nombre, veces in Counter(tipos).items()) + ")"
+    return "(" + ", ".join(tipos) + ")"
+
+
+class _ContarFilas:
+    """Envuelve la estrategia de lectura de un resultado y suma las filas que entrega."""
+
+    __slots__ = ("_estrategia", "_perfil")
+
+    def __init__(self, estrategia, perfil: PerfilSQL):
+        self._estrategia = estrategia
+        self._perfil = perfil
+
+    def __getattr__(self, nombre):
+        return getattr(self._estrategia, nombre)
+
+    def fetchone(self, result, dbapi_cursor, hard_close=False):
+        fila = self._estrategia.fetchone(result, dbapi_cursor, hard_close)
+        if fila is not None:
+            self._perfil.filas += 1
+        return fila
+
+    def fetchmany(self, result, dbapi_cursor, size=None):
+        filas = self._estrategia.fetchmany(result, dbapi_cursor, size)
+        self._perfil.filas += len(filas)
+        return filas
+
+    def fetchall(self, result, dbapi_cursor):
+        filas = self._estrategia.fetchall(result, dbapi_cursor)
+        self._perfil.filas += len(filas)
+        return filas
+
+    def yield_per(self, result, dbapi_cursor, num):
+        # yield_per reemplaza la estrategia del resultado; se vuelve a envolver.
+        self._estrategia.yield_per(result, dbapi_cursor, num)
+        if result.cursor_strategy is not self:
+            result.cursor_strategy = _ContarFilas(result.cursor_strategy, self._perfil)
+
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    # En el contexto de ejecución y no en conn.info: si la sentencia falla no hay
+    # after_cursor_execute, y el contexto se descarta con ella.
+    context._perfil_sql_inicio = time.perf_counter()
+
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    segundos = time.perf_counter() - context._perfil_sql_inicio
+    perfil = _perfil_actual.get()
+    if perfil is not None:
+        perfil.registrar(statement, segundos)
+    if segundos * 1000 >= UMBRAL_LENTA_MS:
+        if perfil is not None:
+            perfil.lentas += 1
+        logger.warning(
+            "Consulta lenta (%.1f ms): %s | parámetros: %s",
+            segundos * 1000,
+            _abreviar(statement),
+            _forma_parametros(parameters, executemany),
+        )
+
+
+def _resultado(conn, clauseelement, multiparams, params, execution_options, result):
+    perfil = _perfil_actual.get()
+    if perfil is not None and getattr(result, "returns_rows", False):
+        result.cursor_strategy = _ContarFilas(result.cursor_strategy, perfil)
+
+
+def instrumentar(*motores):
+    """Engancha los eventos de perfil a cada motor síncrono (una sola vez por motor)."""
+    for motor in {id(motor): motor for motor in motores}.values():
+        if event.contains(motor, "before_cursor_execute", _antes):
+            continue
+        event.listen(motor, "before_cursor_execute", _antes)
+        event.listen(motor, "after_cursor_execute", _despues)
+        event.listen(motor, "after_execute", _resultado)
+
+
+class SQLProfilerMiddleware:
+    """Middleware ASGI puro: abre un perfil por solicitud y lo publica al terminar."""
+
+    def __init__(self, app, excluidas=()):
+        self.app = app
+        self.excluidas = frozenset(excluidas)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluidas:
+            await self.app(scope, receive, send)
+            return
+
+        perfil = PerfilSQL()
+        token = _perfil_actual.set(perfil)
+        codigo = 500
+
+        async def enviar(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+                # Refleja lo ejecutado hasta aquí; en las respuestas en streaming lo posterior solo va al log.
+                mensaje["headers"] = [*mensaje.get("headers", ()), (CABECERA.lower().encode(), perfil.cabecera().encode())]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _perfil_actual.reset(token)
+            ruta = getattr(scope.get("route"), "path", None) or scope["path"]
+            for sentencia, veces in perfil.repetidas():
+                logger.warning(
+                    "Posible N+1 en %s %s: %d ejecuciones de %s", scope["method"], ruta, veces, _abreviar(sentencia)
+                )
+            logger.info(
+                json.dumps(
+                    {"metodo": scope["method"], "ruta": ruta, "estado": codigo, **perfil.resumen()},
+                    ensure_ascii=False,
+                )
+            )
+
+
+instrumentar(engine, read_engine, async_engine.sync_engine, async_read_engine.sync_engine)
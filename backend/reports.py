@@ -0,0 +1,526 @@
+"""
+Generación de reportes por cuerpo de agua y rango de fechas (RF-15).
+
+``POST /reportes/trabajos`` encola un trabajo y responde de inmediato. Un pool
+de hilos propio lo ejecuta fuera de los workers de la API:
+
+- las lecturas y alertas se leen en bloques por clave (``tomado_en``, ``id``),
+  de modo que cada consulta es corta y no retiene bloqueos de SQLite;
+- las lecturas se agregan por intervalo y parámetro a medida que llegan, así
+  que en memoria solo vive el intervalo en curso;
+- el resultado (CSV o JSON) se escribe en disco de forma incremental y al
+  terminar se registra una fila en ``reportes`` con el resumen.
+
+Los trabajos viven en memoria del proceso; los archivos se borran pasada la
+retención.
+"""
+
+import csv
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from database import BASE_DIR, ReadSessionLocal, SessionLocal
+from models import Alert, CuerpoDeAguaDB, EnvironmentalParameter, Report, SensorReading
+from rollups import INTERVALOS, inicio_intervalo
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ("csv", "json")
+TIPOS_CONTENIDO = {"csv": "text/csv; charset=utf-8", "json": "application/json"}
+COLUMNAS_CSV = (
+    "seccion",
+    "inicio",
+    "parametro_id",
+    "parametro",
+    "conteo",
+    "minimo",
+    "maximo",
+    "promedio",
+    "desviacion",
+    "fuera_de_rango",
+    "nivel",
+    "mensaje",
+    "resuelta",
+)
+
+
+class ReportEngineBusy(Exception):
+    pass
+
+
+class ReporteCancelado(Exception):
+    pass
+
+
+class _Estadistica:
+    """Conteo, extremos, media y varianza (Welford) en una sola pasada."""
+
+    __slots__ = ("conteo", "media", "m2", "minimo", "maximo", "fuera_de_rango")
+
+    def __init__(self):
+        self.conteo = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        self.fuera_de_rango = 0
+
+    def agregar(self, valor: float, fuera_de_rango: bool):
+        self.conteo += 1
+        delta = valor - self.media
+        self.media += delta / self.conteo
+        self.m2 += delta * (valor - self.media)
+        self.minimo = min(self.minimo, valor)
+        self.maximo = max(self.maximo, valor)
+        self.fuera_de_rango += fuera_de_rango
+
+    def como_dict(self) -> Dict:
+        desviacion = math.sqrt(self.m2 / (self.conteo - 1)) if self.conteo > 1 else 0.0
+        return {
+            "conteo": self.conteo,
+            "minimo": self.minimo,
+            "maximo": self.maximo,
+            "promedio": round(self.media, 6),
+            "desviacion": round(desviacion, 6),
+            "fuera_de_rango": self.fuera_de_rango,
+        }
+
+
+class TrabajoReporte:
+    def __init__(
+        self,
+        cuerpo_agua_id: int,
+        desde: Optional[datetime],
+        hasta: Optional[datetime],
+        parametros: Sequence[int],
+        formato: str,
+        intervalo: str,
+        usuario_id: Optional[int],
+    ):
+        self.id = uuid.uuid4().hex
+        self.cuerpo_agua_id = cuerpo_agua_id
+        self.desde = desde
+        self.hasta = hasta
+        self.parametros = sorted(set(parametros))
+        self.formato = formato
+        self.intervalo = intervalo
+        self.usuario_id = usuario_id
+        self.estado = "pendiente"
+        self.procesadas = 0
+        self.alertas = 0
+        self.creado_en = datetime.utcnow()
+        self.iniciado_en: Optional[datetime] = None
+        self.terminado_en: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.reporte_id: Optional[int] = None
+        self.ruta: Optional[Path] = None
+
+    @property
+    def terminado(self) -> bool:
+        return self.estado in ("completado", "error", "cancelado")
+
+    @property
+    def tipo_contenido(self) -> str:
+        return TIPOS_CONTENIDO[self.formato]
+
+    def como_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "estado": self.estado,
+            "cuerpo_agua_id": self.cuerpo_agua_id,
+            "desde": self.desde,
+            "hasta": self.hasta,
+            "parametros": self.parametros,
+            "formato": self.formato,
+            "intervalo": self.intervalo,
+            "procesadas": self.procesadas,
+            "alertas": self.alertas,
+            "creado_en": self.creado_en,
+            "iniciado_en": self.iniciado_en,
+            "terminado_en": self.terminado_en,
+            "error": self.error,
+            "reporte_id": self.reporte_id,
+        }
+
+
+class _EscritorCSV:
+    def __init__(self, archivo):
+        self._csv = csv.DictWriter(archivo, fieldnames=COLUMNAS_CSV, extrasaction="ignore")
+        self._csv.writeheader()
+
+    def encabezado(self, datos: Dict):
+        pass
+
+    def seccion(self, nombre: str, filas: Iterable[Dict]):
+        for fila in filas:
+            self._csv.writerow({"seccion": nombre, **fila})
+
+    def cerrar(self, resumen: Dict):
+        self.seccion("resumen", resumen["parametros"])
+
+
+class _EscritorJSON:
+    def __init__(self, archivo):
+        self._archivo = archivo
+
+    def _valor(self, valor) -> str:
+        return json.dumps(valor, ensure_ascii=False, separators=(",", ":"), default=_serializar)
+
+    def encabezado(self, datos: Dict):
+        self._archivo.write(self._valor(datos)[:-1])
+
+    def seccion(self, nombre: str, filas: Iterable[Dict]):
+        self._archivo.write(f',"{nombre}":[')
+        separador = ""
+        for fila in filas:
+            self._archivo.write(separador + self._valor(fila))
+            separador = ","
+        self._archivo.write("]")
+
+    def cerrar(self, resumen: Dict):
+        self._archivo.write(',"resumen":' + self._valor(resumen) + "}")
+
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+class ReportEngine:
+    def __init__(
+        self,
+        directorio: Path,
+        session_factory: Callable[[], Session] = SessionLocal,
+        lectura_factory: Callable[[], Session] = ReadSessionLocal,
+        trabajadores: int = 2,
+        max_pendientes: int = 16,
+        tamano_bloque: int = 5000,
+        retencion: timedelta = timedelta(hours=24),
+    ):
+        self.directorio = Path(directorio)
+        self._session_factory = session_factory
+        self._lectura_factory = lectura_factory
+        self.trabajadores = trabajadores
+        self.max_pendientes = max_pendientes
+        self.tamano_bloque = tamano_bloque
+        self.retencion = retencion
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._trabajos: Dict[str, TrabajoReporte] = {}
+        self._detener = threading.Event()
+        self.completados = 0
+        self.fallidos = 0
+        self.rechazados = 0
+
+    def _obtener_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._detener.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.trabajadores, thread_name_prefix="reportes")
+        return self._executor
+
+    def enviar(
+        self,
+        cuerpo_agua_id: int,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        parametros: Sequence[int] = (),
+        formato: str = "csv",
+        intervalo: str = "dia",
+        usuario_id: Optional[int] = None,
+    ) -> TrabajoReporte:
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato no soportado: {formato}")
+        if intervalo not in INTERVALOS:
+            raise ValueError(f"Intervalo no soportado: {intervalo}")
+        self._purgar()
+        trabajo = TrabajoReporte(cuerpo_agua_id, desde, hasta, parametros, formato, intervalo, usuario_id)
+        with self._lock:
+            if sum(not t.terminado for t in self._trabajos.values()) >= self.max_pendientes:
+                self.rechazados += 1
+                raise ReportEngineBusy()
+            self._trabajos[trabajo.id] = trabajo
+            self._obtener_executor().submit(self._ejecutar, trabajo)
+        return trabajo
+
+    def obtener(self, trabajo_id: str) -> Optional[TrabajoReporte]:
+        with self._lock:
+            return self._trabajos.get(trabajo_id)
+
+    def esperar(self, trabajo_id: str, timeout: float = 30.0) -> bool:
+        limite = time.monotonic() + timeout
+        while True:
+            trabajo = self.obtener(trabajo_id)
+            if trabajo is None or trabajo.terminado:
+                return True
+            if time.monotonic() > limite:
+                return False
+            time.sleep(0.01)
+
+    def _ejecutar(self, trabajo: TrabajoReporte):
+        with self._lock:
+            # cerrar() ya lo canceló mientras esperaba en la cola.
+            if trabajo.estado == "cancelado":
+                return
+            trabajo.estado = "en_proceso"
+        trabajo.iniciado_en = datetime.utcnow()
+        try:
+            self.generar(trabajo)
+        except ReporteCancelado:
+            trabajo.estado = "cancelado"
+        except Exception as exc:
+            logger.exception("Reporte %s: error al generar", trabajo.id)
+            trabajo.estado = "error"
+            trabajo.error = str(exc)
+            with self._lock:
+                self.fallidos += 1
+        else:
+            trabajo.estado = "completado"
+            with self._lock:
+                self.completados += 1
+        finally:
+            trabajo.terminado_en = datetime.utcnow()
+
+    def generar(self, trabajo: TrabajoReporte):
+        """Escribe el archivo del trabajo y registra el reporte; lo usa el pool y los tests."""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        ruta = self.directorio / f"{trabajo.id}.{trabajo.formato}"
+        parcial = ruta.with_suffix(ruta.suffix + ".parcial")
+        try:
+            with self._lectura_factory() as db, parcial.open("w", encoding="utf-8", newline="") as archivo:
+                cuerpo = db.get(CuerpoDeAguaDB, trabajo.cuerpo_agua_id)
+                if cuerpo is None:
+                    raise ValueError("Cuerpo de agua no encontrado")
+                parametros = {
+                    fila.id: fila
+                    for fila in db.execute(
+                        select(
+                            EnvironmentalParameter.id,
+                            EnvironmentalParameter.nombre,
+                            EnvironmentalParameter.unidad,
+                            EnvironmentalParameter.valor_minimo,
+                            EnvironmentalParameter.valor_maximo,
+                        )
+                    )
+                }
+                escritor = _EscritorCSV(archivo) if trabajo.formato == "csv" else _EscritorJSON(archivo)
+                escritor.encabezado(
+                    {
+                        "cuerpo_agua": {"id": cuerpo.id, "nombre": cuerpo.nombre},
+                        "desde": trabajo.desde,
+                        "hasta": trabajo.hasta,
+                        "intervalo": trabajo.intervalo,
+                        "parametros": trabajo.parametros,
+                    }
+                )
+                totales: Dict[int, _Estadistica] = {}
+                escritor.seccion("series", self._series(db, trabajo, parametros, totales))
+                niveles: Dict[str, int] = {}
+                escritor.seccion("alertas", self._alertas(db, trabajo, parametros, niveles))
+                resumen = {
+                    "lecturas": trabajo.procesadas,
+                    "alertas": trabajo.alertas,
+                    "alertas_por_nivel": niveles,
+                    "parametros": [
+                        {"parametro_id": parametro_id, "parametro": _nombre(parametros, parametro_id), **estadistica.como_dict()}
+                        for parametro_id, estadistica in sorted(totales.items())
+                    ],
+                }
+                escritor.cerrar(resumen)
+            parcial.replace(ruta)
+        except BaseException:
+            parcial.unlink(missing_ok=True)
+            raise
+        trabajo.ruta = ruta
+
+        with self._session_factory() as db:
+            reporte = Report(
+                cuerpo_agua_id=cuerpo.id,
+                usuario_id=trabajo.usuario_id,
+                titulo=_titulo(cuerpo.nombre, trabajo),
+                contenido=_contenido(resumen, parametros, trabajo),
+                formato=trabajo.formato,
+            )
+            db.add(reporte)
+            db.commit()
+            trabajo.reporte_id = reporte.id
+
+    def _bloques(self, db: Session, consulta, fecha, clave) -> Iterator[List]:
+        """Recorre ``consulta`` por bloques ordenados por (fecha, clave)."""
+        ultimo = None
+        while True:
+            if self._detener.is_set():
+                raise ReporteCancelado()
+            paginada = consulta
+            if ultimo is not None:
+                paginada = paginada.where(tuple_(fecha, clave) > tuple_(*ultimo))
+            filas = db.execute(paginada.order_by(fecha, clave).limit(self.tamano_bloque)).all()
+            if not filas:
+                return
+            yield filas
+            if len(filas) < self.tamano_bloque:
+                return
+            ultimo = (filas[-1][0], filas[-1][1])
+
+    def _series(
+        self, db: Session, trabajo: TrabajoReporte, parametros: Dict, totales: Dict[int, _Estadistica]
+    ) -> Iterator[Dict]:
+        consulta = select(
+            SensorReading.tomado_en, SensorReading.id, SensorReading.parametro_id, SensorReading.valor
+        ).where(SensorReading.cuerpo_agua_id == trabajo.cuerpo_agua_id)
+        if trabajo.desde is not None:
+            consulta = consulta.where(SensorReading.tomado_en >= trabajo.desde)
+        if trabajo.hasta is not None:
+            consulta = consulta.where(SensorReading.tomado_en < trabajo.hasta)
+        if trabajo.parametros:
+            consulta = consulta.where(SensorReading.parametro_id.in_(trabajo.parametros))
+
+        actual: Optional[datetime] = None
+        abiertas: Dict[int, _Estadistica] = {}
+
+        def cerrar_intervalo():
+            for parametro_id, estadistica in sorted(abiertas.items()):
+                yield {
+                    "inicio": actual,
+                    "parametro_id": parametro_id,
+                    "parametro": _nombre(parametros, parametro_id),
+                    **estadistica.como_dict(),
+                }
+            abiertas.clear()
+
+        for filas in self._bloques(db, consulta, SensorReading.tomado_en, SensorReading.id):
+            for tomado_en, _, parametro_id, valor in filas:
+                inicio = inicio_intervalo(tomado_en, trabajo.intervalo)
+                if inicio != actual:
+                    yield from cerrar_intervalo()
+                    actual = inicio
+                parametro = parametros.get(parametro_id)
+                fuera = parametro is not None and (
+                    (parametro.valor_minimo is not None and valor < parametro.valor_minimo)
+                    or (parametro.valor_maximo is not None and valor > parametro.valor_maximo)
+                )
+                estadistica = abiertas.get(parametro_id)
+                if estadistica is None:
+                    estadistica = abiertas[parametro_id] = _Estadistica()
+                estadistica.agregar(valor, fuera)
+                total = totales.get(parametro_id)
+                if total is None:
+                    total = totales[parametro_id] = _Estadistica()
+                total.agregar(valor, fuera)
+            trabajo.procesadas += len(filas)
+        yield from cerrar_intervalo()
+
+    def _alertas(self, db: Session, trabajo: TrabajoReporte, parametros: Dict, niveles: Dict[str, int]) -> Iterator[Dict]:
+        consulta = select(Alert.creada_en, Alert.id, Alert.parametro_id, Alert.nivel, Alert.mensaje, Alert.resuelta).where(
+            Alert.cuerpo_agua_id == trabajo.cuerpo_agua_id
+        )
+        if trabajo.desde is not None:
+            consulta = consulta.where(Alert.creada_en >= trabajo.desde)
+        if trabajo.hasta is not None:
+            consulta = consulta.where(Alert.creada_en < trabajo.hasta)
+        if trabajo.parametros:
+            consulta = consulta.where(Alert.parametro_id.in_(trabajo.parametros))
+        for filas in self._bloques(db, consulta, Alert.creada_en, Alert.id):
+            for creada_en, _, parametro_id, nivel, mensaje, resuelta in filas:
+                niveles[nivel] = niveles.get(nivel, 0) + 1
+                yield {
+                    "inicio": creada_en,
+                    "parametro_id": parametro_id,
+                    "parametro": _nombre(parametros, parametro_id),
+                    "nivel": nivel,
+                    "mensaje": mensaje,
+                    "resuelta": resuelta,
+                }
+            trabajo.alertas += len(filas)
+
+    def _purgar(self):
+        limite = datetime.utcnow() - self.retencion
+        with self._lock:
+            vencidos = [t for t in self._trabajos.values() if t.terminado and t.terminado_en < limite]
+            for trabajo in vencidos:
+                del self._trabajos[trabajo.id]
+        for trabajo in vencidos:
+            if trabajo.ruta is not None:
+                trabajo.ruta.unlink(missing_ok=True)
+        # Archivos de trabajos de ejecuciones anteriores del servidor.
+        if self.directorio.is_dir():
+            corte = time.time() - self.retencion.total_seconds()
+            for ruta in self.directorio.iterdir():
+                if ruta.is_file() and ruta.stat().st_mtime < corte:
+                    ruta.unlink(missing_ok=True)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            estados: Dict[str, int] = {}
+            for trabajo in self._trabajos.values():
+                estados[trabajo.estado] = estados.get(trabajo.estado, 0) + 1
+            return {
+                "trabajadores": self.trabajadores,
+                "max_pendientes": self.max_pendientes,
+                "trabajos": estados,
+                "completados": self.completados,
+                "fallidos": self.fallidos,
+                "rechazados": self.rechazados,
+            }
+
+    def cerrar(self):
+        """Cancela los trabajos en cola y los que estén en curso, y espera a los hilos."""
+        self._detener.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+            for trabajo in self._trabajos.values():
+                if trabajo.estado == "pendiente":
+                    trabajo.estado = "cancelado"
+                    trabajo.terminado_en = datetime.utcnow()
+        if executor is not None:
+            # Sin cancel_futures (Python 3.9+): los trabajos en cola ya están cancelados y
+            # _ejecutar los descarta sin generar nada.
+            executor.shutdown(wait=True)
+
+
+def _nombre(parametros: Dict, parametro_id: Optional[int]) -> Optional[str]:
+    parametro = parametros.get(parametro_id)
+    return parametro.nombre if parametro is not None else None
+
+
+def _titulo(nombre_cuerpo: str, trabajo: TrabajoReporte) -> str:
+    desde = trabajo.desde.date().isoformat() if trabajo.desde else "inicio"
+    hasta = trabajo.hasta.date().isoformat() if trabajo.hasta else "hoy"
+    return f"Reporte {nombre_cuerpo} ({desde} a {hasta})"[:255]
+
+
+def _contenido(resumen: Dict, parametros: Dict, trabajo: TrabajoReporte) -> str:
+    lineas = [f"Lecturas: {resumen['lecturas']}. Alertas: {resumen['alertas']}."]
+    for fila in resumen["parametros"]:
+        parametro = parametros.get(fila["parametro_id"])
+        unidad = f" {parametro.unidad}" if parametro is not None else ""
+        lineas.append(
+            f"{fila['parametro'] or fila['parametro_id']}: {fila['conteo']} lecturas, promedio {fila['promedio']:.3f}{unidad} "
+            f"(mín. {fila['minimo']:.3f}, máx. {fila['maximo']:.3f}), {fila['fuera_de_rango']} fuera de rango."
+        )
+    for nivel, conteo in sorted(resumen["alertas_por_nivel"].items()):
+        lineas.append(f"Alertas {nivel}: {conteo}.")
+    lineas.append(f"Trabajo {trabajo.id}, intervalo {trabajo.intervalo}.")
+    return "\n".join(lineas)
+
+
+_TRABAJADORES = int(os.getenv("REPORTES_TRABAJADORES", 2))
+report_engine = ReportEngine(
+    Path(os.getenv("REPORTES_DIR", BASE_DIR / "reportes_generados")),
+    trabajadores=_TRABAJADORES,
+    max_pendientes=int(os.getenv("REPORTES_MAX_PENDIENTES", _TRABAJADORES * 8)),
+    tamano_bloque=int(os.getenv("REPORTES_BLOQUE", 5000)),
+    retencion=timedelta(hours=float(os.getenv("REPORTES_RETENCION_HORAS", 24))),
+)
@@ -0,0 +1,161 @@
+"""
+Caché de respuestas de los listados de lectura frecuente.
+
+Guarda el JSON ya serializado de ``/cuerpos-agua``, ``/sensores``,
+``/parametros`` y ``/estadisticas`` con su ETag, responde 304 a
+``If-None-Match`` y descarta cada entrada cuando se confirman cambios en las
+tablas de las que depende. Los totales de ``/estadisticas`` se cuentan una vez
+y luego se ajustan con las filas insertadas y eliminadas de cada transacción.
+
+La caché es local al proceso: no ve escrituras hechas por otros procesos.
+"""
+
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from database import CambiosConfirmados, register_change_listener
+from models import Alert, CuerpoDeAguaDB, EnvironmentalParameter, Sensor
+
+
+class EntradaCache(NamedTuple):
+    cuerpo: bytes
+    etag: str
+
+
+def _etag(cuerpo: bytes) -> str:
+    return '"' + hashlib.blake2b(cuerpo, digest_size=16).hexdigest() + '"'
+
+
+def entrada_cache(cuerpo: bytes) -> EntradaCache:
+    """Entrada con su ETag, también para respuestas que se arman con partes en caché."""
+    return EntradaCache(cuerpo, _etag(cuerpo))
+
+
+def _coincide(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato in ("*", etag):
+            return True
+    return False
+
+
+class ResponseCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas: Dict[str, EntradaCache] = {}
+        self._claves_por_tabla: Dict[str, set] = {}
+        # Evita guardar una respuesta construida antes de un cambio concurrente.
+        self._generaciones: Dict[str, int] = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.no_modificadas = 0
+
+    def generacion(self, tablas: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._generaciones.get(tabla, 0) for tabla in tablas)
+
+    def obtener(self, clave: str) -> Optional[EntradaCache]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+            return entrada
+
+    def guardar(self, clave: str, tablas: Sequence[str], cuerpo: bytes, generacion: Tuple[int, ...]) -> EntradaCache:
+        entrada = entrada_cache(cuerpo)
+        with self._lock:
+            if generacion == tuple(self._generaciones.get(tabla, 0) for tabla in tablas):
+                self._entradas[clave] = entrada
+                for tabla in tablas:
+                    self._claves_por_tabla.setdefault(tabla, set()).add(clave)
+        return entrada
+
+    def invalidar_tablas(self, tablas: Iterable[str]):
+        with self._lock:
+            for tabla in tablas:
+                self._generaciones[tabla] = self._generaciones.get(tabla, 0) + 1
+                for clave in self._claves_por_tabla.pop(tabla, ()):
+                    self._entradas.pop(clave, None)
+
+    def responder(self, request: Request, entrada: EntradaCache) -> Response:
+        cabeceras = {"ETag": entrada.etag, "Cache-Control": "no-cache"}
+        if _coincide(request.headers.get("if-none-match"), entrada.etag):
+            with self._lock:
+                self.no_modificadas += 1
+            return Response(status_code=304, headers=cabeceras)
+        return Response(content=entrada.cuerpo, media_type="application/json", headers=cabeceras)
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "no_modificadas": self.no_modificadas,
+            }
+
+    def _al_confirmar(self, cambios: CambiosConfirmados):
+        self.invalidar_tablas(cambios.tablas())
+
+
+class ContadoresTablas:
+    """Total de filas por tabla, contado una vez y mantenido con los cambios confirmados."""
+
+    def __init__(self, modelos):
+        self._modelos = {modelo.__tablename__: modelo for modelo in modelos}
+        self._lock = threading.Lock()
+        self._totales: Optional[Dict[str, int]] = None
+        self._generacion = 0
+        self.actualizado_en = datetime.utcnow()
+
+    def totales(self, db: Session) -> Dict[str, int]:
+        with self._lock:
+            if self._totales is not None:
+                return dict(self._totales)
+            generacion = self._generacion
+        totales = {
+            tabla: db.execute(select(func.count()).select_from(modelo)).scalar()
+            for tabla, modelo in self._modelos.items()
+        }
+        with self._lock:
+            # Si se confirmó un cambio mientras se contaba, se vuelve a contar la próxima vez.
+            if generacion == self._generacion:
+                self._totales = totales
+                self.actualizado_en = datetime.utcnow()
+        return totales
+
+    def invalidar(self):
+        with self._lock:
+            self._generacion += 1
+            self._totales = None
+
+    def _al_confirmar(self, cambios: CambiosConfirmados):
+        tablas = cambios.tablas() & self._modelos.keys()
+        if not tablas:
+            return
+        with self._lock:
+            self._generacion += 1
+            self.actualizado_en = datetime.utcnow()
+            if self._totales is None:
+                return
+            for tabla in tablas:
+                self._totales[tabla] += len(cambios.insertados.get(tabla, ())) - len(cambios.eliminados.get(tabla, ()))
+
+
+response_cache = ResponseCache()
+register_change_listener(response_cache._al_confirmar)
+
+contadores_estadisticas = ContadoresTablas((CuerpoDeAguaDB, Sensor, Alert, EnvironmentalParameter))
+register_change_listener(contadores_estadisticas._al_confirmar)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Agregados por intervalo (hora/día) de las lecturas de sensores.
+
+``lecturas_agregadas`` guarda conteo, suma, mínimo y máximo por cuerpo de agua,
+parámetro e intervalo. Se actualiza en la misma transacción que inserta las
+lecturas y puede reconstruirse para cargas históricas:
+
+    python rollups.py --desde 2024-01-01 --hasta 2024-02-01
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import ReadingRollup, SensorReading
+
+INTERVALOS = ("hora", "dia")
+
+# Formato con el que SQLAlchemy guarda DateTime en SQLite; los agregados
+# reconstruidos en SQL deben coincidir con los insertados desde Python.
+_FORMATO_SQLITE = {"hora": "%Y-%m-%d %H:00:00.000000", "dia": "%Y-%m-%d 00:00:00.000000"}
+_TRUNC_POSTGRES = {"hora": "hour", "dia": "day"}
+
+
+def inicio_intervalo(tomado_en: datetime, intervalo: str) -> datetime:
+    if intervalo == "hora":
+        return tomado_en.replace(minute=0, second=0, microsecond=0)
+    return tomado_en.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _acumular(filas: List[Dict]) -> Dict[Tuple, List[float]]:
+    acumulados: Dict[Tuple, List[float]] = {}
+    for fila in filas:
+        valor = fila["valor"]
+        for intervalo in INTERVALOS:
+            clave = (intervalo, inicio_intervalo(fila["tomado_en"], intervalo), fila["cuerpo_agua_id"], fila["parametro_id"])
+            actual = acumulados.get(clave)
+            if actual is None:
+                acumulados[clave] = [1, valor, valor, valor]
+            else:
+                actual[0] += 1
+                actual[1] += valor
+                actual[2] = min(actual[2], valor)
+                actual[3] = max(actual[3], valor)
+    return acumulados
+
+
+def _insert_dialecto(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(ReadingRollup), func.least, func.greatest
+    return sqlite.insert(ReadingRollup), func.min, func.max
+
+
+def actualizar_agregados(db: Session, filas: List[Dict]):
+    """Suma las lecturas nuevas a sus agregados (upsert por intervalo)."""
+    acumulados = _acumular(filas)
+    if not acumulados:
+        return
+
+    stmt, menor, mayor = _insert_dialecto(db)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["intervalo", "cuerpo_agua_id", "parametro_id", "inicio"],
+        set_={
+            "conteo": ReadingRollup.conteo + stmt.excluded.conteo,
+            "suma": ReadingRollup.suma + stmt.excluded.suma,
+            "minimo": menor(ReadingRollup.minimo, stmt.excluded.minimo),
+            "maximo": mayor(ReadingRollup.maximo, stmt.excluded.maximo),
+        },
+    )
+    db.execute(
+        stmt,
+        [
+            {
+                "intervalo": intervalo,
+                "inicio": inicio,
+                "cuerpo_agua_id": cuerpo_agua_id,
+                "parametro_id": parametro_id,
+                "conteo": conteo,
+                "suma": suma,
+                "minimo": minimo,
+                "maximo": maximo,
+            }
+            for (intervalo, inicio, cuerpo_agua_id, parametro_id), (conteo, suma, minimo, maximo) in acumulados.items()
+        ],
+    )
+
+
+def _expresion_inicio(db: Session, intervalo: str):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(_TRUNC_POSTGRES[intervalo], SensorReading.tomado_en)
+    return func.strftime(_FORMATO_SQLITE[intervalo], SensorReading.tomado_en)
+
+
+def reconstruir_agregados(db: Session, desde: Optional[datetime] = None, hasta: Optional[datetime] = None) -> int:
+    """Recalcula los agregados desde las lecturas crudas en días completos.
+
+    Devuelve el número de filas de agregados generadas. No confirma la transacción.
+    """
+    if desde is not None:
+        desde = inicio_intervalo(desde, "dia")
+    if hasta is not None and hasta != inicio_intervalo(hasta, "dia"):
+        hasta = inicio_intervalo(hasta, "dia") + timedelta(days=1)
+
+    borrado = delete(ReadingRollup)
+    if desde is not None:
+        borrado = borrado.where(ReadingRollup.inicio >= desde)
+    if hasta is not None:
+        borrado = borrado.where(ReadingRollup.inicio < hasta)
+    db.execute(borrado)
+
+    generadas = 0
+    for intervalo in INTERVALOS:
+        inicio = _expresion_inicio(db, intervalo)
+        origen = select(
+            literal(intervalo),
+            inicio,
+            SensorReading.cuerpo_agua_id,
+            SensorReading.parametro_id,
+            func.count(),
+            func.sum(SensorReading.valor),
+            func.min(SensorReading.valor),
+            func.max(SensorReading.valor),
+        ).group_by(inicio, SensorReading.cuerpo_agua_id, SensorReading.parametro_id)
+        if desde is not None:
+            origen = origen.where(SensorReading.tomado_en >= desde)
+        if hasta is not None:
+            origen = origen.where(SensorReading.tomado_en < hasta)
+
+        resultado = db.execute(
+            insert(ReadingRollup).from_select(
+                ["intervalo", "inicio", "cuerpo_agua_id", "parametro_id", "conteo", "suma", "minimo", "maximo"],
+                origen,
+            )
+        )
+        generadas += max(resultado.rowcount, 0)
+    return generadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruye los agregados de lecturas por hora y día.")
+    parser.add_argument("--desde", type=datetime.fromisoformat, default=None, help="Fecha inicial (incluida)")
+    parser.add_argument("--hasta", type=datetime.fromisoformat, default=None, help="Fecha final (excluida)")
+    args = parser.parse_args()
+
+    from database import SessionLocal, create_tables
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        generadas = reconstruir_agregados(db, args.desde, args.hasta)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    print(f"📊 Agregados reconstruidos: {generadas} filas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Búsqueda de texto completo (FTS5) sobre cuerpos de agua, sensores, zonas
+protegidas y reportes.
+
+Cada tabla tiene un índice FTS5 de contenido externo (no duplica el texto)
+con el tokenizador ``unicode61 remove_diacritics 2``, así que la búsqueda no
+distingue mayúsculas ni acentos. Los triggers de inserción, edición y borrado
+mantienen los índices sincronizados. En otros motores se recurre a ``ILIKE``
+sin ranking.
+"""
+
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.orm import Session
+
+from models import CuerpoDeAguaDB, ProtectedZone, Report, Sensor
+
+
+class IndiceTexto(NamedTuple):
+    tipo: str
+    modelo: type
+    columnas: Tuple[str, ...]
+    pesos: Tuple[float, ...]
+
+    @property
+    def tabla(self) -> str:
+        return self.modelo.__tablename__
+
+    @property
+    def fts(self) -> str:
+        return f"{self.tabla}_fts"
+
+
+# La primera columna de cada índice es el título del resultado.
+INDICES = (
+    IndiceTexto("cuerpo_agua", CuerpoDeAguaDB, ("nombre", "descripcion"), (10.0, 1.0)),
+    IndiceTexto("sensor", Sensor, ("nombre", "descripcion"), (10.0, 1.0)),
+    IndiceTexto("zona", ProtectedZone, ("nombre", "categoria", "descripcion"), (10.0, 3.0, 1.0)),
+    IndiceTexto("reporte", Report, ("titulo", "contenido"), (10.0, 1.0)),
+)
+TIPOS_BUSQUEDA = tuple(indice.tipo for indice in INDICES)
+
+_PALABRA = re.compile(r"\w+", re.UNICODE)
+
+
+def crear_indices_busqueda(connection) -> bool:
+    """Crea las tablas FTS5 y sus triggers; devuelve False si el motor no es SQLite."""
+    if connection.dialect.name != "sqlite":
+        return False
+    for indice in INDICES:
+        tabla, fts = indice.tabla, indice.fts
+        columnas = ", ".join(indice.columnas)
+        nuevas = ", ".join(f"NEW.{columna}" for columna in indice.columnas)
+        viejas = ", ".join(f"OLD.{columna}" for columna in indice.columnas)
+        existia = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+        ).first()
+        connection.exec_driver_sql(
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {columnas}, content='{tabla}', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )"""
+        )
+        connection.exec_driver_sql(
+            f"""CREATE TRIGGER IF NOT EXISTS {fts}_insertar AFTER INSERT ON {tabla}
+            BEGIN
+                INSERT INTO {fts}(rowid, {columnas}) VALUES (NEW.id, {nuevas});
+            END"""
+        )
+        connection.exec_driver_sql(
+            f"""CREATE TRIGGER IF NOT EXISTS {fts}_actualizar AFTER UPDATE OF {columnas} ON {tabla}
+            BEGIN
+                INSERT INTO {fts}({fts}, rowid, {columnas}) VALUES ('delete', OLD.id, {viejas});
+                INSERT INTO {fts}(rowid, {columnas}) VALUES (NEW.id, {nuevas});
+            END"""
+        )
+        connection.exec_driver_sql(
+            f"""CREATE TRIGGER IF NOT EXISTS {fts}_eliminar AFTER DELETE ON {tabla}
+            BEGIN
+                INSERT INTO {fts}({fts}, rowid, {columnas}) VALUES ('delete', OLD.id, {viejas});
+            END"""
+        )
+        if not existia:
+            connection.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return True
+
+
+def _palabras(texto: str) -> List[str]:
+    return _PALABRA.findall(texto)
+
+
+def consulta_fts(texto: str, prefijo: bool = True) -> Optional[str]:
+    """Convierte el texto del usuario en una consulta FTS5 sin operadores.
+
+    Cada palabra va entre comillas; la última admite prefijo para buscar
+    mientras se escribe. Devuelve None si no hay palabras.
+    """
+    palabras = _palabras(texto)
+    if not palabras:
+        return None
+    terminos = [f'"{palabra}"' for palabra in palabras]
+    if prefijo:
+        terminos[-1] += "*"
+    return " ".join(terminos)
+
+
+def _usa_fts(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def buscar(db: Session, texto: str, tipos: Sequence[str] = TIPOS_BUSQUEDA, limite: int = 20) -> List[Dict]:
+    """Resultados de todos los tipos pedidos, del más al menos relevante."""
+    consulta = consulta_fts(texto)
+    if consulta is None:
+        return []
+    resultados = []
+    for indice in INDICES:
+        if indice.tipo not in tipos:
+            continue
+        if _usa_fts(db):
+            pesos = ", ".join(str(peso) for peso in indice.pesos)
+            filas = db.execute(
+                text(
+                    f"""SELECT rowid, bm25({indice.fts}, {pesos}) AS puntuacion,
+                        {indice.columnas[0]} AS titulo,
+                        snippet({indice.fts}, -1, '[', ']', '…', 12) AS fragmento
+                    FROM {indice.fts} WHERE {indice.fts} MATCH :consulta
+                    ORDER BY puntuacion LIMIT :limite"""
+                ),
+                {"consulta": consulta, "limite": limite},
+            )
+        else:
+            filas = _buscar_sin_fts(db, indice, texto, limite)
+        for fila in filas:
+            resultados.append(
+                {
+                    "tipo": indice.tipo,
+                    "id": fila.rowid,
+                    "titulo": fila.titulo,
+                    "fragmento": fila.fragmento,
+                    # bm25 es más relevante cuanto más negativo; se expone positivo.
+                    "puntuacion": round(-fila.puntuacion, 4),
+                }
+            )
+    resultados.sort(key=lambda resultado: resultado["puntuacion"], reverse=True)
+    return resultados[:limite]
+
+
+def _buscar_sin_fts(db: Session, indice: IndiceTexto, texto: str, limite: int):
+    modelo = indice.modelo
+    columnas = [getattr(modelo, columna) for columna in indice.columnas]
+    condiciones = [or_(*(columna.ilike(f"%{palabra}%") for columna in columnas)) for palabra in _palabras(texto)]
+    titulo = columnas[0]
+    return db.execute(
+        select(
+            modelo.id.label("rowid"),
+            text("0.0 AS puntuacion"),
+            titulo.label("titulo"),
+            titulo.label("fragmento"),
+        )
+        .where(*condiciones)
+        .limit(limite)
+    )
+
+
+def candidatos_por_nombre(db: Session, nombre: str) -> List[Tuple[int, str]]:
+    """Cuerpos de agua cuyo nombre contiene las mismas palabras que ``nombre``.
+
+    Sirve para comprobar duplicados con el índice en lugar de recorrer la tabla;
+    el llamador compara después el nombre exacto.
+    """
+    palabras = _palabras(nombre)
+    if not palabras or not _usa_fts(db):
+        filas = db.execute(
+            select(CuerpoDeAguaDB.id, CuerpoDeAguaDB.nombre).where(CuerpoDeAguaDB.nombre.ilike(nombre)).limit(10)
+        )
+        return [tuple(fila) for fila in filas]
+    frase = '"' + " ".join(palabras) + '"'
+    filas = db.execute(
+        text(
+            """SELECT c.id, c.nombre FROM cuerpos_agua_fts f JOIN cuerpos_agua c ON c.id = f.rowid
+            WHERE cuerpos_agua_fts MATCH :consulta"""
+        ),
+        {"consulta": f"nombre : {frase}"},
+    )
+    return [tuple(fila) for fila in filas]
+
+
+def mismo_nombre(a: str, b: str) -> bool:
+    return " ".join(a.split()).casefold() == " ".join(b.split()).casefold()
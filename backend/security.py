@@ -0,0 +1,47 @@
+"""
+Hashing de contraseñas con PBKDF2-SHA256 (RNF-02).
+
+Módulo sin dependencias de la aplicación para que los procesos de
+``password_pool`` puedan importarlo sin cargar FastAPI ni la base de datos.
+"""
+
+import base64
+import hashlib
+import hmac
+import secrets
+
+PBKDF2_ITERATIONS = 600_000
+SALT_BYTES = 16
+
+
+def _encode_bytes(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("utf-8")
+
+
+def _decode_bytes(raw: str) -> bytes:
+    return base64.b64decode(raw.encode("utf-8"))
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        algorithm, iterations, salt_b64, hash_b64 = hashed_password.split("$")
+    except ValueError:
+        return False
+
+    if algorithm != "pbkdf2_sha256":
+        return False
+
+    salt = _decode_bytes(salt_b64)
+    stored_hash = _decode_bytes(hash_b64)
+    new_hash = hashlib.pbkdf2_hmac(
+        "sha256", plain_password.encode("utf-8"), salt, int(iterations)
+    )
+    return hmac.compare_digest(stored_hash, new_hash)
+
+
+def get_password_hash(password: str) -> str:
+    salt = secrets.token_bytes(SALT_BYTES)
+    derived = hashlib.pbkdf2_hmac(
+        "sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS
+    )
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_encode_bytes(salt)}${_encode_bytes(derived)}"
@@ -0,0 +1,283 @@
+"""
+Consultas por área visible del mapa (RF-07).
+
+En SQLite, ``cuerpos_agua`` y ``sensores`` tienen cada una una tabla virtual
+R*Tree con sus coordenadas, mantenida por triggers en inserciones, ediciones y
+borrados. Una consulta por bbox recorre solo los nodos del árbol que tocan el
+área. En otros motores se filtra directamente por ``latitud``/``longitud``.
+"""
+
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, Float, Integer, MetaData, Table, and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from ingest import MAX_PARAMETROS_IN
+from models import Alert, CuerpoDeAguaDB, Sensor
+from thresholds import NIVELES
+
+CAPAS = ("cuerpos", "sensores")
+DECIMALES_COORDENADAS = 6
+
+# Fuera de Base.metadata: create_all no sabe crear tablas virtuales.
+_rtree_metadata = MetaData()
+
+
+def _tabla_rtree(nombre: str) -> Table:
+    return Table(
+        nombre,
+        _rtree_metadata,
+        Column("id", Integer, primary_key=True),
+        Column("min_lat", Float),
+        Column("max_lat", Float),
+        Column("min_lon", Float),
+        Column("max_lon", Float),
+    )
+
+
+RTREES = {
+    CuerpoDeAguaDB.__tablename__: _tabla_rtree("cuerpos_agua_rtree"),
+    Sensor.__tablename__: _tabla_rtree("sensores_rtree"),
+}
+
+
+class BBox:
+    def __init__(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float):
+        self.min_lon = min_lon
+        self.min_lat = min_lat
+        self.max_lon = max_lon
+        self.max_lat = max_lat
+
+    @classmethod
+    def desde_texto(cls, texto: str) -> "BBox":
+        """Interpreta ``min_lon,min_lat,max_lon,max_lat`` (orden de GeoJSON y Leaflet)."""
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(valor) for valor in texto.split(","))
+        except ValueError:
+            raise ValueError("bbox debe ser min_lon,min_lat,max_lon,max_lat")
+        if not (-90 <= min_lat <= max_lat <= 90):
+            raise ValueError("Latitudes del bbox fuera de rango")
+        if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            raise ValueError("Longitudes del bbox fuera de rango")
+        return cls(min_lon, min_lat, max_lon, max_lat)
+
+    @property
+    def cruza_antimeridiano(self) -> bool:
+        return self.min_lon > self.max_lon
+
+    def condicion(self, latitud, longitud):
+        if self.cruza_antimeridiano:
+            en_longitud = or_(longitud >= self.min_lon, longitud <= self.max_lon)
+        else:
+            en_longitud = longitud.between(self.min_lon, self.max_lon)
+        return and_(latitud.between(self.min_lat, self.max_lat), en_longitud)
+
+    def condicion_rtree(self, rtree: Table):
+        if self.cruza_antimeridiano:
+            en_longitud = or_(rtree.c.max_lon >= self.min_lon, rtree.c.min_lon <= self.max_lon)
+        else:
+            en_longitud = and_(rtree.c.max_lon >= self.min_lon, rtree.c.min_lon <= self.max_lon)
+        return and_(rtree.c.max_lat >= self.min_lat, rtree.c.min_lat <= self.max_lat, en_longitud)
+
+
+def crear_indices_espaciales(connection) -> bool:
+    """Crea las tablas R*Tree y sus triggers; devuelve False si el motor no es SQLite."""
+    if connection.dialect.name != "sqlite":
+        return False
+    for tabla, rtree in RTREES.items():
+        nombre = rtree.name
+        existia = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (nombre,)
+        ).first()
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {nombre} USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+        )
+        con_coordenadas = "NEW.latitud IS NOT NULL AND NEW.longitud IS NOT NULL"
+        connection.exec_driver_sql(
+            f"""CREATE TRIGGER IF NOT EXISTS {nombre}_insertar AFTER INSERT ON {tabla}
+            WHEN {con_coordenadas}
+            BEGIN
+                INSERT OR REPLACE INTO {nombre} VALUES (NEW.id, NEW.latitud, NEW.latitud, NEW.longitud, NEW.longitud);
+            END"""
+        )
+        connection.exec_driver_sql(
+            f"""CREATE TRIGGER IF NOT EXISTS {nombre}_actualizar AFTER UPDATE OF latitud, longitud ON {tabla}
+            BEGIN
+                DELETE FROM {nombre} WHERE id = OLD.id;
+                INSERT INTO {nombre} SELECT NEW.id, NEW.latitud, NEW.latitud, NEW.longitud, NEW.longitud
+                WHERE {con_coordenadas};
+            END"""
+        )
+        connection.exec_driver_sql(
+            f"""CREATE TRIGGER IF NOT EXISTS {nombre}_eliminar AFTER DELETE ON {tabla}
+            BEGIN
+                DELETE FROM {nombre} WHERE id = OLD.id;
+            END"""
+        )
+        if not existia:
+            # Bases creadas antes del índice: se cargan las filas que ya existían.
+            connection.exec_driver_sql(
+                f"""INSERT INTO {nombre} SELECT id, latitud, latitud, longitud, longitud FROM {tabla}
+                WHERE latitud IS NOT NULL AND longitud IS NOT NULL"""
+            )
+    return True
+
+
+def _usa_rtree(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def _filtrar_cuerpos(consulta, tipos: Sequence[str], contaminaciones: Sequence[str], niveles: Sequence[str]):
+    if tipos:
+        consulta = consulta.where(func.lower(CuerpoDeAguaDB.tipo).in_([tipo.lower() for tipo in tipos]))
+    if contaminaciones:
+        consulta = consulta.where(
+            func.lower(CuerpoDeAguaDB.contaminacion).in_([valor.lower() for valor in contaminaciones])
+        )
+    if niveles:
+        consulta = consulta.where(
+            CuerpoDeAguaDB.id.in_(
+                select(Alert.cuerpo_agua_id).where(Alert.resuelta.is_(False), Alert.nivel.in_(niveles))
+            )
+        )
+    return consulta
+
+
+def _en_bbox(db: Session, consulta, modelo, bbox: BBox):
+    consulta = consulta.where(bbox.condicion(modelo.latitud, modelo.longitud))
+    if _usa_rtree(db):
+        # Con IN el planificador recorre el R*Tree y busca cada fila por clave primaria.
+        # El árbol guarda float32 redondeado hacia afuera; el filtro exacto queda arriba.
+        rtree = RTREES[modelo.__tablename__]
+        consulta = consulta.where(modelo.id.in_(select(rtree.c.id).where(bbox.condicion_rtree(rtree))))
+    return consulta
+
+
+def consulta_ids_en_bbox(db: Session, modelo, bbox: BBox):
+    """Ids de las filas de ``modelo`` con coordenadas dentro del bbox."""
+    return _en_bbox(db, select(modelo.id), modelo, bbox)
+
+
+def _peor_nivel_abierto(db: Session, cuerpo_ids: Sequence[int]) -> Dict[int, str]:
+    rango = {nivel: posicion for posicion, nivel in enumerate(NIVELES)}
+    peores: Dict[int, str] = {}
+    pendientes = list(set(cuerpo_ids))
+    for inicio in range(0, len(pendientes), MAX_PARAMETROS_IN):
+        for cuerpo_id, nivel in db.execute(
+            select(Alert.cuerpo_agua_id, Alert.nivel).where(
+                Alert.resuelta.is_(False), Alert.cuerpo_agua_id.in_(pendientes[inicio : inicio + MAX_PARAMETROS_IN])
+            )
+        ):
+            actual = peores.get(cuerpo_id)
+            if actual is None or rango.get(nivel, -1) > rango.get(actual, -1):
+                peores[cuerpo_id] = nivel
+    return peores
+
+
+def _punto(longitud: float, latitud: float) -> Dict:
+    return {
+        "type": "Point",
+        "coordinates": [round(longitud, DECIMALES_COORDENADAS), round(latitud, DECIMALES_COORDENADAS)],
+    }
+
+
+def consultar_geojson(
+    db: Session,
+    bbox: BBox,
+    capas: Sequence[str] = CAPAS,
+    tipos: Sequence[str] = (),
+    contaminaciones: Sequence[str] = (),
+    niveles: Sequence[str] = (),
+    limite: int = 5000,
+) -> Dict:
+    """FeatureCollection con los cuerpos de agua y sensores dentro del bbox.
+
+    Los filtros de tipo, contaminación y nivel de alerta se aplican al cuerpo de
+    agua; los sensores los heredan del cuerpo al que pertenecen. Si hay más de
+    ``limite`` elementos se devuelven los primeros y ``truncado`` es True.
+    """
+    filas_cuerpos: List[Tuple] = []
+    filas_sensores: List[Tuple] = []
+    restante = limite + 1
+
+    if "cuerpos" in capas:
+        consulta = select(
+            CuerpoDeAguaDB.id,
+            CuerpoDeAguaDB.nombre,
+            CuerpoDeAguaDB.tipo,
+            CuerpoDeAguaDB.contaminacion,
+            CuerpoDeAguaDB.latitud,
+            CuerpoDeAguaDB.longitud,
+        )
+        consulta = _en_bbox(db, _filtrar_cuerpos(consulta, tipos, contaminaciones, niveles), CuerpoDeAguaDB, bbox)
+        filas_cuerpos = db.execute(consulta.order_by(CuerpoDeAguaDB.id).limit(restante)).all()
+        restante -= len(filas_cuerpos)
+
+    if "sensores" in capas and restante > 0:
+        consulta = select(
+            Sensor.id,
+            Sensor.nombre,
+            Sensor.tipo,
+            Sensor.activo,
+            Sensor.cuerpo_agua_id,
+            Sensor.latitud,
+            Sensor.longitud,
+        ).join(CuerpoDeAguaDB, CuerpoDeAguaDB.id == Sensor.cuerpo_agua_id)
+        consulta = _en_bbox(db, _filtrar_cuerpos(consulta, tipos, contaminaciones, niveles), Sensor, bbox)
+        filas_sensores = db.execute(consulta.order_by(Sensor.id).limit(restante)).all()
+
+    truncado = len(filas_cuerpos) + len(filas_sensores) > limite
+    if truncado:
+        if len(filas_cuerpos) > limite:
+            filas_cuerpos = filas_cuerpos[:limite]
+        else:
+            filas_sensores = filas_sensores[: limite - len(filas_cuerpos)]
+
+    niveles_por_cuerpo = _peor_nivel_abierto(
+        db, [fila.id for fila in filas_cuerpos] + [fila.cuerpo_agua_id for fila in filas_sensores]
+    )
+    features = [
+        {
+            "type": "Feature",
+            "id": f"cuerpo-{fila.id}",
+            "geometry": _punto(fila.longitud, fila.latitud),
+            "properties": {
+                "capa": "cuerpo",
+                "id": fila.id,
+                "nombre": fila.nombre,
+                "tipo": fila.tipo,
+                "contaminacion": fila.contaminacion,
+                "nivel_alerta": niveles_por_cuerpo.get(fila.id),
+            },
+        }
+        for fila in filas_cuerpos
+    ]
+    features.extend(
+        {
+            "type": "Feature",
+            "id": f"sensor-{fila.id}",
+            "geometry": _punto(fila.longitud, fila.latitud),
+            "properties": {
+                "capa": "sensor",
+                "id": fila.id,
+                "nombre": fila.nombre,
+                "tipo": fila.tipo,
+                "activo": fila.activo,
+                "cuerpo_agua_id": fila.cuerpo_agua_id,
+                "nivel_alerta": niveles_por_cuerpo.get(fila.cuerpo_agua_id),
+            },
+        }
+        for fila in filas_sensores
+    )
+    return {"type": "FeatureCollection", "features": features, "truncado": truncado}
+
+
+def geojson_compacto(coleccion: Dict) -> bytes:
+    return json.dumps(coleccion, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def parsear_bbox(texto: Optional[str]) -> BBox:
+    if not texto:
+        return BBox(-180.0, -90.0, 180.0, 90.0)
+    return BBox.desde_texto(texto)
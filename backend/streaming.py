@@ -0,0 +1,138 @@
+"""
+Serialización rápida de listados grandes (JSON o NDJSON, con gzip opcional).
+
+En lugar de cargar objetos ORM y validar cada uno en su modelo ``*Out``, se
+seleccionan solo las columnas de ese esquema, se leen como tuplas en bloques
+(``yield_per``) y cada bloque se codifica de una vez. El JSON resultante es el
+mismo que produciría ``response_model``. Transmitido por partes, la memoria
+depende del tamaño del bloque y no del total de filas.
+
+Usa ``orjson`` (en ``requirements.txt``); si no está instalado, ``json`` de la
+biblioteca estándar.
+"""
+
+import json
+import zlib
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, select
+from sqlalchemy.orm import Session
+
+from database import ReadSessionLocal
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+FORMATOS_LISTA = {"json": "application/json", "ndjson": "application/x-ndjson"}
+TAMANO_BLOQUE = 2000
+NIVEL_GZIP = 5
+
+
+def _por_omision(valor):
+    if isinstance(valor, date):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+if orjson is not None:
+    codificar = orjson.dumps
+else:  # pragma: no cover - depende del entorno
+
+    def codificar(valor) -> bytes:
+        return json.dumps(valor, ensure_ascii=False, separators=(",", ":"), default=_por_omision).encode()
+
+
+def consulta_lista(esquema, modelo) -> Select:
+    """Selecciona del modelo ORM las columnas del esquema de salida, en su orden."""
+    return select(*(getattr(modelo, campo) for campo in esquema.model_fields))
+
+
+def partes_lista(claves: Sequence[str], bloques: Iterable[Sequence], formato: str = "json") -> Iterator[bytes]:
+    """Codifica bloques de tuplas como un arreglo JSON o como NDJSON, un bloque por parte."""
+    claves = list(claves)
+    if formato == "ndjson":
+        for bloque in bloques:
+            if bloque:
+                yield b"\n".join(codificar(dict(zip(claves, fila))) for fila in bloque) + b"\n"
+        return
+    separador = b"["
+    for bloque in bloques:
+        if bloque:
+            # Se codifica el bloque completo y se le quitan los corchetes.
+            yield separador + codificar([dict(zip(claves, fila)) for fila in bloque])[1:-1]
+            separador = b","
+    yield b"]" if separador == b"," else b"[]"
+
+
+def json_lista(db: Session, consulta: Select) -> bytes:
+    """El listado completo en memoria, para guardarlo en la caché de respuestas."""
+    resultado = db.execute(consulta)
+    return b"".join(partes_lista(resultado.keys(), [resultado.all()]))
+
+
+def _comprimir(partes: Iterable[bytes]) -> Iterator[bytes]:
+    compresor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+    for parte in partes:
+        # Sin el flush, zlib retiene los bloques y el cliente no recibe nada hasta el final.
+        datos = compresor.compress(parte) + compresor.flush(zlib.Z_SYNC_FLUSH)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
+def acepta_gzip(request: Request) -> bool:
+    for codificacion in request.headers.get("accept-encoding", "").split(","):
+        nombre, _, parametros = codificacion.strip().partition(";")
+        if nombre.strip().lower() == "gzip":
+            return parametros.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _cabeceras(request: Request, extra: Optional[Dict[str, str]]) -> Dict[str, str]:
+    cabeceras = {"Vary": "Accept-Encoding", **(extra or {})}
+    if acepta_gzip(request):
+        cabeceras["Content-Encoding"] = "gzip"
+    return cabeceras
+
+
+def respuesta_lista(
+    request: Request,
+    consulta: Select,
+    formato: str = "json",
+    tamano_bloque: int = TAMANO_BLOQUE,
+    session_factory=ReadSessionLocal,
+) -> StreamingResponse:
+    """Transmite el resultado de ``consulta`` por bloques de ``tamano_bloque`` filas."""
+
+    def partes():
+        # La sesión vive mientras se transmite la respuesta, no la del request.
+        db = session_factory()
+        try:
+            resultado = db.execute(consulta.execution_options(yield_per=tamano_bloque))
+            yield from partes_lista(resultado.keys(), resultado.partitions(), formato)
+        finally:
+            db.close()
+
+    cabeceras = _cabeceras(request, None)
+    cuerpo = _comprimir(partes()) if "Content-Encoding" in cabeceras else partes()
+    return StreamingResponse(cuerpo, media_type=FORMATOS_LISTA[formato], headers=cabeceras)
+
+
+def respuesta_filas(
+    request: Request,
+    claves: Sequence[str],
+    filas: List[Sequence],
+    formato: str = "json",
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Como :func:`respuesta_lista` para un resultado acotado que ya está en memoria."""
+    cabeceras = _cabeceras(request, headers)
+    cuerpo = b"".join(partes_lista(claves, [filas], formato))
+    if "Content-Encoding" in cabeceras:
+        cuerpo = b"".join(_comprimir([cuerpo]))
+    return Response(content=cuerpo, media_type=FORMATOS_LISTA[formato], headers=cabeceras)
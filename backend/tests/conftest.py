@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+# Los tests usan una base SQLite temporal para no modificar observatorio_aguas.db.
+_TMP_DIR = Path(tempfile.mkdtemp(prefix="observatorio-tests-"))
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR / 'test.db'}"
+os.environ["JOURNAL_DIR"] = str(_TMP_DIR / "journal")
+os.environ["REPORTES_DIR"] = str(_TMP_DIR / "reportes")
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(scope="module")
+def client():
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="module")
+def auth_headers(client):
+    email = f"analista-{uuid.uuid4().hex[:8]}@example.com"
+    password = "clave-segura-123"
+    response = client.post(
+        "/auth/register",
+        json={"email": email, "password": password, "full_name": "Analista", "role": "analista"},
+    )
+    assert response.status_code == 201
+    response = client.post("/auth/login", data={"username": email, "password": password})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def referencias(client, auth_headers):
+    cuerpo = client.post(
+        "/cuerpos-agua",
+        headers=auth_headers,
+        json={
+            "nombre": f"Laguna {uuid.uuid4().hex[:8]}",
+            "tipo": "lago",
+            "latitud": 19.4,
+            "longitud": -99.1,
+            "contaminacion": "Baja",
+            "biodiversidad": "Media",
+        },
+    ).json()
+    sensor = client.post(
+        "/sensores",
+        headers=auth_headers,
+        json={"nombre": "Sonda 1", "tipo": "multiparamétrica", "cuerpo_agua_id": cuerpo["id"]},
+    ).json()
+    parametro = client.post(
+        "/parametros",
+        headers=auth_headers,
+        json={"nombre": f"pH {uuid.uuid4().hex[:8]}", "unidad": "pH", "valor_minimo": 6.0, "valor_maximo": 9.0},
+    ).json()
+    return {"cuerpo_agua_id": cuerpo["id"], "sensor_id": sensor["id"], "parametro_id": parametro["id"]}
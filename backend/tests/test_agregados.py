@@ -0,0 +1,50 @@
+from database import SessionLocal
+from models import ReadingRollup
+from rollups import reconstruir_agregados
+
+
+def _agregados(client, referencias, intervalo):
+    response = client.get(
+        "/lecturas/agregados",
+        params={
+            "intervalo": intervalo,
+            "cuerpo_agua_id": referencias["cuerpo_agua_id"],
+            "parametro_id": referencias["parametro_id"],
+            "desde": "2022-03-01T00:00:00",
+            "hasta": "2022-03-02T00:00:00",
+        },
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_agregados_se_actualizan_al_ingerir_y_coinciden_con_reconstruccion(client, auth_headers, referencias):
+    valores = [
+        ("2022-03-01T08:00:00", 6.5),
+        ("2022-03-01T08:15:00", 7.0),
+        ("2022-03-01T08:30:00", 7.5),
+        ("2022-03-01T08:45:00", 8.0),
+        ("2022-03-01T09:05:00", 9.5),
+    ]
+    lecturas = [{**referencias, "valor": v, "unidad": "pH", "tomado_en": t} for t, v in valores]
+    assert client.post("/lecturas/batch", json={"lecturas": lecturas[:2]}, headers=auth_headers).status_code == 200
+    assert client.post("/lecturas/batch", json={"lecturas": lecturas[2:]}, headers=auth_headers).status_code == 200
+
+    por_hora = _agregados(client, referencias, "hora")
+    assert [(a["inicio"], a["conteo"], a["minimo"], a["maximo"]) for a in por_hora] == [
+        ("2022-03-01T08:00:00", 4, 6.5, 8.0),
+        ("2022-03-01T09:00:00", 1, 9.5, 9.5),
+    ]
+    por_dia = _agregados(client, referencias, "dia")
+    assert por_dia[0]["conteo"] == 5
+    assert abs(por_dia[0]["promedio"] - (6.5 + 7.0 + 7.5 + 8.0 + 9.5) / 5) < 1e-9
+
+    db = SessionLocal()
+    try:
+        reconstruir_agregados(db)
+        db.commit()
+        assert db.query(ReadingRollup).filter(ReadingRollup.intervalo == "hora").count() > 0
+    finally:
+        db.close()
+    assert _agregados(client, referencias, "hora") == por_hora
+    assert _agregados(client, referencias, "dia") == por_dia
@@ -0,0 +1,64 @@
+import time
+
+from auth_cache import Principal, PrincipalCache, principal_cache
+from database import SessionLocal
+from models import Role, User
+
+
+def test_cache_lru_y_expiracion():
+    cache = PrincipalCache(max_entradas=2, ttl=60)
+    for numero in range(3):
+        cache.guardar(f"t{numero}", Principal(numero, f"u{numero}@x.com", None), None, cache.generacion)
+    assert cache.obtener("t0") is None
+    assert cache.obtener("t2").id == 2
+
+    cache.guardar("vencido", Principal(9, "v@x.com", None), time.time() - 1, cache.generacion)
+    assert cache.obtener("vencido") is None
+
+    generacion = cache.generacion
+    cache.invalidar_usuarios({1})
+    assert cache.obtener("t1") is None
+    cache.guardar("t1", Principal(1, "u1@x.com", None), None, generacion)
+    assert cache.obtener("t1") is None
+
+
+def test_cambio_de_rol_invalida_el_principal(client, auth_headers):
+    assert client.get("/auth/me", headers=auth_headers).json()["role"] == "analista"
+    aciertos = principal_cache.aciertos
+    me = client.get("/auth/me", headers=auth_headers).json()
+    assert principal_cache.aciertos == aciertos + 1
+
+    db = SessionLocal()
+    try:
+        usuario = db.get(User, me["id"])
+        usuario.role = db.query(Role).filter(Role.nombre == "visualizador").one()
+        db.commit()
+    finally:
+        db.close()
+
+    assert client.get("/auth/me", headers=auth_headers).json()["role"] == "visualizador"
+    assert client.delete("/cuerpos-agua/999999", headers=auth_headers).status_code == 403
+
+
+def test_login_no_invalida_los_principales(client):
+    import uuid
+
+    credenciales = {"username": f"login-{uuid.uuid4().hex[:8]}@example.com", "password": "clave-segura-123"}
+    client.post(
+        "/auth/register",
+        json={"email": credenciales["username"], "password": credenciales["password"], "full_name": "L", "role": "analista"},
+    )
+    token = client.post("/auth/login", data=credenciales).json()["access_token"]
+    cabeceras = {"Authorization": f"Bearer {token}"}
+    client.get("/auth/me", headers=cabeceras)
+
+    generacion = principal_cache.generacion
+    assert client.post("/auth/login", data=credenciales).status_code == 200
+    assert principal_cache.generacion == generacion
+    assert principal_cache.obtener(token) is not None
+
+    db = SessionLocal()
+    try:
+        assert db.query(User).filter(User.email == credenciales["username"]).one().last_login is not None
+    finally:
+        db.close()
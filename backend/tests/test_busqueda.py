@@ -0,0 +1,52 @@
+import uuid
+
+
+def _crear_cuerpo(client, auth_headers, nombre, descripcion=None):
+    return client.post(
+        "/cuerpos-agua",
+        headers=auth_headers,
+        json={
+            "nombre": nombre,
+            "tipo": "laguna",
+            "latitud": 19.0,
+            "longitud": -99.0,
+            "descripcion": descripcion,
+            "contaminacion": "Baja",
+            "biodiversidad": "Alta",
+        },
+    )
+
+
+def test_busqueda_sin_acentos_y_ordenada(client, auth_headers):
+    clave = uuid.uuid4().hex[:8]
+    en_nombre = _crear_cuerpo(client, auth_headers, f"Laguna Términos {clave}").json()
+    en_descripcion = _crear_cuerpo(
+        client, auth_headers, f"Estero {clave}", descripcion="Conecta con la laguna de términos"
+    ).json()
+
+    respuesta = client.get("/buscar", params={"q": f"terminos {clave}"})
+    assert respuesta.status_code == 200
+    resultados = respuesta.json()
+    assert [r["id"] for r in resultados if r["tipo"] == "cuerpo_agua"][:1] == [en_nombre["id"]]
+
+    respuesta = client.get("/buscar", params={"q": "TERMINOS", "tipos": "cuerpo_agua"})
+    ids = {r["id"] for r in respuesta.json()}
+    assert {en_nombre["id"], en_descripcion["id"]} <= ids
+
+    # Los triggers mantienen el índice al editar y borrar.
+    client.put(f"/cuerpos-agua/{en_nombre['id']}", headers=auth_headers, json={"nombre": f"Bahía {clave}"})
+    ids = {r["id"] for r in client.get("/buscar", params={"q": f"bahia {clave}"}).json()}
+    assert en_nombre["id"] in ids
+    ids = {r["id"] for r in client.get("/buscar", params={"q": "términos", "tipos": "cuerpo_agua"}).json()}
+    assert en_nombre["id"] not in ids
+
+    # Los operadores de FTS5 se tratan como texto.
+    assert client.get("/buscar", params={"q": 'NEAR( "OR * -'}).status_code == 200
+
+
+def test_nombre_duplicado_usa_el_indice(client, auth_headers):
+    nombre = f"Río Lerma {uuid.uuid4().hex[:8]}"
+    assert _crear_cuerpo(client, auth_headers, nombre).status_code == 201
+    assert _crear_cuerpo(client, auth_headers, nombre.upper()).status_code == 409
+    # Solo coincide el nombre completo, no uno que lo contiene.
+    assert _crear_cuerpo(client, auth_headers, nombre + " Norte").status_code == 201
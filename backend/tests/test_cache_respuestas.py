@@ -0,0 +1,52 @@
+import uuid
+
+
+def _cuerpo(nombre):
+    return {
+        "nombre": nombre,
+        "tipo": "lago",
+        "latitud": 10.0,
+        "longitud": -70.0,
+        "contaminacion": "Baja",
+        "biodiversidad": "Media",
+    }
+
+
+def test_listado_responde_304_hasta_que_cambia_la_tabla(client, auth_headers):
+    primera = client.get("/cuerpos-agua")
+    assert primera.status_code == 200
+    etag = primera.headers["ETag"]
+
+    repetida = client.get("/cuerpos-agua", headers={"If-None-Match": etag})
+    assert repetida.status_code == 304
+    assert repetida.headers["ETag"] == etag
+    assert client.get("/cuerpos-agua", headers={"If-None-Match": f'"otro", W/{etag}'}).status_code == 304
+
+    # Un cambio en otra tabla no invalida el listado.
+    client.post(
+        "/parametros",
+        headers=auth_headers,
+        json={"nombre": f"Turbidez {uuid.uuid4().hex[:8]}", "unidad": "NTU"},
+    )
+    assert client.get("/cuerpos-agua", headers={"If-None-Match": etag}).status_code == 304
+
+    nombre = f"Lago {uuid.uuid4().hex[:8]}"
+    assert client.post("/cuerpos-agua", headers=auth_headers, json=_cuerpo(nombre)).status_code == 201
+    nueva = client.get("/cuerpos-agua", headers={"If-None-Match": etag})
+    assert nueva.status_code == 200
+    assert nueva.headers["ETag"] != etag
+    assert nombre in {c["nombre"] for c in nueva.json()}
+
+
+def test_estadisticas_se_mantienen_con_los_cambios(client, auth_headers):
+    antes = client.get("/estadisticas").json()
+    cuerpo = client.post("/cuerpos-agua", headers=auth_headers, json=_cuerpo(f"Lago {uuid.uuid4().hex[:8]}")).json()
+    client.post(
+        "/sensores",
+        headers=auth_headers,
+        json={"nombre": "Sonda", "tipo": "pH", "cuerpo_agua_id": cuerpo["id"]},
+    )
+    despues = client.get("/estadisticas").json()
+    assert despues["total_cuerpos_agua"] == antes["total_cuerpos_agua"] + 1
+    assert despues["total_sensores"] == antes["total_sensores"] + 1
+    assert despues["total_parametros"] == antes["total_parametros"]
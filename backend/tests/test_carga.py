@@ -0,0 +1,48 @@
+import json
+
+from perf import loadtest
+
+
+def test_percentiles_y_presupuestos():
+    tiempos = sorted(float(valor) for valor in range(1, 101))
+    assert loadtest.percentil(tiempos, 0.50) == 50
+    assert loadtest.percentil(tiempos, 0.95) == 95
+    assert loadtest.percentil(tiempos, 0.99) == 99
+
+    muestras = {"mapa": [(0.1, 200), (0.3, 200), (0.9, 200), (0.2, 500)], "alertas": [(0.01, 200)]}
+    resumen = loadtest.resumir(muestras, duracion=2.0)
+    assert resumen["mapa"]["solicitudes"] == 4 and resumen["mapa"]["errores"] == 1
+    assert resumen["mapa"]["promedio_ms"] == 375.0 and resumen["mapa"]["por_segundo"] == 2.0
+    assert resumen["login"]["solicitudes"] == 0
+
+    resultado = {
+        "reporte": {"estado": "completado", "lecturas": 10_000, "segundos": 6.0},
+        "etapas": [{"concurrencia": 4, "endpoints": resumen}],
+    }
+    fallos = loadtest.incumplimientos(resultado, 300.0, 0.0, 5.0, 0.01)
+    assert len(fallos) == 3
+    assert any(fallo.startswith("reporte de 10000") for fallo in fallos)
+    assert any("mapa con concurrencia 4: promedio" in fallo for fallo in fallos)
+    assert any("1 errores de 4" in fallo for fallo in fallos)
+
+
+def test_carga_de_extremo_a_extremo(tmp_path):
+    salida = tmp_path / "carga.json"
+    codigo = loadtest.main(
+        [
+            "--etapas", "1",
+            "--duracion", "1",
+            "--cuerpos", "3",
+            "--lecturas-reporte", "500",
+            # Solo se comprueba el recorrido completo; los tiempos dependen de la máquina.
+            "--presupuesto-ms", "60000",
+            "--presupuesto-reporte-s", "60",
+            "--json", str(salida),
+        ]
+    )
+    resultado = json.loads(salida.read_text(encoding="utf-8"))
+    assert codigo == 0, resultado["incumplimientos"]
+    assert resultado["reporte"]["estado"] == "completado"
+    assert resultado["reporte"]["lecturas"] == 500
+    (etapa,) = resultado["etapas"]
+    assert sum(fila["solicitudes"] for fila in etapa["endpoints"].values()) > 0
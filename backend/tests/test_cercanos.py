@@ -0,0 +1,138 @@
+import random
+import uuid
+
+from models import CuerpoDeAguaDB
+from nearest import IndiceVecinos, haversine_km
+
+
+def test_busqueda_por_anillos_coincide_con_fuerza_bruta():
+    generador = random.Random(7)
+    indice = IndiceVecinos(CuerpoDeAguaDB)
+    indice._cargado = True
+    puntos = {}
+    for punto_id in range(2000):
+        latitud, longitud = generador.uniform(-89, 89), generador.uniform(-180, 180)
+        puntos[punto_id] = (latitud, longitud)
+        indice._poner(punto_id, latitud, longitud)
+
+    for latitud, longitud in [(0, 0), (88.9, 10), (-30, 179.9), (45, -179.95), (12.3, 45.6)]:
+        esperado = sorted(puntos, key=lambda i: haversine_km(latitud, longitud, *puntos[i]))[:5]
+        assert [i for i, _ in indice.cercanos(latitud, longitud, 5)] == esperado
+
+    dentro = indice.cercanos(0, 0, 50, radio_km=1500)
+    assert dentro and all(distancia <= 1500 for _, distancia in dentro)
+
+
+def test_endpoints_de_cercanos(client, auth_headers):
+    latitud, longitud = -12.0, 130.0
+    cuerpos = []
+    for paso in (0.5, 0.1, 2.0):
+        cuerpos.append(
+            client.post(
+                "/cuerpos-agua",
+                headers=auth_headers,
+                json={
+                    "nombre": f"Cercano {uuid.uuid4().hex[:8]}",
+                    "tipo": "lago",
+                    "latitud": latitud + paso,
+                    "longitud": longitud,
+                    "contaminacion": "Baja",
+                    "biodiversidad": "Alta",
+                },
+            ).json()
+        )
+
+    respuesta = client.get("/cuerpos-agua/cercanos", params={"lat": latitud, "lon": longitud, "k": 2})
+    assert respuesta.status_code == 200
+    cercanos = respuesta.json()
+    assert [c["id"] for c in cercanos] == [cuerpos[1]["id"], cuerpos[0]["id"]]
+    assert 11 < cercanos[0]["distancia_km"] < 11.2
+
+    client.put(f"/cuerpos-agua/{cuerpos[1]['id']}", headers=auth_headers, json={"latitud": 40.0})
+    movido = client.get("/cuerpos-agua/cercanos", params={"lat": latitud, "lon": longitud, "k": 1}).json()
+    assert [c["id"] for c in movido] == [cuerpos[0]["id"]]
+
+    sensor = client.post(
+        "/sensores",
+        headers=auth_headers,
+        json={"nombre": "Sonda", "tipo": "pH", "cuerpo_agua_id": cuerpos[0]["id"], "latitud": -12.01, "longitud": 130.0},
+    ).json()
+    sensores = client.get("/sensores/cercanos", params={"lat": latitud, "lon": longitud, "radio_km": 50}).json()
+    assert [s["id"] for s in sensores] == [sensor["id"]]
+    assert client.get("/sensores/cercanos", params={"lat": 50, "lon": 50, "radio_km": 10}).json() == []
+
+
+def test_sincronizaciones_concurrentes_no_bloquean_el_event_loop(client):
+    import asyncio
+    import threading
+
+    from database import AsyncReadSessionLocal
+
+    indice = IndiceVecinos(CuerpoDeAguaDB)
+
+    async def sincronizar():
+        async with AsyncReadSessionLocal() as db:
+            await db.run_sync(indice.sincronizar)
+
+    async def dos_a_la_vez():
+        await asyncio.gather(sincronizar(), sincronizar())
+
+    # Con el lock tomado durante la consulta, la segunda llamada bloquearía el loop para siempre.
+    hilo = threading.Thread(target=asyncio.run, args=(dos_a_la_vez(),), daemon=True)
+    hilo.start()
+    hilo.join(timeout=10)
+    assert not hilo.is_alive()
+    assert indice._cargado and indice._puntos
+
+
+def test_carga_inicial_concurrente_no_sirve_un_indice_vacio(client, auth_headers):
+    import threading
+
+    from database import SessionLocal
+
+    client.post(
+        "/cuerpos-agua",
+        headers=auth_headers,
+        json={
+            "nombre": f"Presa {uuid.uuid4().hex[:8]}",
+            "tipo": "presa",
+            "latitud": -12.0,
+            "longitud": -77.0,
+            "contaminacion": "Baja",
+            "biodiversidad": "Media",
+        },
+    )
+    indice = IndiceVecinos(CuerpoDeAguaDB)
+    ambas_leyendo = threading.Barrier(2, timeout=10)
+    primera_lista = threading.Event()
+    resultados = {}
+
+    class Sesion:
+        def __init__(self, db, esperar=None):
+            self._db, self._esperar = db, esperar
+
+        def execute(self, consulta):
+            resultado = self._db.execute(consulta)
+            ambas_leyendo.wait()
+            if self._esperar is not None:
+                self._esperar.wait(10)
+            return resultado
+
+    def buscar(nombre, esperar=None):
+        with SessionLocal() as db:
+            indice.sincronizar(Sesion(db, esperar))
+        resultados[nombre] = indice.cercanos(-12.0, -77.0, k=1)
+        if esperar is None:
+            primera_lista.set()
+
+    # La primera carga en terminar es la que empezó antes.
+    primera = threading.Thread(target=buscar, args=("primera",))
+    primera.start()
+    while not indice._cargando:
+        pass
+    segunda = threading.Thread(target=buscar, args=("segunda", primera_lista))
+    segunda.start()
+    primera.join(timeout=10)
+    segunda.join(timeout=10)
+
+    assert resultados["primera"] and resultados["primera"] == resultados["segunda"]
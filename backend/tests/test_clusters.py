@@ -0,0 +1,161 @@
+import uuid
+
+from clusters import MAX_ZOOM_GRILLA, IndiceClusters, Punto, _Agregado, _clave
+from spatial import BBox
+
+
+def _crear_cuerpo(client, auth_headers, latitud, longitud, tipo="lago"):
+    return client.post(
+        "/cuerpos-agua",
+        headers=auth_headers,
+        json={
+            "nombre": f"Cluster {uuid.uuid4().hex[:8]}",
+            "tipo": tipo,
+            "latitud": latitud,
+            "longitud": longitud,
+            "contaminacion": "Baja",
+            "biodiversidad": "Media",
+        },
+    ).json()
+
+
+def test_agregado_identifica_el_punto_unico():
+    agregado = _Agregado()
+    uno = Punto(_clave("sensor", 41), "sensor", 41, 1.0, 2.0, 0.5, 0.5, "lago", None)
+    otro = Punto(_clave("cuerpo", 7), "cuerpo", 7, 3.0, 4.0, 0.5, 0.5, "río", "alta")
+    agregado.aplicar(uno, 1)
+    agregado.aplicar(otro, 1)
+    assert agregado.a_dict()["nivel_alerta"] == "alta"
+    agregado.aplicar(otro, -1)
+    unico = agregado.a_dict()
+    assert (unico["capa"], unico["id"], unico["nivel_alerta"]) == ("sensor", 41, None)
+
+
+def test_clusters_por_zoom_se_actualizan_con_las_escrituras(client, auth_headers):
+    bbox = {"bbox": "-61,-31,-59,-29", "capas": "cuerpos"}
+    base = [_crear_cuerpo(client, auth_headers, -30.0 + i * 0.001, -60.0) for i in range(3)]
+
+    lejos = client.get("/mapa/clusters", params={**bbox, "zoom": 3}).json()
+    assert len(lejos["clusters"]) == 1
+    assert lejos["clusters"][0]["conteo"] == 3
+    assert lejos["clusters"][0]["tipo"] == "lago"
+
+    cerca = client.get("/mapa/clusters", params={**bbox, "zoom": 18}).json()
+    assert sorted(c["id"] for c in cerca["clusters"]) == sorted(c["id"] for c in base)
+
+    client.post("/alertas", headers=auth_headers, json={"cuerpo_agua_id": base[0]["id"], "nivel": "critica", "mensaje": "x"})
+    _crear_cuerpo(client, auth_headers, -30.0005, -60.0, tipo="río")
+    lejos = client.get("/mapa/clusters", params={**bbox, "zoom": 3}).json()
+    assert lejos["clusters"][0]["conteo"] == 4
+    assert lejos["clusters"][0]["nivel_alerta"] == "critica"
+
+    client.put(f"/cuerpos-agua/{base[1]['id']}", headers=auth_headers, json={"latitud": 10.0})
+    assert client.get("/mapa/clusters", params={**bbox, "zoom": 3}).json()["clusters"][0]["conteo"] == 3
+
+
+def test_respuesta_acotada_por_limite():
+    indice = IndiceClusters()
+    indice._reiniciar()
+    indice._cargado = True
+    for i in range(50):
+        indice._poner_cuerpo(i, -40 + i, -70 + i, "lago", None)
+    respuesta = indice.consultar(10, BBox(-180, -85, 180, 85), ["cuerpos"], limite=20)
+    assert len(respuesta["clusters"]) == 20
+    assert respuesta["truncado"]
+
+
+def test_nivel_escalado_por_el_motor_llega_al_mapa(client, auth_headers):
+    bbox = {"bbox": "99,9,101,11", "capas": "cuerpos", "zoom": 3}
+    cuerpo = _crear_cuerpo(client, auth_headers, 10.0, 100.0)
+    sensor = client.post(
+        "/sensores", headers=auth_headers, json={"nombre": "S", "tipo": "pH", "cuerpo_agua_id": cuerpo["id"]}
+    ).json()
+    parametro = client.post(
+        "/parametros",
+        headers=auth_headers,
+        json={"nombre": f"Cloro {uuid.uuid4().hex[:8]}", "unidad": "mg/L", "valor_maximo": 1.0},
+    ).json()
+    assert client.get("/mapa/clusters", params=bbox).json()["clusters"][0]["nivel_alerta"] is None
+
+    lectura = {"sensor_id": sensor["id"], "parametro_id": parametro["id"], "cuerpo_agua_id": cuerpo["id"], "valor": 2.0, "unidad": "mg/L"}
+    niveles = []
+    for _ in range(2):
+        assert client.post("/lecturas", headers=auth_headers, json=lectura).status_code == 201
+        niveles.append(client.get("/mapa/clusters", params=bbox).json()["clusters"][0]["nivel_alerta"])
+    assert niveles == ["media", "alta"]
+
+
+def test_al_confirmar_no_espera_el_lock():
+    import threading
+
+    from database import CambiosConfirmados
+
+    indice = IndiceClusters()
+    indice._activo = True
+    cambios = CambiosConfirmados()
+    cambios.insertados["cuerpos_agua"].add(1)
+    hecho = threading.Event()
+    with indice._lock:
+        hilo = threading.Thread(target=lambda: (indice._al_confirmar(cambios), hecho.set()))
+        hilo.start()
+        assert hecho.wait(2)
+    assert list(indice._cambios) == [({1}, set(), False)]
+
+
+def test_celdas_de_un_punto_guardan_el_punto():
+    indice = IndiceClusters()
+    indice._reiniciar()
+    indice._cargado = True
+    indice._poner_cuerpo(1, 10.0, 10.0, "lago", None)
+    unico = indice._puntos[_clave("cuerpo", 1)]
+    assert len(indice._grillas["cuerpo"]) == MAX_ZOOM_GRILLA + 1
+    assert all(valor is unico for grilla in indice._grillas["cuerpo"] for valor in grilla.values())
+
+    indice._poner_cuerpo(2, 10.0001, 10.0001, "río", None)
+    assert isinstance(next(iter(indice._grillas["cuerpo"][0].values())), _Agregado)
+    indice._quitar("cuerpo", 2)
+    assert all(valor is unico for grilla in indice._grillas["cuerpo"] for valor in grilla.values())
+
+
+def test_carga_inicial_arma_las_mismas_grillas():
+    import random
+
+    generador = random.Random(3)
+    puntos = [(i, generador.uniform(-60, 60), generador.uniform(-180, 180)) for i in range(500)]
+    incremental, de_una_vez = IndiceClusters(), IndiceClusters()
+    incremental._reiniciar()
+    de_una_vez._reiniciar()
+    de_una_vez._grillas = {}
+    for punto_id, latitud, longitud in puntos:
+        incremental._poner_cuerpo(punto_id, latitud, longitud, "lago", "alta" if punto_id % 7 == 0 else None)
+        de_una_vez._poner_cuerpo(punto_id, latitud, longitud, "lago", "alta" if punto_id % 7 == 0 else None)
+    de_una_vez._construir_grillas()
+
+    mundo = BBox(-180, -85, 180, 85)
+    for zoom in (0, 4, 8, MAX_ZOOM_GRILLA):
+        assert incremental.consultar(zoom, mundo, ["cuerpos"]) == de_una_vez.consultar(zoom, mundo, ["cuerpos"])
+
+
+def test_zoom_alto_consulta_el_rtree(client, auth_headers):
+    from sqlalchemy import event
+
+    from database import SessionLocal, engine
+
+    cuerpos = [_crear_cuerpo(client, auth_headers, 45.0 + i * 0.002, 7.0) for i in range(3)]
+    area = BBox(6.99, 44.99, 7.01, 45.01)
+    indice = IndiceClusters()
+    sentencias = []
+
+    def capturar(conn, cursor, sentencia, parametros, contexto, varias):
+        sentencias.append(sentencia)
+
+    with SessionLocal() as db:
+        indice.sincronizar(db)
+        event.listen(engine, "before_cursor_execute", capturar)
+        try:
+            alto = indice.consultar(17, area, ["cuerpos"], db=db)
+        finally:
+            event.remove(engine, "before_cursor_execute", capturar)
+    assert any("cuerpos_agua_rtree" in sentencia for sentencia in sentencias)
+    assert alto == indice.consultar(17, area, ["cuerpos"])
+    assert sorted(c["id"] for c in alto["clusters"]) == sorted(c["id"] for c in cuerpos)
@@ -0,0 +1,31 @@
+import uuid
+
+
+def _nuevo_cuerpo(nombre):
+    return {
+        "nombre": nombre,
+        "tipo": "río",
+        "latitud": 4.6,
+        "longitud": -74.1,
+        "contaminacion": "Media",
+        "biodiversidad": "Alta",
+    }
+
+
+def test_crud_de_cuerpos_agua_por_la_ruta_async(client, auth_headers):
+    nombre = f"Rio {uuid.uuid4().hex[:8]}"
+    creado = client.post("/cuerpos-agua", json=_nuevo_cuerpo(nombre), headers=auth_headers)
+    assert creado.status_code == 201
+    cuerpo_id = creado.json()["id"]
+
+    assert client.post("/cuerpos-agua", json=_nuevo_cuerpo(nombre.upper()), headers=auth_headers).status_code == 409
+    assert any(c["id"] == cuerpo_id for c in client.get("/cuerpos-agua").json())
+
+    actualizado = client.put(f"/cuerpos-agua/{cuerpo_id}", json={"ph": 6.9}, headers=auth_headers)
+    assert actualizado.status_code == 200
+    assert actualizado.json()["ph"] == 6.9
+    assert client.get(f"/cuerpos-agua/{cuerpo_id}").json()["ph"] == 6.9
+
+    assert client.get("/estadisticas").json()["total_cuerpos_agua"] >= 1
+    assert client.get("/cuerpos-agua/999999").status_code == 404
+    assert client.delete("/cuerpos-agua/999999", headers=auth_headers).status_code == 404
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import textwrap
+from datetime import datetime
+from pathlib import Path
+
+from perf import bench, dataset
+
+
+def _lecturas(semilla):
+    generador = dataset.Generador(semilla)
+    cuerpos = generador.cuerpos(20, 1, datetime(2024, 1, 1))
+    sensores = generador.sensores(cuerpos, 3, 1, datetime(2024, 1, 1))
+    parametros = [(indice + 1, *parametro[1:]) for indice, parametro in enumerate(dataset.PARAMETROS)]
+    lotes = generador.lecturas(
+        5000, 1, [(s["id"], s["cuerpo_agua_id"]) for s in sensores], parametros,
+        datetime(2024, 1, 1), datetime(2024, 3, 1), 0.01, 1000,
+    )
+    return cuerpos, sensores, [fila for lote in lotes for fila in lote]
+
+
+def test_generador_reproducible():
+    cuerpos, sensores, lecturas = _lecturas(42)
+    assert (cuerpos, sensores, lecturas) == _lecturas(42)
+    assert lecturas != _lecturas(43)[2]
+
+    assert len(sensores) == 60 and len(lecturas) == 5000
+    assert [fila[0] for fila in lecturas] == list(range(1, 5001))
+    fechas = [fila[6] for fila in lecturas]
+    assert fechas == sorted(fechas) and datetime(2024, 1, 1) <= fechas[0] and fechas[-1] < datetime(2024, 3, 1)
+
+    rangos = {indice + 1: (p[2], p[3]) for indice, p in enumerate(dataset.PARAMETROS)}
+    fuera = sum(1 for fila in lecturas if not rangos[fila[2]][0] <= fila[4] <= rangos[fila[2]][1])
+    assert 20 <= fuera <= 100
+
+
+def test_medicion_y_comparacion():
+    medida = bench.medir(lambda: sum(range(100)), repeticiones=2, minimo_s=0.01)
+    assert medida["iteraciones"] >= 1 and medida["repeticiones"] == 2
+    assert 0 < medida["mejor_us"] <= medida["mediana_us"]
+
+    anterior = {"benchmarks": {"a": {"mejor_us": 10.0}, "b": {"mejor_us": 10.0}}}
+    actual = {"benchmarks": {"a": {"mejor_us": 11.0}, "b": {"mejor_us": 13.0}, "c": {"mejor_us": 1.0}}}
+    (regresion,) = bench.comparar(actual, anterior, tolerancia=0.2)
+    assert regresion.startswith("b:")
+
+
+def test_generar_restaura_synchronous(tmp_path):
+    # En otro proceso: generar() carga datos y quita índices, no debe tocar la base de los tests.
+    script = textwrap.dedent(
+        """
+        from database import engine
+        from perf.dataset import generar
+
+        with engine.connect() as conexion:
+            previo = conexion.exec_driver_sql("PRAGMA synchronous").scalar()
+        totales = generar(cuerpos=3, sensores_por_cuerpo=2, lecturas=500, dias=10)
+        assert totales["lecturas_sensores"] == 500, totales
+        with engine.connect() as conexion:
+            assert conexion.exec_driver_sql("PRAGMA synchronous").scalar() == previo
+        print("ok")
+        """
+    )
+    entorno = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'volumen.db'}", JOURNAL_DIR=str(tmp_path / "journal"))
+    resultado = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).resolve().parents[1], env=entorno, capture_output=True, text=True, timeout=120,
+    )
+    assert resultado.returncode == 0, resultado.stderr
+    assert "ok" in resultado.stdout
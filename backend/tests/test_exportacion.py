@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+import export
+
+
+def _cargar(client, auth_headers, referencias):
+    lecturas = [
+        {**referencias, "valor": 6.0 + i / 10, "unidad": "pH", "tomado_en": f"2021-07-01T{i:02d}:30:00"}
+        for i in range(12)
+    ]
+    assert client.post("/lecturas/batch", json={"lecturas": lecturas}, headers=auth_headers).status_code == 200
+
+
+@pytest.mark.skipif(export.disponible(), reason="pyarrow instalado")
+def test_exportacion_sin_pyarrow_responde_501(client, auth_headers):
+    respuesta = client.get("/lecturas/exportar", headers=auth_headers)
+    assert respuesta.status_code == 501
+
+
+def test_exportacion_columnar_por_lotes(client, auth_headers, referencias):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    from database import SessionLocal
+
+    _cargar(client, auth_headers, referencias)
+    filtros = {"cuerpo_agua_id": referencias["cuerpo_agua_id"], "desde": "2021-07-01T03:00:00", "hasta": "2021-07-01T10:00:00"}
+
+    respuesta = client.get("/lecturas/exportar", params={**filtros, "formato": "arrow"}, headers=auth_headers)
+    assert respuesta.status_code == 200
+    tabla = pa.ipc.open_stream(respuesta.content).read_all()
+    assert tabla.num_rows == 7
+    assert tabla.column("valor").to_pylist() == [6.0 + i / 10 for i in range(3, 10)]
+    assert str(tabla.column("tomado_en")[0]) == "2021-07-01 03:30:00+00:00"
+
+    respuesta = client.get("/lecturas/exportar", params=filtros, headers=auth_headers)
+    assert pa.parquet.read_table(io.BytesIO(respuesta.content)).num_rows == 7
+
+    # Bloques más pequeños que el resultado: varios record batches, mismas filas.
+    with SessionLocal() as db:
+        lotes = list(export.iterar_lotes(db, cuerpo_agua_id=referencias["cuerpo_agua_id"], tamano_lote=5))
+    assert [lote.num_rows for lote in lotes] == [5, 5, 2]
+    ids = [i for lote in lotes for i in lote.column("id").to_pylist()]
+    assert ids == sorted(ids) and len(set(ids)) == 12
+
+
+def test_exportacion_por_linea_de_comandos(tmp_path, client, auth_headers, referencias):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    _cargar(client, auth_headers, referencias)
+    salida = tmp_path / "lecturas.parquet"
+    argumentos = ["--salida", str(salida), "--cuerpo-agua-id", str(referencias["cuerpo_agua_id"]), "--tamano-lote", "4"]
+    assert export.main(argumentos) == 0
+    tabla = pa.parquet.read_table(salida)
+    claves = list(zip(tabla.column("tomado_en").to_pylist(), tabla.column("id").to_pylist()))
+    assert len(claves) >= 12 and len({i for _, i in claves}) == len(claves)
+    assert claves == sorted(claves)
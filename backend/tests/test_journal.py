@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import func, select
+
+from database import SessionLocal
+from ingest import normalizar_lectura
+from journal import DiarioOcupado, IngestJournal, ingest_journal
+from models import SensorReading
+
+
+def _lectura(referencias, valor, **cambios):
+    datos = {**referencias, "valor": valor, "unidad": "pH"}
+    datos.update(cambios)
+    return datos
+
+
+def _contar(sensor_id):
+    with SessionLocal() as db:
+        return db.execute(select(func.count()).where(SensorReading.sensor_id == sensor_id)).scalar()
+
+
+def test_journal_acepta_y_drena_lecturas(client, auth_headers, referencias):
+    previas = _contar(referencias["sensor_id"])
+    lecturas = [_lectura(referencias, 7.0 + i / 100) for i in range(20)]
+    lecturas.append(_lectura(referencias, 7.0, sensor_id=999_999))
+
+    response = client.post("/lecturas/journal", json={"lecturas": lecturas}, headers=auth_headers)
+
+    assert response.status_code == 202
+    acuse = response.json()
+    assert acuse["aceptadas"] == 21
+    assert acuse["secuencia_final"] - acuse["secuencia_inicial"] == 20
+    assert ingest_journal.vaciar()
+    assert _contar(referencias["sensor_id"]) == previas + 20
+    estado = client.get("/health").json()["journal"]
+    assert estado["retraso"] == 0
+    assert estado["rechazadas"] >= 1
+
+
+def test_journal_se_reanuda_sin_duplicar(tmp_path, client, referencias):
+    previas = _contar(referencias["sensor_id"])
+    filas = [_lectura(referencias, 7.5), _lectura(referencias, 7.6)]
+    diario = IngestJournal(tmp_path, SessionLocal, nombre="prueba-reanudacion")
+    diario.abrir()
+    diario.agregar([normalizar_lectura(fila) for fila in filas])
+    segmento = next(tmp_path.glob("lecturas-*.log"))
+    # Simula una caída a mitad de escritura.
+    with open(segmento, "ab") as archivo:
+        archivo.write(b'{"seq":3,"lectura":{"sens')
+    # Al morir el proceso se libera el directorio.
+    diario.cerrar()
+
+    reiniciado = IngestJournal(tmp_path, SessionLocal, nombre="prueba-reanudacion")
+    reiniciado.abrir()
+    assert reiniciado.drenar() == 2
+    assert _contar(referencias["sensor_id"]) == previas + 2
+    reiniciado.cerrar()
+
+    # Un segundo reinicio parte del checkpoint guardado junto con las lecturas.
+    otra_vez = IngestJournal(tmp_path, SessionLocal, nombre="prueba-reanudacion")
+    otra_vez.abrir()
+    assert otra_vez.drenar() == 0
+    assert otra_vez.agregar([normalizar_lectura(filas[0])]) == (3, 3)
+    assert otra_vez.drenar() == 1
+    assert _contar(referencias["sensor_id"]) == previas + 3
+    otra_vez.cerrar()
+
+
+def test_un_solo_proceso_es_dueno_del_directorio(tmp_path, client, referencias):
+    previas = _contar(referencias["sensor_id"])
+    filas = [normalizar_lectura(_lectura(referencias, 7.0 + i / 10)) for i in range(3)]
+    dueno = IngestJournal(tmp_path, SessionLocal, tamano_lote=3, nombre="prueba-dueno")
+    otro = IngestJournal(tmp_path, SessionLocal, tamano_lote=3, nombre="prueba-dueno")
+    dueno.abrir()
+    try:
+        with pytest.raises(DiarioOcupado):
+            otro.abrir()
+        # Como segundo worker no arranca el drenador ni acusa recibo de lecturas.
+        otro.iniciar()
+        assert otro.ocupado and otro._hilo is None
+        with pytest.raises(DiarioOcupado):
+            otro.agregar(filas)
+        assert not otro.estadisticas()["propietario"]
+
+        assert dueno.agregar(filas) == (1, 3)
+        assert dueno.drenar() == 3
+        assert _contar(referencias["sensor_id"]) == previas + 3
+    finally:
+        dueno.cerrar()
+
+    # Liberado el directorio, otro proceso continúa la secuencia.
+    otro.abrir()
+    try:
+        assert otro.agregar(filas[:1]) == (4, 4)
+        assert otro.drenar() == 1
+        assert _contar(referencias["sensor_id"]) == previas + 4
+    finally:
+        otro.cerrar()
@@ -0,0 +1,144 @@
+import json
+
+
+def _lectura(referencias, valor, **cambios):
+    datos = {**referencias, "valor": valor, "unidad": "pH"}
+    datos.update(cambios)
+    return datos
+
+
+def test_lote_de_lecturas_reporta_estado_por_fila(client, auth_headers, referencias):
+    lecturas = [_lectura(referencias, 7.0 + i / 10) for i in range(5)]
+    lecturas.append(_lectura(referencias, 7.5, sensor_id=999_999))
+
+    response = client.post("/lecturas/batch", json={"lecturas": lecturas}, headers=auth_headers)
+
+    assert response.status_code == 200
+    cuerpo = response.json()
+    assert cuerpo["aceptadas"] == 5
+    assert cuerpo["rechazadas"] == 1
+    assert all(r["aceptada"] and r["id"] for r in cuerpo["resultados"][:5])
+    assert cuerpo["resultados"][5] == {"indice": 5, "aceptada": False, "id": None, "error": "Sensor no válido"}
+
+
+def test_lote_requiere_token(client, referencias):
+    response = client.post("/lecturas/batch", json={"lecturas": [_lectura(referencias, 7.0)]})
+    assert response.status_code == 401
+
+
+def test_importar_csv_confirma_por_bloques(client, auth_headers, referencias):
+    filas = ["sensor_id,parametro_id,cuerpo_agua_id,valor,unidad,tomado_en"]
+    for i in range(250):
+        filas.append(
+            f"{referencias['sensor_id']},{referencias['parametro_id']},{referencias['cuerpo_agua_id']},"
+            f"{7 + i / 1000},pH,2024-01-01T00:{i % 60:02d}:00"
+        )
+    filas.append(f"{referencias['sensor_id']},{referencias['parametro_id']},{referencias['cuerpo_agua_id']},abc,pH,")
+    contenido = "\n".join(filas).encode()
+
+    response = client.post(
+        "/lecturas/importar?tamano_lote=100",
+        files={"archivo": ("historico.csv", contenido, "text/csv")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    eventos = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [e["evento"] for e in eventos] == ["progreso", "progreso", "resumen"]
+    assert eventos[-1]["aceptadas"] == 250
+    assert eventos[-1]["rechazos"] == [{"linea": 252, "error": "Campo numérico inválido"}]
+
+
+def test_importar_historico_no_genera_alertas_ni_eventos(client, auth_headers, referencias):
+    from broadcaster import broadcaster
+    from database import SessionLocal
+    from models import Alert
+
+    client.post(
+        "/cuerpo-parametros",
+        headers=auth_headers,
+        json={"cuerpo_agua_id": referencias["cuerpo_agua_id"], "parametro_id": referencias["parametro_id"], "umbral_alerta": 8.5},
+    )
+    contenido = (
+        "sensor_id,parametro_id,cuerpo_agua_id,valor,unidad,tomado_en\n"
+        f"{referencias['sensor_id']},{referencias['parametro_id']},{referencias['cuerpo_agua_id']},12.0,pH,2023-02-01T00:00:00\n"
+    ).encode()
+    publicados = broadcaster.estadisticas()["publicados"]
+
+    response = client.post(
+        "/lecturas/importar",
+        files={"archivo": ("historico.csv", contenido, "text/csv")},
+        headers=auth_headers,
+    )
+
+    assert response.json()["aceptadas"] == 1
+    assert broadcaster.estadisticas()["publicados"] == publicados
+    with SessionLocal() as db:
+        assert db.query(Alert).filter(Alert.cuerpo_agua_id == referencias["cuerpo_agua_id"]).count() == 0
+
+
+def test_importar_rechaza_unidad_nula_y_csv_mal_formado(client, auth_headers, referencias):
+    ids = f"{referencias['sensor_id']},{referencias['parametro_id']},{referencias['cuerpo_agua_id']}"
+    ndjson = json.dumps({**referencias, "valor": 7.0, "unidad": None}).encode()
+    eventos = [
+        json.loads(linea)
+        for linea in client.post(
+            "/lecturas/importar", files={"archivo": ("nula.ndjson", ndjson, "application/x-ndjson")}, headers=auth_headers
+        ).text.splitlines()
+    ]
+    assert eventos[-1]["rechazos"] == [{"linea": 1, "error": "Falta el campo unidad"}]
+
+    corta = f"sensor_id,parametro_id,cuerpo_agua_id,valor,unidad\n{ids},7.0\n".encode()
+    resumen = json.loads(
+        client.post("/lecturas/importar", files={"archivo": ("corta.csv", corta, "text/csv")}, headers=auth_headers)
+        .text.splitlines()[-1]
+    )
+    assert (resumen["aceptadas"], resumen["rechazos"]) == (0, [{"linea": 2, "error": "Falta el campo unidad"}])
+
+    enorme = f"sensor_id,parametro_id,cuerpo_agua_id,valor,unidad,observaciones\n{ids},7.0,pH,{'x' * 200_000}\n".encode()
+    eventos = [
+        json.loads(linea)
+        for linea in client.post(
+            "/lecturas/importar", files={"archivo": ("enorme.csv", enorme, "text/csv")}, headers=auth_headers
+        ).text.splitlines()
+    ]
+    assert [e["evento"] for e in eventos] == ["error", "resumen"]
+    assert eventos[0]["detalle"].startswith("CSV mal formado")
+
+
+def test_importar_rechaza_formato_desconocido(client, auth_headers):
+    response = client.post(
+        "/lecturas/importar",
+        files={"archivo": ("datos.xlsx", b"", "application/octet-stream")},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+
+
+def test_listar_lecturas_pagina_por_cursor(client, auth_headers, referencias):
+    lecturas = [_lectura(referencias, 8.0, tomado_en=f"2023-06-01T10:{i:02d}:00") for i in range(7)]
+    client.post("/lecturas/batch", json={"lecturas": lecturas}, headers=auth_headers)
+    filtros = {
+        "sensor_id": referencias["sensor_id"],
+        "desde": "2023-06-01T00:00:00",
+        "hasta": "2023-06-02T00:00:00",
+        "limite": 3,
+    }
+
+    vistas = []
+    cursor = None
+    while True:
+        params = dict(filtros, **({"cursor": cursor} if cursor else {}))
+        response = client.get("/lecturas", params=params)
+        assert response.status_code == 200
+        vistas.extend(l["tomado_en"] for l in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert vistas == sorted(vistas, reverse=True)
+    assert len(vistas) == 7
+
+
+def test_listar_lecturas_rechaza_cursor_invalido(client):
+    assert client.get("/lecturas", params={"cursor": "no-es-un-cursor"}).status_code == 400
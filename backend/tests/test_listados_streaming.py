@@ -0,0 +1,83 @@
+import gzip
+import json
+from typing import List
+
+
+def _pydantic(modelo, objetos) -> bytes:
+    from pydantic import TypeAdapter
+
+    adaptador = TypeAdapter(List[modelo])
+    return adaptador.dump_json(adaptador.validate_python(objetos, from_attributes=True))
+
+
+def _crear_alerta(client, auth_headers, referencias, mensaje):
+    respuesta = client.post(
+        "/alertas",
+        headers=auth_headers,
+        json={"cuerpo_agua_id": referencias["cuerpo_agua_id"], "nivel": "alta", "mensaje": mensaje},
+    )
+    assert respuesta.status_code == 201
+    return respuesta.json()
+
+
+def test_los_listados_coinciden_con_response_model(client, auth_headers, referencias):
+    import main
+    from database import ReadSessionLocal
+    from models import Alert, CuerpoDeAguaDB, Sensor
+
+    _crear_alerta(client, auth_headers, referencias, "Mensaje con acentos: oxígeno bajo")
+    with ReadSessionLocal() as db:
+        for ruta, modelo, esquema in (
+            ("/alertas", Alert, main.AlertOut),
+            ("/sensores", Sensor, main.SensorOut),
+            ("/cuerpos-agua", CuerpoDeAguaDB, main.CuerpoDeAguaOut),
+        ):
+            esperado = _pydantic(esquema, db.query(modelo).order_by(modelo.id).all())
+            respuesta = client.get(ruta)
+            assert respuesta.status_code == 200
+            assert respuesta.headers["content-type"] == "application/json"
+            assert sorted(respuesta.json(), key=lambda fila: fila["id"]) == json.loads(esperado)
+
+
+def test_lecturas_mantienen_el_cursor(client, auth_headers, referencias):
+    for valor in (7.0, 7.2, 7.4):
+        client.post("/lecturas", headers=auth_headers, json={**referencias, "valor": valor, "unidad": "pH"})
+
+    primera = client.get("/lecturas", params={"sensor_id": referencias["sensor_id"], "limite": 2})
+    assert len(primera.json()) == 2
+    assert set(primera.json()[0]) == {"id", "sensor_id", "parametro_id", "cuerpo_agua_id", "valor", "unidad", "tomado_en", "observaciones"}
+    resto = client.get(
+        "/lecturas",
+        params={"sensor_id": referencias["sensor_id"], "limite": 2, "cursor": primera.headers["X-Next-Cursor"]},
+    )
+    ids = [fila["id"] for fila in primera.json() + resto.json()]
+    assert len(ids) == len(set(ids)) >= 3
+
+
+def test_ndjson_y_gzip(client, auth_headers, referencias):
+    _crear_alerta(client, auth_headers, referencias, "Primera")
+    _crear_alerta(client, auth_headers, referencias, "Segunda")
+    arreglo = client.get("/alertas").json()
+
+    ndjson = client.get("/alertas", params={"formato": "ndjson"})
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(linea) for linea in ndjson.text.splitlines()] == arreglo
+
+    # httpx descomprime solo; se pide el cuerpo crudo para ver el gzip.
+    with client.stream("GET", "/alertas", headers={"Accept-Encoding": "gzip"}) as comprimida:
+        assert comprimida.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in comprimida.headers["vary"]
+        crudo = b"".join(comprimida.iter_raw())
+    assert json.loads(gzip.decompress(crudo)) == arreglo
+
+    sin_gzip = client.get("/alertas", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert "content-encoding" not in sin_gzip.headers
+
+
+def test_partes_lista_por_bloques():
+    from streaming import partes_lista
+
+    bloques = [[(1, "a")], [], [(2, "b"), (3, None)]]
+    assert b"".join(partes_lista(["id", "v"], bloques)) == b'[{"id":1,"v":"a"},{"id":2,"v":"b"},{"id":3,"v":null}]'
+    assert b"".join(partes_lista(["id"], [[]])) == b"[]"
+    assert b"".join(partes_lista(["id"], [[(1,)], [(2,)]], "ndjson")) == b'{"id":1}\n{"id":2}\n'
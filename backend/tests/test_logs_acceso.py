@@ -0,0 +1,26 @@
+from database import SessionLocal
+from main import access_log_writer
+from models import AccessLog
+
+
+def test_middleware_registra_solicitudes_en_lote(client, auth_headers, referencias):
+    cuerpo_id = referencias["cuerpo_agua_id"]
+    assert client.put(f"/cuerpos-agua/{cuerpo_id}", json={"ph": 7.4}, headers=auth_headers).status_code == 200
+    assert client.get("/sensores/999999").status_code == 404
+    assert access_log_writer.vaciar()
+
+    db = SessionLocal()
+    try:
+        put = (
+            db.query(AccessLog)
+            .filter(AccessLog.endpoint == f"/cuerpos-agua/{cuerpo_id}", AccessLog.metodo == "PUT")
+            .one()
+        )
+        assert put.codigo_respuesta == 200
+        assert put.cuerpo_agua_id == cuerpo_id
+        assert put.usuario_id is not None
+        assert db.query(AccessLog).filter(AccessLog.endpoint == "/sensores/999999", AccessLog.codigo_respuesta == 404).count() == 1
+    finally:
+        db.close()
+
+    assert client.get("/health").json()["logs_acceso"]["pendientes"] == 0
@@ -0,0 +1,88 @@
+import uuid
+
+from sqlalchemy import event, text
+
+from database import SessionLocal, engine
+from spatial import consultar_geojson, parsear_bbox
+
+
+def _crear_cuerpo(client, auth_headers, latitud, longitud, tipo="lago", contaminacion="Baja"):
+    respuesta = client.post(
+        "/cuerpos-agua",
+        headers=auth_headers,
+        json={
+            "nombre": f"Mapa {uuid.uuid4().hex[:8]}",
+            "tipo": tipo,
+            "latitud": latitud,
+            "longitud": longitud,
+            "contaminacion": contaminacion,
+            "biodiversidad": "Media",
+        },
+    )
+    assert respuesta.status_code == 201
+    return respuesta.json()
+
+
+def _ids(respuesta, capa):
+    return {f["properties"]["id"] for f in respuesta.json()["features"] if f["properties"]["capa"] == capa}
+
+
+def test_geojson_filtra_por_bbox_y_sigue_los_cambios(client, auth_headers):
+    dentro = _crear_cuerpo(client, auth_headers, 45.10, 5.10)
+    fuera = _crear_cuerpo(client, auth_headers, 46.50, 5.10, tipo="río", contaminacion="Alta")
+    sensor = client.post(
+        "/sensores",
+        headers=auth_headers,
+        json={"nombre": "Boya", "tipo": "pH", "cuerpo_agua_id": dentro["id"], "latitud": 45.11, "longitud": 5.12},
+    ).json()
+    bbox = {"bbox": "5.0,45.0,5.5,45.5"}
+
+    respuesta = client.get("/mapa/geojson", params=bbox)
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"].startswith("application/geo+json")
+    assert _ids(respuesta, "cuerpo") == {dentro["id"]}
+    assert _ids(respuesta, "sensor") == {sensor["id"]}
+
+    # Los triggers mantienen el índice al mover y borrar filas.
+    client.put(f"/cuerpos-agua/{fuera['id']}", headers=auth_headers, json={"latitud": 45.2})
+    assert _ids(client.get("/mapa/geojson", params=bbox), "cuerpo") == {dentro["id"], fuera["id"]}
+    assert _ids(client.get("/mapa/geojson", params={**bbox, "contaminacion": "alta"}), "cuerpo") == {fuera["id"]}
+    with SessionLocal() as db:
+        db.execute(text("DELETE FROM reportes WHERE cuerpo_agua_id = :id"), {"id": fuera["id"]})
+        db.execute(text("DELETE FROM cuerpos_agua WHERE id = :id"), {"id": fuera["id"]})
+        db.commit()
+    assert _ids(client.get("/mapa/geojson", params=bbox), "cuerpo") == {dentro["id"]}
+
+    client.post(
+        "/alertas",
+        headers=auth_headers,
+        json={"cuerpo_agua_id": dentro["id"], "nivel": "alta", "mensaje": "Prueba"},
+    )
+    con_alerta = client.get("/mapa/geojson", params={**bbox, "nivel_alerta": "alta", "capas": "cuerpos"}).json()
+    assert [f["properties"]["nivel_alerta"] for f in con_alerta["features"]] == ["alta"]
+
+
+def test_geojson_rechaza_bbox_invalido(client):
+    assert client.get("/mapa/geojson", params={"bbox": "1,2,3"}).status_code == 400
+
+
+def test_bbox_usa_el_rtree(client):
+    # Se explica la sentencia que ejecuta consultar_geojson, con sus parámetros.
+    sentencias = []
+
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        if "_rtree" in statement:
+            sentencias.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capturar)
+    try:
+        with SessionLocal() as db:
+            consultar_geojson(db, parsear_bbox("1,1,2,2"))
+    finally:
+        event.remove(engine, "before_cursor_execute", capturar)
+
+    assert len(sentencias) == 2
+    with engine.connect() as conexion:
+        for sentencia, parametros in sentencias:
+            plan = " ".join(str(fila[-1]) for fila in conexion.exec_driver_sql(f"EXPLAIN QUERY PLAN {sentencia}", parametros))
+            assert "VIRTUAL TABLE INDEX" in plan, plan
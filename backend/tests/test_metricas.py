@@ -0,0 +1,36 @@
+import re
+
+
+def _valor(texto, linea):
+    coincidencia = re.search("^" + re.escape(linea) + r" (\S+)$", texto, re.MULTILINE)
+    return float(coincidencia.group(1)) if coincidencia else 0.0
+
+
+def test_metricas_por_ruta_y_de_negocio(client, auth_headers, referencias):
+    antes = client.get("/metrics").text
+    cuerpo_id = referencias["cuerpo_agua_id"]
+    for _ in range(3):
+        assert client.get(f"/cuerpos-agua/{cuerpo_id}").status_code == 200
+    assert client.get("/cuerpos-agua/999999").status_code == 404
+    lecturas = [{**referencias, "valor": 7.0, "unidad": "pH"}] * 4
+    assert client.post("/lecturas/batch", json={"lecturas": lecturas}, headers=auth_headers).status_code == 200
+
+    respuesta = client.get("/metrics")
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"].startswith("text/plain; version=0.0.4")
+    texto = respuesta.text
+
+    ruta = 'method="GET",route="/cuerpos-agua/{cuerpo_id}"'
+    solicitudes = "observatorio_http_requests_total{%s,status=\"%s\"}"
+    assert _valor(texto, solicitudes % (ruta, 200)) - _valor(antes, solicitudes % (ruta, 200)) == 3
+    assert _valor(texto, solicitudes % (ruta, 404)) - _valor(antes, solicitudes % (ruta, 404)) == 1
+    # Las cubetas son acumulativas y +Inf coincide con _count.
+    infinito = _valor(texto, 'observatorio_http_request_duration_seconds_bucket{%s,le="+Inf"}' % ruta)
+    assert infinito == _valor(texto, "observatorio_http_request_duration_seconds_count{%s}" % ruta) >= 4
+    assert _valor(texto, 'observatorio_http_request_duration_seconds_bucket{%s,le="0.5"}' % ruta) <= infinito
+
+    assert _valor(texto, "observatorio_lecturas_ingeridas_total") - _valor(antes, "observatorio_lecturas_ingeridas_total") == 4
+    assert "observatorio_http_requests_in_flight 0" in texto
+    assert re.search(r"^observatorio_threadpool_size \d+$", texto, re.MULTILINE)
+    assert re.search(r'^observatorio_db_pool_checkouts_total\{pool="\w+"\} \d+$', texto, re.MULTILINE)
+    assert 'route="/metrics"' not in texto
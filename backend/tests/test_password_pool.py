@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+import security
+from password_pool import PasswordHashPool, PasswordPoolBusy
+
+
+def test_pool_hashea_y_rechaza_cuando_esta_lleno():
+    pool = PasswordHashPool(trabajadores=1, max_pendientes=1)
+
+    async def escenario():
+        primero = asyncio.ensure_future(pool.hashear("clave-segura-123"))
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordPoolBusy):
+            await pool.hashear("otra-clave-456")
+        return await primero
+
+    try:
+        hashed = asyncio.run(escenario())
+        assert security.verify_password("clave-segura-123", hashed)
+        assert asyncio.run(pool.verificar("clave-segura-123", hashed)) is True
+        stats = pool.estadisticas()
+        assert (stats["completados"], stats["rechazados"], stats["en_curso"]) == (2, 1, 0)
+        assert stats["latencia"]["max_ms"] > 0
+    finally:
+        pool.cerrar()
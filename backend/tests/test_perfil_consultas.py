@@ -0,0 +1,63 @@
+import logging
+
+
+def _campos(cabecera):
+    return dict(parte.split("=", 1) for parte in cabecera.split("; "))
+
+
+def test_cabecera_y_log_por_solicitud(client, referencias, caplog):
+    with caplog.at_level(logging.INFO, logger="perfil_sql"):
+        respuesta = client.get("/sensores")
+    assert respuesta.status_code == 200
+    campos = _campos(respuesta.headers["X-SQL-Perfil"])
+    assert int(campos["consultas"]) >= 1
+    assert int(campos["filas"]) >= len(respuesta.json())
+    assert campos["n_mas_1"] == "0"
+    assert any('"ruta": "/sensores"' in registro.getMessage() for registro in caplog.records)
+
+
+def test_detecta_n_mas_1_y_consultas_lentas(monkeypatch, caplog):
+    import profiling
+    from database import SessionLocal
+    from models import Sensor
+
+    monkeypatch.setattr(profiling, "UMBRAL_LENTA_MS", 0)
+    perfil = profiling.PerfilSQL()
+    token = profiling._perfil_actual.set(perfil)
+    try:
+        with caplog.at_level(logging.WARNING, logger="perfil_sql"), SessionLocal() as db:
+            for sensor_id in range(1, 7):
+                db.get(Sensor, sensor_id)
+    finally:
+        profiling._perfil_actual.reset(token)
+
+    assert perfil.consultas == 6
+    assert perfil.lentas == 6
+    ((sentencia, veces),) = perfil.repetidas()
+    assert veces == 6 and "FROM sensores" in sentencia
+    # Se registra el tipo de cada parámetro, no su valor.
+    assert "parámetros: (int)" in caplog.text
+
+
+def test_sentencia_fallida_no_deja_estado_en_la_conexion():
+    import pytest
+    from sqlalchemy import text
+    from sqlalchemy.exc import IntegrityError
+
+    import profiling
+    from database import engine
+
+    perfil = profiling.PerfilSQL()
+    token = profiling._perfil_actual.set(perfil)
+    try:
+        with engine.connect() as conexion:
+            conexion.execute(text("CREATE TEMP TABLE perfil_unico (id INTEGER PRIMARY KEY)"))
+            conexion.execute(text("INSERT INTO perfil_unico VALUES (1)"))
+            with pytest.raises(IntegrityError):
+                conexion.execute(text("INSERT INTO perfil_unico VALUES (1)"))
+            conexion.rollback()
+            assert conexion.execute(text("SELECT 1")).scalar() == 1
+            assert not any(clave.startswith("perfil_sql") for clave in conexion.info)
+    finally:
+        profiling._perfil_actual.reset(token)
+    assert perfil.consultas == 3
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# El perfil se elige al importar database, así que se prueba en otro proceso.
+SCRIPT = textwrap.dedent(
+    """
+    import asyncio
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+
+    import database
+    from main import app
+
+    with TestClient(app) as client:
+        salud = client.get("/health").json()
+        assert salud["pool_db"]["perfil"] == "produccion", salud
+        assert salud["pool_db"]["pools"]["escritura"]["size"] == 1
+        respuesta = client.post(
+            "/auth/register",
+            json={"email": "perfil@example.com", "password": "clave-segura-123", "full_name": "P", "role": "analista"},
+        )
+        assert respuesta.status_code == 201, respuesta.text
+        assert client.get("/cuerpos-agua").status_code == 200
+
+        # La importación abre su propia sesión de escritura mientras transmite; la del
+        # request (usada por get_current_user sin caché) no debe retener el único escritor.
+        login = client.post("/auth/login", data={"username": "perfil@example.com", "password": "clave-segura-123"})
+        cabeceras = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        csv = "sensor_id,parametro_id,cuerpo_agua_id,valor,unidad\\n999,999,999,7.0,pH\\n"
+        importacion = client.post(
+            "/lecturas/importar", headers=cabeceras, files={"archivo": ("lecturas.csv", csv, "text/csv")}
+        )
+        assert importacion.status_code == 200, importacion.text
+        assert '"resumen"' in importacion.text, importacion.text
+
+    with database.engine.connect() as conexion:
+        assert conexion.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conexion.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+    with database.ReadSessionLocal() as db:
+        assert db.execute(text("SELECT count(*) FROM users")).scalar() >= 1
+        try:
+            db.execute(text("DELETE FROM users"))
+        except OperationalError:
+            pass
+        else:
+            raise AssertionError("el pool de lectura aceptó una escritura")
+
+    async def leer_async():
+        async with database.AsyncReadSessionLocal() as db:
+            return (await db.execute(text("SELECT count(*) FROM users"))).scalar()
+
+    assert asyncio.run(leer_async()) >= 1
+    print("ok")
+    """
+)
+
+
+def test_perfil_produccion_separa_lectura_y_escritura(tmp_path):
+    entorno = dict(
+        os.environ,
+        DB_PROFILE="produccion",
+        DATABASE_URL=f"sqlite:///{tmp_path / 'prod.db'}",
+        JOURNAL_DIR=str(tmp_path / "journal"),
+        SQLITE_POOL_TIMEOUT="3",
+    )
+    resultado = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=BACKEND_DIR, env=entorno, capture_output=True, text=True, timeout=120
+    )
+    assert resultado.returncode == 0, resultado.stderr
+    assert "ok" in resultado.stdout
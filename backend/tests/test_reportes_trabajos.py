@@ -0,0 +1,104 @@
+import csv
+import io
+
+from database import SessionLocal
+from models import Report
+from reports import report_engine
+
+
+def _lecturas(referencias):
+    valores = [
+        ("2023-05-01T08:00:00", 7.0),
+        ("2023-05-01T12:00:00", 8.0),
+        ("2023-05-01T23:59:00", 9.5),
+        ("2023-05-02T00:00:00", 5.0),
+        ("2023-05-03T10:00:00", 7.5),
+        ("2023-06-01T10:00:00", 1.0),
+    ]
+    return [{**referencias, "valor": v, "unidad": "pH", "tomado_en": t} for t, v in valores]
+
+
+def test_trabajo_de_reporte_csv_y_json(client, auth_headers, referencias):
+    respuesta = client.post("/lecturas/batch", json={"lecturas": _lecturas(referencias)}, headers=auth_headers)
+    assert respuesta.status_code == 200
+
+    pedido = {
+        "cuerpo_agua_id": referencias["cuerpo_agua_id"],
+        "desde": "2023-05-01T00:00:00",
+        "hasta": "2023-05-31T00:00:00",
+        "parametros": [referencias["parametro_id"]],
+    }
+    # Bloques pequeños para recorrer varias páginas por clave.
+    tamano_bloque, report_engine.tamano_bloque = report_engine.tamano_bloque, 2
+    try:
+        respuesta = client.post("/reportes/trabajos", json=pedido, headers=auth_headers)
+        assert respuesta.status_code == 202
+        trabajo = respuesta.json()
+        assert report_engine.esperar(trabajo["id"])
+    finally:
+        report_engine.tamano_bloque = tamano_bloque
+
+    estado = client.get(f"/reportes/trabajos/{trabajo['id']}", headers=auth_headers).json()
+    assert estado["estado"] == "completado", estado["error"]
+    assert estado["procesadas"] == 5
+    assert estado["descarga"] == f"/reportes/trabajos/{trabajo['id']}/descarga"
+
+    descarga = client.get(estado["descarga"], headers=auth_headers)
+    assert descarga.status_code == 200
+    assert descarga.headers["content-type"].startswith("text/csv")
+    filas = list(csv.DictReader(io.StringIO(descarga.text)))
+    series = [(f["inicio"], f["conteo"], f["minimo"], f["maximo"]) for f in filas if f["seccion"] == "series"]
+    assert series == [
+        ("2023-05-01 00:00:00", "3", "7.0", "9.5"),
+        ("2023-05-02 00:00:00", "1", "5.0", "5.0"),
+        ("2023-05-03 00:00:00", "1", "7.5", "7.5"),
+    ]
+    (resumen,) = [f for f in filas if f["seccion"] == "resumen"]
+    assert (resumen["conteo"], resumen["fuera_de_rango"]) == ("5", "2")
+
+    with SessionLocal() as db:
+        reporte = db.get(Report, estado["reporte_id"])
+        assert reporte.formato == "csv"
+        assert "Lecturas: 5." in reporte.contenido
+
+    respuesta = client.post("/reportes/trabajos", json={**pedido, "formato": "json", "intervalo": "hora"}, headers=auth_headers)
+    trabajo = respuesta.json()
+    assert report_engine.esperar(trabajo["id"])
+    documento = client.get(f"/reportes/trabajos/{trabajo['id']}/descarga", headers=auth_headers).json()
+    assert documento["cuerpo_agua"]["id"] == referencias["cuerpo_agua_id"]
+    assert len(documento["series"]) == 5
+    assert documento["resumen"]["lecturas"] == 5
+
+
+def test_trabajo_de_reporte_valida_y_restringe_acceso(client, auth_headers, referencias):
+    pedido = {"cuerpo_agua_id": 999999}
+    assert client.post("/reportes/trabajos", json=pedido, headers=auth_headers).status_code == 404
+    pedido = {"cuerpo_agua_id": referencias["cuerpo_agua_id"], "desde": "2023-02-01T00:00:00", "hasta": "2023-01-01T00:00:00"}
+    assert client.post("/reportes/trabajos", json=pedido, headers=auth_headers).status_code == 400
+    assert client.get("/reportes/trabajos/no-existe", headers=auth_headers).status_code == 404
+    assert client.get("/reportes/trabajos/no-existe").status_code == 401
+
+
+def test_cerrar_cancela_los_trabajos_en_cola(tmp_path):
+    import threading
+
+    from reports import ReportEngine, ReporteCancelado
+
+    generados = []
+    empezado = threading.Event()
+
+    class MotorLento(ReportEngine):
+        def generar(self, trabajo):
+            generados.append(trabajo.id)
+            empezado.set()
+            self._detener.wait(5)
+            raise ReporteCancelado()
+
+    motor = MotorLento(tmp_path, trabajadores=1)
+    en_curso = motor.enviar(1)
+    en_cola = motor.enviar(1)
+    assert empezado.wait(5)
+    motor.cerrar()
+
+    assert generados == [en_curso.id]
+    assert (en_curso.estado, en_cola.estado) == ("cancelado", "cancelado")
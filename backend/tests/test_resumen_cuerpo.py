@@ -0,0 +1,66 @@
+def _consultas(respuesta):
+    campos = dict(parte.split("=", 1) for parte in respuesta.headers["X-SQL-Perfil"].split("; "))
+    return int(campos["consultas"])
+
+
+def test_resumen_con_consultas_fijas_y_cache(client, auth_headers, referencias):
+    cuerpo_id = referencias["cuerpo_agua_id"]
+    for valor in (7.1, 7.3):
+        client.post("/lecturas", headers=auth_headers, json={**referencias, "valor": valor, "unidad": "pH"})
+    client.post(
+        "/cuerpo-parametros",
+        headers=auth_headers,
+        json={"cuerpo_agua_id": cuerpo_id, "parametro_id": referencias["parametro_id"], "umbral_alerta": 8.5},
+    )
+
+    primera = client.get(f"/cuerpos-agua/{cuerpo_id}/resumen")
+    assert primera.status_code == 200
+    resumen = primera.json()
+    assert resumen["id"] == cuerpo_id
+    assert [sensor["id"] for sensor in resumen["sensores"]] == [referencias["sensor_id"]]
+    (ultima,) = resumen["ultimas_lecturas"]
+    assert (ultima["parametro_id"], ultima["valor"]) == (referencias["parametro_id"], 7.3)
+    assert resumen["parametros_configurados"][0]["umbral_alerta"] == 8.5
+    consultas = _consultas(primera)
+    assert consultas <= 6
+
+    # Más sensores no agregan consultas.
+    for indice in range(3):
+        client.post(
+            "/sensores",
+            headers=auth_headers,
+            json={"nombre": f"Sonda extra {indice}", "tipo": "pH", "cuerpo_agua_id": cuerpo_id},
+        )
+    segunda = client.get(f"/cuerpos-agua/{cuerpo_id}/resumen")
+    assert len(segunda.json()["sensores"]) == 4
+    assert _consultas(segunda) == consultas
+
+    # En caché solo se consultan las últimas lecturas, que siguen al día.
+    cacheada = client.get(f"/cuerpos-agua/{cuerpo_id}/resumen")
+    assert _consultas(cacheada) == 1
+    assert client.get(f"/cuerpos-agua/{cuerpo_id}/resumen", headers={"If-None-Match": cacheada.headers["ETag"]}).status_code == 304
+    client.post("/lecturas", headers=auth_headers, json={**referencias, "valor": 6.9, "unidad": "pH"})
+    con_lectura = client.get(f"/cuerpos-agua/{cuerpo_id}/resumen", headers={"If-None-Match": cacheada.headers["ETag"]})
+    assert con_lectura.status_code == 200 and _consultas(con_lectura) == 1
+    assert con_lectura.json()["ultimas_lecturas"][0]["valor"] == 6.9
+
+    # Una alerta nueva invalida el resumen; las resueltas no aparecen.
+    from database import SessionLocal
+    from models import Alert
+
+    alerta = client.post(
+        "/alertas",
+        headers=auth_headers,
+        json={"cuerpo_agua_id": cuerpo_id, "nivel": "alta", "mensaje": "Turbidez"},
+    ).json()
+    with SessionLocal() as db:
+        resuelta = Alert(cuerpo_agua_id=cuerpo_id, nivel="media", mensaje="Resuelta", resuelta=True)
+        db.add(resuelta)
+        db.commit()
+        resuelta_id = resuelta.id
+    abiertas = {abierta["id"] for abierta in client.get(f"/cuerpos-agua/{cuerpo_id}/resumen").json()["alertas_abiertas"]}
+    assert alerta["id"] in abiertas and resuelta_id not in abiertas
+
+
+def test_resumen_de_cuerpo_inexistente(client):
+    assert client.get("/cuerpos-agua/999999/resumen").status_code == 404
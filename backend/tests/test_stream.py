@@ -0,0 +1,82 @@
+import asyncio
+
+from broadcaster import Broadcaster, broadcaster
+from database import SessionLocal
+from ingest import registrar_lecturas, normalizar_lectura
+
+
+def test_lecturas_se_difunden_al_confirmar(client, auth_headers, referencias):
+    async def escenario():
+        propia = broadcaster.suscribir(tipos=["lectura"], cuerpos=[referencias["cuerpo_agua_id"]])
+        ajena = broadcaster.suscribir(cuerpos=[-1])
+        try:
+            def ingerir():
+                fila = {**referencias, "valor": 7.1, "unidad": "pH"}
+                with SessionLocal() as db:
+                    registrar_lecturas(db, [normalizar_lectura(dict(fila))])
+                    db.rollback()
+                respuesta = client.post("/lecturas/batch", json={"lecturas": [fila, fila]}, headers=auth_headers)
+                assert respuesta.status_code == 200
+
+            await asyncio.get_running_loop().run_in_executor(None, ingerir)
+            assert await propia.esperar(2)
+            eventos = broadcaster.tomar(propia)
+            assert not await ajena.esperar(0.05)
+            return eventos
+        finally:
+            broadcaster.cancelar(propia)
+            broadcaster.cancelar(ajena)
+
+    eventos = asyncio.run(escenario())
+    # La lectura revertida no se publica.
+    assert len(eventos) == 2
+    assert all(e.tipo == "lectura" for e in eventos)
+    assert b"event: lectura\n" in eventos[0].sse and b'"valor":7.1' in eventos[0].sse
+
+
+def test_cliente_lento_se_descarta_y_recupera_con_last_event_id():
+    difusor = Broadcaster(tamano_bufer=3, historial=100)
+
+    async def escenario():
+        lento = difusor.suscribir(tipos=["alerta"], niveles=["alta"])
+        difusor.publicar("alerta", [{"cuerpo_agua_id": 1, "nivel": "alta", "id": 1}])
+        difusor.publicar("alerta", [{"cuerpo_agua_id": 1, "nivel": "media", "id": 2}])
+        assert [e.secuencia for e in difusor.tomar(lento)] == [1]
+        difusor.publicar("alerta", [{"cuerpo_agua_id": 1, "nivel": "alta", "id": i} for i in range(3, 7)])
+        assert lento.descartada and difusor.tomar(lento) == []
+        difusor.cancelar(lento)
+
+        reconectado = difusor.suscribir(ultimo_id=1, tipos=["alerta"], niveles=["alta"])
+        return [e.secuencia for e in difusor.tomar(reconectado)]
+
+    assert asyncio.run(escenario()) == [4, 5, 6]
+    assert difusor.estadisticas()["descartadas_por_lentitud"] == 1
+
+
+def test_publicar_filtra_sin_retener_el_lock():
+    import threading
+
+    difusor = Broadcaster()
+
+    async def escenario():
+        lenta = difusor.suscribir()
+        varios = difusor.suscribir(cuerpos=[2, 1])
+        filtrando, seguir = threading.Event(), threading.Event()
+
+        def coincide(evento):
+            filtrando.set()
+            return seguir.wait(5)
+
+        lenta.coincide = coincide
+        hilo = threading.Thread(
+            target=difusor.publicar, args=("lectura", [{"cuerpo_agua_id": 1}, {"cuerpo_agua_id": 2}, {"cuerpo_agua_id": 1}])
+        )
+        hilo.start()
+        assert filtrando.wait(5)
+        # Con el filtrado en curso, el event loop sigue tomando eventos sin esperar.
+        assert difusor.tomar(varios) == []
+        seguir.set()
+        hilo.join(5)
+        return [e.secuencia for e in difusor.tomar(varios)]
+
+    assert asyncio.run(escenario()) == [1, 2, 3]
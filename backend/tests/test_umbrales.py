@@ -0,0 +1,77 @@
+import uuid
+
+
+def _alertas_de(client, referencias):
+    return [
+        a
+        for a in client.get("/alertas").json()
+        if a["cuerpo_agua_id"] == referencias["cuerpo_agua_id"] and a["parametro_id"] == referencias["parametro_id"]
+    ]
+
+
+def test_lecturas_sobre_umbral_crean_y_escalan_una_alerta(client, auth_headers, referencias):
+    configuracion = {
+        "cuerpo_agua_id": referencias["cuerpo_agua_id"],
+        "parametro_id": referencias["parametro_id"],
+        "umbral_alerta": 8.5,
+    }
+    assert client.post("/cuerpo-parametros", json=configuracion, headers=auth_headers).status_code == 201
+
+    dentro = {**referencias, "valor": 7.0, "unidad": "pH"}
+    assert client.post("/lecturas", json=dentro, headers=auth_headers).status_code == 201
+    assert _alertas_de(client, referencias) == []
+
+    lote = [{**referencias, "valor": v, "unidad": "pH"} for v in (8.6, 8.9, 7.1)]
+    assert client.post("/lecturas/batch", json={"lecturas": lote}, headers=auth_headers).status_code == 200
+    alertas = _alertas_de(client, referencias)
+    assert [(a["nivel"], a["resuelta"]) for a in alertas] == [("alta", False)]
+
+    assert client.post("/lecturas", json={**dentro, "valor": 9.0}, headers=auth_headers).status_code == 201
+    alertas = _alertas_de(client, referencias)
+    assert len(alertas) == 1
+    assert alertas[0]["nivel"] == "critica"
+
+
+def test_alerta_manual_valida_el_nivel_y_nunca_baja_de_severidad(client, auth_headers, referencias):
+    from database import SessionLocal
+    from models import Alert
+
+    parametro = client.post(
+        "/parametros",
+        headers=auth_headers,
+        json={"nombre": f"Nitratos {uuid.uuid4().hex[:8]}", "unidad": "mg/L", "valor_maximo": 10.0},
+    ).json()
+    serie = {**referencias, "parametro_id": parametro["id"]}
+    manual = {"cuerpo_agua_id": serie["cuerpo_agua_id"], "parametro_id": parametro["id"], "mensaje": "Manual"}
+    for nivel in ("alto", "critical"):
+        assert client.post("/alertas", json={**manual, "nivel": nivel}, headers=auth_headers).status_code == 400
+    creada = client.post("/alertas", json={**manual, "nivel": " Crítica"}, headers=auth_headers)
+    assert creada.status_code == 201 and creada.json()["nivel"] == "critica"
+
+    # Una fila con un nivel libre anterior a la validación cuenta como el más grave.
+    with SessionLocal() as db:
+        db.query(Alert).filter(Alert.id == creada.json()["id"]).update({"nivel": "alto"})
+        db.commit()
+    for _ in range(2):
+        respuesta = client.post("/lecturas", json={**serie, "valor": 12.0, "unidad": "mg/L"}, headers=auth_headers)
+        assert respuesta.status_code == 201
+    assert [a["nivel"] for a in _alertas_de(client, serie)] == ["alto"]
+
+
+def test_al_confirmar_no_espera_el_lock():
+    import threading
+
+    from database import CambiosConfirmados
+    from thresholds import MotorUmbrales
+
+    motor = MotorUmbrales()
+    motor._abiertas = {}
+    cambios = CambiosConfirmados()
+    cambios.actualizados["alertas"].add(1)
+    hecho = threading.Event()
+    with motor._lock:
+        hilo = threading.Thread(target=lambda: (motor._al_confirmar(cambios), hecho.set()))
+        hilo.start()
+        assert hecho.wait(2)
+    motor._aplicar_cambios()
+    assert motor._abiertas is None
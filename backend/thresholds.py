@@ -0,0 +1,215 @@
+"""
+Motor de umbrales (RF-12, RN-06).
+
+Mantiene en memoria los umbrales de ``cuerpo_parametros``, los rangos de
+``parametros_ambientales`` y las alertas abiertas por (cuerpo de agua,
+parámetro), de modo que evaluar una lectura o un lote no agrega consultas.
+Los índices se invalidan cuando se confirman cambios en esas tablas.
+"""
+
+import threading
+import unicodedata
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from database import CambiosConfirmados, record_changes, register_change_listener
+from models import Alert, EnvironmentalParameter, WaterBodyParameter
+
+NIVELES = ("media", "alta", "critica")
+_RANGO = {nivel: posicion for posicion, nivel in enumerate(NIVELES)}
+
+Clave = Tuple[int, int]
+
+
+def normalizar_nivel(nivel: str) -> Optional[str]:
+    """``" Crítica"`` -> ``"critica"``; None si no es uno de ``NIVELES``."""
+    descompuesto = unicodedata.normalize("NFKD", nivel.strip().lower())
+    plano = "".join(caracter for caracter in descompuesto if not unicodedata.combining(caracter))
+    return plano if plano in _RANGO else None
+
+
+class MotorUmbrales:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._umbrales: Optional[Dict[Clave, float]] = None
+        self._rangos: Optional[Dict[int, Tuple[Optional[float], Optional[float]]]] = None
+        # (cuerpo_agua_id, parametro_id) -> (alerta_id, nivel)
+        self._abiertas: Optional[Dict[Clave, Tuple[int, str]]] = None
+        # (umbrales, alertas insertadas, otras alertas) por aplicar en la próxima evaluación.
+        # Se anotan sin el lock: evaluar lo retiene durante consultas, y las confirmaciones
+        # y reversiones de sesiones async llegan desde el event loop.
+        self._cambios: Deque[Tuple[bool, Set[int], bool]] = deque()
+
+    def invalidar(self, umbrales: bool = True, alertas: bool = True):
+        self._cambios.append((umbrales, set(), alertas))
+
+    def _aplicar_cambios(self):
+        while self._cambios:
+            umbrales, insertadas, alertas = self._cambios.popleft()
+            if umbrales:
+                self._umbrales = None
+                self._rangos = None
+            if insertadas and self._abiertas is not None:
+                # Las alertas creadas por el propio motor ya están en el índice.
+                conocidas = {alerta_id for alerta_id, _ in self._abiertas.values()}
+                alertas = alertas or bool(insertadas - conocidas)
+            if alertas:
+                self._abiertas = None
+
+    def _cargar(self, db: Session):
+        if self._umbrales is None or self._rangos is None:
+            umbrales = {}
+            for cuerpo_id, parametro_id, umbral in db.execute(
+                select(WaterBodyParameter.cuerpo_agua_id, WaterBodyParameter.parametro_id, WaterBodyParameter.umbral_alerta)
+                .where(WaterBodyParameter.umbral_alerta.is_not(None))
+                .order_by(WaterBodyParameter.id)
+            ):
+                umbrales[(cuerpo_id, parametro_id)] = umbral
+            rangos = {
+                parametro_id: (minimo, maximo)
+                for parametro_id, minimo, maximo in db.execute(
+                    select(EnvironmentalParameter.id, EnvironmentalParameter.valor_minimo, EnvironmentalParameter.valor_maximo)
+                )
+            }
+            self._umbrales, self._rangos = umbrales, rangos
+
+        if self._abiertas is None:
+            abiertas = {}
+            for alerta_id, cuerpo_id, parametro_id, nivel in db.execute(
+                select(Alert.id, Alert.cuerpo_agua_id, Alert.parametro_id, Alert.nivel)
+                .where(Alert.resuelta.is_(False), Alert.parametro_id.is_not(None))
+                .order_by(Alert.id)
+            ):
+                abiertas[(cuerpo_id, parametro_id)] = (alerta_id, nivel)
+            self._abiertas = abiertas
+
+    def _severidad(self, fila: Dict) -> Optional[Tuple[str, str]]:
+        valor = fila["valor"]
+        umbral = self._umbrales.get((fila["cuerpo_agua_id"], fila["parametro_id"]))
+        if umbral is not None and valor > umbral:
+            return "alta", f"Lectura {valor} supera el umbral de alerta {umbral}"
+        minimo, maximo = self._rangos.get(fila["parametro_id"], (None, None))
+        if (minimo is not None and valor < minimo) or (maximo is not None and valor > maximo):
+            return "media", f"Lectura {valor} fuera del rango permitido [{minimo}, {maximo}]"
+        return None
+
+    def evaluar(self, db: Session, filas: List[Dict], ids: List[int]) -> List[Dict]:
+        """Evalúa lecturas recién insertadas y crea o escala sus alertas.
+
+        Agrupa el lote por (cuerpo, parámetro) y conserva la lectura más grave,
+        de modo que un lote genera a lo sumo una alerta por serie. Devuelve las
+        alertas creadas o escaladas; no confirma la transacción.
+        """
+        with self._lock:
+            self._aplicar_cambios()
+            self._cargar(db)
+            peores: Dict[Clave, Tuple[str, str, int]] = {}
+            for fila, lectura_id in zip(filas, ids):
+                resultado = self._severidad(fila)
+                if resultado is None:
+                    continue
+                clave = (fila["cuerpo_agua_id"], fila["parametro_id"])
+                previo = peores.get(clave)
+                if previo is None or _RANGO[resultado[0]] >= _RANGO[previo[0]]:
+                    peores[clave] = (resultado[0], resultado[1], lectura_id)
+            if not peores:
+                return []
+
+            nuevas, escaladas = [], []
+            for clave, (nivel, mensaje, lectura_id) in peores.items():
+                abierta = self._abiertas.get(clave)
+                if abierta is None:
+                    nuevas.append((clave, nivel, mensaje, lectura_id))
+                    continue
+                alerta_id, nivel_actual = abierta
+                # Un nivel fuera de NIVELES (filas anteriores a la validación de POST /alertas)
+                # cuenta como el más grave: la escalada automática nunca baja la severidad.
+                rango_actual = _RANGO.get(nivel_actual, len(NIVELES))
+                if _RANGO[nivel] > rango_actual:
+                    escaladas.append((clave, alerta_id, nivel, mensaje, lectura_id))
+                elif _RANGO[nivel] == rango_actual and nivel_actual != NIVELES[-1]:
+                    # RF-12: una alerta sin resolver que se repite sube de nivel.
+                    siguiente = NIVELES[rango_actual + 1]
+                    escaladas.append((clave, alerta_id, siguiente, f"Escalada: {mensaje}", lectura_id))
+
+            ahora = datetime.utcnow()
+            eventos = []
+            if nuevas:
+                ids_alertas = db.execute(
+                    insert(Alert).returning(Alert.id, sort_by_parameter_order=True),
+                    [
+                        {
+                            "cuerpo_agua_id": cuerpo_id,
+                            "parametro_id": parametro_id,
+                            "lectura_id": lectura_id,
+                            "nivel": nivel,
+                            "mensaje": mensaje,
+                            "creada_en": ahora,
+                            "resuelta": False,
+                        }
+                        for (cuerpo_id, parametro_id), nivel, mensaje, lectura_id in nuevas
+                    ],
+                ).scalars().all()
+                for alerta_id, (clave, nivel, mensaje, lectura_id) in zip(ids_alertas, nuevas):
+                    self._abiertas[clave] = (alerta_id, nivel)
+                    eventos.append(_evento(alerta_id, clave, nivel, mensaje, lectura_id, ahora, escalada=False))
+                record_changes(db, Alert.__tablename__, insertados=ids_alertas)
+
+            if escaladas:
+                db.execute(
+                    update(Alert),
+                    [{"id": alerta_id, "nivel": nivel, "mensaje": mensaje} for _, alerta_id, nivel, mensaje, _ in escaladas],
+                )
+                for clave, alerta_id, nivel, mensaje, lectura_id in escaladas:
+                    self._abiertas[clave] = (alerta_id, nivel)
+                    eventos.append(_evento(alerta_id, clave, nivel, mensaje, lectura_id, ahora, escalada=True))
+                # Para que las cachés que muestran el nivel (mapa, resumen) se enteren. Este índice se
+                # recarga en la próxima evaluación; las escaladas son pocas por alerta abierta.
+                record_changes(db, Alert.__tablename__, actualizados=[alerta_id for _, alerta_id, *_ in escaladas])
+
+            db.info["motor_umbrales_modificado"] = True
+            return eventos
+
+    def _al_confirmar(self, cambios: CambiosConfirmados):
+        tablas = cambios.tablas()
+        umbrales = bool(tablas & {WaterBodyParameter.__tablename__, EnvironmentalParameter.__tablename__})
+        insertadas: Set[int] = set()
+        alertas = False
+        if Alert.__tablename__ in tablas:
+            insertadas = set(cambios.insertados.get(Alert.__tablename__, ()))
+            alertas = bool(cambios.actualizados.get(Alert.__tablename__) or cambios.eliminados.get(Alert.__tablename__))
+        if umbrales or insertadas or alertas:
+            self._cambios.append((umbrales, insertadas, alertas))
+
+
+def _evento(alerta_id, clave, nivel, mensaje, lectura_id, creada_en, escalada: bool) -> Dict:
+    return {
+        "id": alerta_id,
+        "cuerpo_agua_id": clave[0],
+        "parametro_id": clave[1],
+        "lectura_id": lectura_id,
+        "nivel": nivel,
+        "mensaje": mensaje,
+        "creada_en": creada_en,
+        "escalada": escalada,
+    }
+
+
+motor_umbrales = MotorUmbrales()
+register_change_listener(motor_umbrales._al_confirmar)
+
+
+@event.listens_for(Session, "after_commit")
+def _limpiar_marca(session):
+    session.info.pop("motor_umbrales_modificado", None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_alertas_no_confirmadas(session):
+    # El índice de alertas abiertas ya refleja cambios que no llegaron a la BD.
+    if session.info.pop("motor_umbrales_modificado", None):
+        motor_umbrales.invalidar(umbrales=False)